@@ -1,9 +1,856 @@
+import bisect
+import hashlib
+import heapq
 import json
+import math
 import os
 import random
 import re
 import shutil
+import tempfile
+import threading
 import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+
+
+VIP_PATTERN = re.compile(r"(vip|urgent)", re.IGNORECASE)
+PRIORITY_MARKER_PATTERN = re.compile(r"_PRIO([0-9])$")
+PRIORITY_CLASSES = 4
+DEFAULT_PRIORITY_CLASS = 2
+SCHEDULER_STATE_VERSION = 1
+IMAGE_EXTS = {".png", ".jpg", ".jpeg"}
+# Video jobs stage source images and collect .mp4 takes, so they need more headroom.
+RESOURCE_LIMITS = {
+    "img": {"disk_free_mb": 1024, "mem_available_mb": 512, "swap_io_mb_s": 5.0},
+    "vid": {"disk_free_mb": 8192, "mem_available_mb": 1024, "swap_io_mb_s": 2.0},
+}
+RESOURCE_FLOORS = ("disk_free_mb", "mem_available_mb")
+
+
+def write_json_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def add_counts(target, source, sign=1):
+    for key, value in (source or {}).items():
+        if isinstance(value, dict):
+            add_counts(target.setdefault(key, {}), value, sign)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] = target.get(key, 0) + sign * value
+    return target
+
+
+class WeightClassifier:
+    def __init__(self, weights_cfg, memo_limit=100000, fallbacks=None):
+        self.default_weight = int(weights_cfg.get("default", 1))
+        self.keys = [k for k in weights_cfg.keys() if k != "default"]
+        self.weights = [
+            int(weights_cfg.get(k, self.default_weight)) for k in self.keys
+        ]
+        fallbacks = fallbacks or {}
+        self.ranks = [
+            (k not in fallbacks, fallbacks.get(k, 0), w)
+            for k, w in zip(self.keys, self.weights)
+        ]
+        self.weight_by_key = dict(zip(self.keys, self.weights))
+        self.memo_limit = memo_limit
+        self.memo = {}
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self._build()
+
+    def _build(self):
+        for idx, key in enumerate(self.keys):
+            pattern = str(key).lower()
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][ch] = nxt
+                state = nxt
+            self.out[state].append(idx)
+
+        pending = list(self.goto[0].values())
+        while pending:
+            next_pending = []
+            for state in pending:
+                for ch, nxt in self.goto[state].items():
+                    fallback = self.fail[state]
+                    while fallback and ch not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    target = self.goto[fallback].get(ch, 0)
+                    self.fail[nxt] = target if target != nxt else 0
+                    self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                    next_pending.append(nxt)
+            pending = next_pending
+
+    def _match(self, lower_name):
+        best = None
+        state = 0
+        for ch in lower_name:
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for idx in self.out[state]:
+                if (
+                    best is None
+                    or self.ranks[idx] > self.ranks[best]
+                    or (self.ranks[idx] == self.ranks[best] and idx < best)
+                ):
+                    best = idx
+        return best
+
+    def classify(self, name):
+        key = self.memo.get(name)
+        if key is not None:
+            return key
+        best = self._match(name.lower())
+        key = self.keys[best] if best is not None else "default"
+        if len(self.memo) >= self.memo_limit:
+            self.memo.clear()
+        self.memo[name] = key
+        return key
+
+    def weight_of(self, key):
+        return self.weight_by_key.get(key, self.default_weight)
+
+
+class WeightTree:
+    def __init__(self, weights_cfg):
+        self.default_weight = self._weight(weights_cfg.get("default", 1), 1)
+        self.flat = {}
+        self.paths = {}
+        self.prefixes = {}
+        self.children = {(): []}
+        self.weights = {}
+        self.groups = set()
+        self.fallbacks = {}
+        self.nested = False
+        self._add_level((), weights_cfg)
+        self._add_leaf((), "default", self.default_weight)
+
+    def _weight(self, value, fallback):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return fallback
+
+    def _add_level(self, path, level_cfg):
+        for key, value in level_cfg.items():
+            if key == "default":
+                continue
+            if not isinstance(value, dict):
+                self._add_leaf(path, key, value)
+                continue
+            group = path + (key,)
+            if group in self.groups or key in self.paths:
+                continue
+            self.nested = True
+            self.groups.add(group)
+            self.children[group] = []
+            self.children[path].append(key)
+            self.weights[group] = self._weight(value.get("weight", 1), 1)
+            children = value.get("children")
+            if not isinstance(children, dict):
+                children = {}
+            self._add_level(group, children)
+            if key not in self.paths:
+                self.fallbacks[key] = len(group)
+            self._add_leaf(group, key, children.get("default", 1))
+
+    def _add_leaf(self, path, key, value):
+        if key in self.paths:
+            return
+        weight = self._weight(value, self.default_weight)
+        self.flat[key] = weight
+        self.paths[key] = path
+        self.prefixes[key] = [(path + (key,))[:depth] for depth in range(len(path) + 2)]
+        self.children[path].append(key)
+        self.weights[path + (key,)] = weight
+
+    def key_order(self):
+        return [k for k in self.flat if k != "default"] + ["default"]
+
+    def leaf_path(self, key):
+        if key not in self.paths:
+            key = "default"
+        return self.paths[key] + (key,)
+
+    def resolve(self, value):
+        if isinstance(value, str):
+            value = [part for part in value.split("/") if part]
+        if not isinstance(value, (list, tuple)) or not value:
+            return None
+        key = str(value[-1])
+        return key if key in self.paths else None
+
+    def subtree_counts(self, leaf_counts):
+        totals = {}
+        for key, count in leaf_counts.items():
+            if count <= 0:
+                continue
+            for node in self.prefixes.get(key) or self.prefixes["default"]:
+                totals[node] = totals.get(node, 0) + count
+        return totals
+
+
+class QueueIndex:
+    def __init__(self, queue_path, reconcile_interval=60):
+        self.queue_path = os.path.abspath(queue_path)
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.classes = {}
+        self.classify = None
+        self.prioritize = None
+        self.default_priority = DEFAULT_PRIORITY_CLASS
+        self.signature = None
+        self.last_reconcile = None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def _is_job_name(self, name):
+        return bool(name) and not name.startswith(".")
+
+    def _class_state(self, priority):
+        state = self.classes.get(priority)
+        if state is None:
+            state = {"buckets": {}, "counts": {}, "total": 0}
+            self.classes[priority] = state
+        return state
+
+    def _push(self, name, entry):
+        state = self._class_state(entry["priority"])
+        bucket = entry["bucket"]
+        heapq.heappush(state["buckets"].setdefault(bucket, []), (entry["arrival"], name))
+        state["counts"][bucket] = state["counts"].get(bucket, 0) + 1
+        state["total"] += 1
+
+    def _make_entry(self, name, arrival):
+        bucket = self.classify(name) if self.classify else "default"
+        if self.prioritize:
+            priority = self.prioritize(name)
+        elif VIP_PATTERN.search(name):
+            priority = 0
+        else:
+            priority = self.default_priority
+        return {"arrival": arrival, "bucket": bucket, "priority": priority}
+
+    def add(self, name, arrival=None):
+        if not self._is_job_name(name):
+            return
+        if arrival is None:
+            try:
+                st = os.stat(os.path.join(self.queue_path, name))
+            except OSError:
+                return
+            arrival = st.st_mtime
+        with self.lock:
+            current = self.entries.get(name)
+            if current is not None:
+                if current["arrival"] == arrival:
+                    return
+                self.discard(name)
+            entry = self._make_entry(name, arrival)
+            self.entries[name] = entry
+            self._push(name, entry)
+
+    def discard(self, name):
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry is None:
+                return
+            state = self._class_state(entry["priority"])
+            bucket = entry["bucket"]
+            state["counts"][bucket] = max(0, state["counts"].get(bucket, 0) - 1)
+            state["total"] = max(0, state["total"] - 1)
+
+    def reconcile(self):
+        seen = {}
+        try:
+            with os.scandir(self.queue_path) as it:
+                for entry in it:
+                    if not self._is_job_name(entry.name):
+                        continue
+                    try:
+                        if not (entry.is_file() or entry.is_dir()):
+                            continue
+                        seen[entry.name] = entry.stat().st_mtime
+                    except OSError:
+                        continue
+        except OSError:
+            seen = {}
+        with self.lock:
+            for name in list(self.entries.keys()):
+                if name not in seen:
+                    self.discard(name)
+            for name, arrival in seen.items():
+                if name not in self.entries:
+                    self.add(name, arrival)
+            self.last_reconcile = time.time()
+
+    def maybe_reconcile(self):
+        if (
+            self.last_reconcile is None
+            or time.time() - self.last_reconcile >= self.reconcile_interval
+        ):
+            self.reconcile()
+
+    def set_classifier(self, signature, classify, prioritize=None, default_priority=None):
+        with self.lock:
+            if signature == self.signature and self.classify is not None:
+                return
+            self.signature = signature
+            self.classify = classify
+            self.prioritize = prioritize
+            if default_priority is not None:
+                self.default_priority = default_priority
+            self.classes = {}
+            for name, entry in list(self.entries.items()):
+                entry.update(self._make_entry(name, entry["arrival"]))
+                self._push(name, entry)
+
+    def reclassify(self, names):
+        with self.lock:
+            for name in names:
+                entry = self.entries.get(name)
+                if entry is None:
+                    continue
+                updated = self._make_entry(name, entry["arrival"])
+                if (
+                    updated["bucket"] == entry["bucket"]
+                    and updated["priority"] == entry["priority"]
+                ):
+                    continue
+                state = self._class_state(entry["priority"])
+                bucket = entry["bucket"]
+                state["counts"][bucket] = max(0, state["counts"].get(bucket, 0) - 1)
+                state["total"] = max(0, state["total"] - 1)
+                entry.update(updated)
+                self._push(name, entry)
+
+    def _head(self, heap, bucket, priority):
+        while heap:
+            arrival, name = heap[0]
+            entry = self.entries.get(name)
+            if (
+                entry is None
+                or entry["arrival"] != arrival
+                or entry["bucket"] != bucket
+                or entry["priority"] != priority
+            ):
+                heapq.heappop(heap)
+                continue
+            if not os.path.exists(os.path.join(self.queue_path, name)):
+                heapq.heappop(heap)
+                self.discard(name)
+                continue
+            return name
+        return None
+
+    def peek(self, bucket, priority=None):
+        if priority is None:
+            priority = self.default_priority
+        with self.lock:
+            state = self.classes.get(priority)
+            if not state:
+                return None
+            return self._head(state["buckets"].get(bucket, []), bucket, priority)
+
+    def count(self, bucket, priority=None):
+        if priority is None:
+            priority = self.default_priority
+        with self.lock:
+            state = self.classes.get(priority)
+            return state["counts"].get(bucket, 0) if state else 0
+
+    def bucket_counts(self, priority=None):
+        if priority is None:
+            priority = self.default_priority
+        with self.lock:
+            state = self.classes.get(priority)
+            return dict(state["counts"]) if state else {}
+
+    def find(self, bucket, predicate, priority=None, limit=32):
+        if priority is None:
+            priority = self.default_priority
+        with self.lock:
+            state = self.classes.get(priority)
+            if not state:
+                return None
+            heap = state["buckets"].get(bucket, [])
+            if self._head(heap, bucket, priority) is None:
+                return None
+            frontier = [(heap[0], 0)]
+            scanned = 0
+            while frontier and scanned < limit:
+                (arrival, name), pos = heapq.heappop(frontier)
+                for child in (2 * pos + 1, 2 * pos + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+                entry = self.entries.get(name)
+                if (
+                    entry is None
+                    or entry["arrival"] != arrival
+                    or entry["bucket"] != bucket
+                    or entry["priority"] != priority
+                ):
+                    continue
+                scanned += 1
+                if not predicate(name):
+                    continue
+                if not os.path.exists(os.path.join(self.queue_path, name)):
+                    continue
+                return name
+        return None
+
+    def priorities(self):
+        with self.lock:
+            return sorted(p for p, state in self.classes.items() if state["total"] > 0)
+
+    def count_up_to(self, max_priority):
+        with self.lock:
+            return sum(
+                state["total"]
+                for priority, state in self.classes.items()
+                if priority <= max_priority
+            )
+
+    def has_priority(self, max_priority):
+        with self.lock:
+            for priority in self.priorities():
+                if priority > max_priority:
+                    break
+                for bucket, heap in self.classes[priority]["buckets"].items():
+                    if self._head(heap, bucket, priority) is not None:
+                        return True
+        return False
+
+    def arrival_of(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry["arrival"] if entry else None
+
+    def bucket_of(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry["bucket"] if entry else None
+
+    def priority_of(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry["priority"] if entry else None
+
+    def handle_event(self, event_type, src_path, dest_path=None):
+        src_dir, src_name = os.path.split(os.path.abspath(src_path))
+        if event_type == "created":
+            if src_dir == self.queue_path:
+                self.add(src_name)
+        elif event_type == "deleted":
+            if src_dir == self.queue_path:
+                self.discard(src_name)
+        elif event_type == "moved":
+            if src_dir == self.queue_path:
+                self.discard(src_name)
+            if dest_path:
+                dest_dir, dest_name = os.path.split(os.path.abspath(dest_path))
+                if dest_dir == self.queue_path:
+                    self.add(dest_name)
+
+
+class HeartbeatRegistry:
+    def __init__(self, heartbeat_dir, refresh_interval=1.0):
+        self.heartbeat_dir = os.path.abspath(heartbeat_dir)
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.files = {}
+        self.records = {}
+        self.by_status = {}
+        self.busy_jobs = {}
+        self.observed = {}
+        self.last_seen = {}
+        self.intervals = {}
+        self.interval_window = 100
+        self.last_refresh = None
+        self.parse_count = 0
+
+    def refresh(self, force=False):
+        with self.lock:
+            now = time.time()
+            if (
+                not force
+                and self.last_refresh is not None
+                and now - self.last_refresh < self.refresh_interval
+            ):
+                return False
+            seen = set()
+            changed = False
+            try:
+                with os.scandir(self.heartbeat_dir) as it:
+                    dir_entries = [e for e in it if e.name.endswith(".json")]
+            except OSError:
+                dir_entries = []
+            for entry in dir_entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                seen.add(entry.name)
+                stat_key = (st.st_mtime_ns, st.st_size)
+                cached = self.files.get(entry.name)
+                if cached is not None and cached["stat"] == stat_key:
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    data = None
+                self.parse_count += 1
+                if not isinstance(data, dict):
+                    data = None
+                self.files[entry.name] = {
+                    "stat": stat_key,
+                    "data": data,
+                    "observed": now,
+                }
+                changed = True
+                worker_id = data.get("worker_id") if data else None
+                if worker_id:
+                    # Arrival times use the local clock, so remote clock skew drops out.
+                    previous = self.last_seen.get(worker_id)
+                    if previous is not None and now > previous:
+                        self.intervals.setdefault(
+                            worker_id, deque(maxlen=self.interval_window)
+                        ).append(now - previous)
+                    self.last_seen[worker_id] = now
+            for name in list(self.files.keys()):
+                if name not in seen:
+                    del self.files[name]
+                    changed = True
+            if changed or self.last_refresh is None:
+                self._rebuild_views()
+            self.last_refresh = now
+            return changed
+
+    def _rebuild_views(self):
+        records = {}
+        by_status = {}
+        busy_jobs = {}
+        observed = {}
+        for name in sorted(self.files.keys()):
+            data = self.files[name]["data"]
+            if not data:
+                continue
+            worker_id = data.get("worker_id")
+            if not worker_id:
+                continue
+            records[worker_id] = data
+            observed[worker_id] = self.files[name]["observed"]
+            by_status.setdefault(data.get("status"), []).append(worker_id)
+            current_job = data.get("current_job")
+            if data.get("status") == "BUSY" and current_job:
+                busy_jobs[current_job] = worker_id
+        self.records = records
+        self.by_status = by_status
+        self.busy_jobs = busy_jobs
+        self.observed = observed
+
+    def get(self, worker_id):
+        with self.lock:
+            return self.records.get(worker_id)
+
+    def all(self):
+        with self.lock:
+            return list(self.records.values())
+
+    def observed_at(self, worker_id):
+        with self.lock:
+            return self.observed.get(worker_id)
+
+    def with_status(self, status):
+        with self.lock:
+            return [self.records[w] for w in self.by_status.get(status, [])]
+
+    def idle_by_role(self, max_age=90, now=None):
+        now = int(time.time()) if now is None else now
+        result = {}
+        for data in self.with_status("IDLE"):
+            ts = data.get("timestamp")
+            if not isinstance(ts, int) or now - ts >= max_age:
+                continue
+            result.setdefault(data.get("role"), []).append(data["worker_id"])
+        return result
+
+    def busy_by_job(self):
+        with self.lock:
+            return dict(self.busy_jobs)
+
+    def phi(self, worker_id, now=None, min_samples=5, min_std=15.0, pause=10.0):
+        now = time.time() if now is None else now
+        with self.lock:
+            samples = list(self.intervals.get(worker_id) or ())
+            last = self.last_seen.get(worker_id)
+        if last is None or len(samples) < min_samples:
+            return None
+        mean = sum(samples) / len(samples)
+        variance = sum((x - mean) ** 2 for x in samples) / len(samples)
+        std = max(math.sqrt(variance), min_std)
+        y = (now - last - mean - pause) / std
+        p_later = 0.5 * math.erfc(y / math.sqrt(2))
+        return -math.log10(max(p_later, 1e-300))
+
+    def silence(self, worker_id, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            last = self.last_seen.get(worker_id)
+        return None if last is None else now - last
+
+    def stale(self, max_age, status=None, now=None):
+        now = int(time.time()) if now is None else now
+        records = self.with_status(status) if status is not None else self.all()
+        return [
+            data
+            for data in records
+            if isinstance(data.get("timestamp"), int)
+            and now - data["timestamp"] > max_age
+        ]
+
+
+def parse_deadline(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    text = value.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+class HashRing:
+    def __init__(self, nodes, replicas=64):
+        self.nodes = sorted(set(nodes))
+        self.ring = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas)
+        )
+        self.points = [point for point, _node in self.ring]
+
+    @staticmethod
+    def _hash(key):
+        # md5 rather than hash(): every lead must place keys identically.
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def owner(self, key):
+        if not self.ring:
+            return None
+        idx = bisect.bisect(self.points, self._hash(key)) % len(self.ring)
+        return self.ring[idx][1]
+
+
+class ManifestStore:
+    def __init__(self, manifest_dir, refresh_interval=5.0):
+        self.manifest_dir = os.path.abspath(manifest_dir)
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.files = {}
+        self.records = {}
+        self.constrained = set()
+        self.last_refresh = None
+        self.pending = {}
+
+    def _parse(self, data):
+        if not isinstance(data, dict):
+            return None
+        record = dict(data)
+        record["deadline"] = parse_deadline(data.get("deadline"))
+        try:
+            estimate = float(data.get("cost_estimate"))
+            record["cost_estimate"] = estimate if estimate > 0 else None
+        except (TypeError, ValueError):
+            record["cost_estimate"] = None
+        return record
+
+    def refresh(self, force=False):
+        with self.lock:
+            now = time.time()
+            if (
+                not force
+                and self.last_refresh is not None
+                and now - self.last_refresh < self.refresh_interval
+            ):
+                return
+            seen = set()
+            changed = set()
+            try:
+                with os.scandir(self.manifest_dir) as it:
+                    dir_entries = [
+                        e
+                        for e in it
+                        if e.name.endswith(".json") and not e.name.startswith(".")
+                    ]
+            except OSError:
+                dir_entries = []
+            for entry in dir_entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                seen.add(entry.name)
+                stat_key = (st.st_mtime_ns, st.st_size)
+                cached = self.files.get(entry.name)
+                if cached is not None and cached["stat"] == stat_key:
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        record = self._parse(json.load(f))
+                except (OSError, json.JSONDecodeError):
+                    record = None
+                self.files[entry.name] = {"stat": stat_key, "record": record}
+                changed.add(entry.name[: -len(".json")])
+            for name in list(self.files.keys()):
+                if name not in seen:
+                    del self.files[name]
+                    changed.add(name[: -len(".json")])
+            if changed:
+                for names in self.pending.values():
+                    names.update(changed)
+            self.records = {
+                name[: -len(".json")]: cached["record"]
+                for name, cached in self.files.items()
+                if cached["record"] is not None
+            }
+            self.constrained = {
+                name for name, record in self.records.items() if record.get("requires")
+            }
+            self.last_refresh = now
+
+    def take_changes(self, consumer):
+        self.refresh()
+        with self.lock:
+            names = self.pending.get(consumer)
+            self.pending[consumer] = set()
+            return names
+
+    def get(self, job_name):
+        self.refresh()
+        with self.lock:
+            return self.records.get(job_name)
+
+    def has_requirements(self):
+        self.refresh()
+        with self.lock:
+            return bool(self.constrained)
+
+    def with_deadline(self):
+        self.refresh()
+        with self.lock:
+            items = [
+                (record["deadline"], name, record)
+                for name, record in self.records.items()
+                if record.get("deadline") is not None
+            ]
+        items.sort(key=lambda item: (item[0], item[1]))
+        return items
+
+
+class DispatchWakeup:
+    def __init__(self, debounce=0.5, max_delay=2.0, latency_window=500):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.first_event = None
+        self.last_event = None
+        self.event_count = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def notify(self):
+        now = time.time()
+        with self.lock:
+            if self.first_event is None:
+                self.first_event = now
+            self.last_event = now
+            self.event_count += 1
+            self.event.set()
+
+    def wait(self, timeout):
+        if not self.event.wait(timeout):
+            return None
+        while True:
+            with self.lock:
+                deadline = min(
+                    self.last_event + self.debounce,
+                    self.first_event + self.max_delay,
+                )
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+        with self.lock:
+            first_event = self.first_event
+            self.first_event = None
+            self.last_event = None
+            self.event.clear()
+        return first_event
+
+    def record_dispatch(self, first_event):
+        if first_event is None:
+            return None
+        latency = max(0.0, time.time() - first_event)
+        with self.lock:
+            self.latencies.append(latency)
+        return latency
+
+    def latency_stats(self):
+        with self.lock:
+            samples = sorted(self.latencies)
+            events = self.event_count
+        if not samples:
+            return {"count": 0, "events": events}
+        return {
+            "count": len(samples),
+            "events": events,
+            "last": round(self.latencies[-1], 3),
+            "p50": round(samples[int(0.50 * (len(samples) - 1))], 3),
+            "p99": round(samples[int(0.99 * (len(samples) - 1))], 3),
+            "max": round(samples[-1], 3),
+        }
 
 
 class FleetDispatcher:
@@ -13,6 +860,704 @@ class FleetDispatcher:
         self.logger = logger
         self.deficits = {}
         self.current_index = {}
+        self.queue_indexes = {}
+        self.queue_index_lock = threading.Lock()
+        self.classifier = None
+        self.classifier_signature = None
+        self.weight_tree = None
+        self.tree_state = {}
+        self.running_buckets = None
+        self.weights_cache = None
+        self.weights_cache_stat = None
+        self.settings_cache = {}
+        self.settings_cache_stat = None
+        self.queue_waits = {}
+        self.last_wait_report = 0
+        self.manifest_store = None
+        self.deadline_flags = {}
+        self.class_dispatches = {}
+        self.last_pick = None
+        self.heartbeat_registries = {}
+        self.wakeup = None
+        self.scheduler_state_loaded = set()
+        self.scheduler_state_dirty = set()
+        self.scheduler_state_seq = {}
+        self.restored_key_order = {}
+        self.shared_contrib = {}
+        self.shared_baseline = {}
+        self.job_costs = {}
+        self.runtime_state_loaded = False
+        self.runtime_state_dirty = False
+        self.vruntime = {}
+        self.vruntime_floor = {}
+        self.vruntime_active = {}
+        self.bucket_runtime = {}
+        self.sec_per_unit = {}
+        self.bucket_sec_per_unit = {}
+        self.usage_seen = {}
+        self.usage_stat = {}
+        self.runtime_pending = OrderedDict()
+        self.runtime_finished = OrderedDict()
+        self.last_assigned = {}
+        self.worker_health = None
+        self.resource_blocked = {}
+        self.paused_since = {}
+        self.missing_since = {}
+        self.unleased_since = {}
+        self.rings = {}
+        self.ring_leads = {}
+        self.shard_dispatched = None
+        self.shard_recent = {}
+        self.shard_backlog = {}
+
+    def _heartbeat_dir(self):
+        hb_dir = self.config.get("heartbeat_path")
+        if hb_dir:
+            return os.path.abspath(os.path.expanduser(hb_dir))
+        return self.get_sys_path(os.path.join("_system", "heartbeats"))
+
+    def get_heartbeat_registry(self, heartbeat_dir=None, force=False):
+        hb_dir = os.path.abspath(heartbeat_dir or self._heartbeat_dir())
+        registry = self.heartbeat_registries.get(hb_dir)
+        if registry is None:
+            registry = HeartbeatRegistry(
+                hb_dir,
+                refresh_interval=self.config.get("heartbeat_refresh_interval", 1.0),
+            )
+            self.heartbeat_registries[hb_dir] = registry
+        registry.refresh(force=force)
+        return registry
+
+    def get_queue_index(self, queue_path):
+        queue_key = os.path.abspath(queue_path)
+        with self.queue_index_lock:
+            index = self.queue_indexes.get(queue_key)
+            if index is None:
+                index = QueueIndex(
+                    queue_key,
+                    reconcile_interval=self.config.get("queue_reconcile_interval", 60),
+                )
+                self.queue_indexes[queue_key] = index
+        return index
+
+    def handle_queue_event(self, event_type, src_path, dest_path=None):
+        with self.queue_index_lock:
+            indexes = list(self.queue_indexes.values())
+        for index in indexes:
+            index.handle_event(event_type, src_path, dest_path)
+
+    def _get_classifier(self, weights_cfg):
+        signature = json.dumps(weights_cfg, sort_keys=False, default=str)
+        if self.classifier is None or self.classifier_signature != signature:
+            self.weight_tree = WeightTree(weights_cfg)
+            self.classifier = WeightClassifier(
+                self.weight_tree.flat, fallbacks=self.weight_tree.fallbacks
+            )
+            self.classifier_signature = signature
+            self.logger("DEBUG: Weight classifier rebuilt from current weights.")
+        return self.classifier
+
+    def _get_weight_tree(self, weights_cfg):
+        self._get_classifier(weights_cfg)
+        return self.weight_tree
+
+    def job_bucket(self, name):
+        if self.classifier is None:
+            self._get_classifier(self._load_weights())
+        manifest = self.get_manifest_store().get(name)
+        if manifest:
+            for field in ("weight_path", "weight_key"):
+                key = self.weight_tree.resolve(manifest.get(field))
+                if key is not None:
+                    return key
+        return self.classifier.classify(name)
+
+    def _scheduler_state_path(self, queue_key):
+        return self.get_sys_path(
+            os.path.join(
+                "_system",
+                "scheduler_state",
+                f"{os.path.basename(queue_key)}{self._state_suffix()}.json",
+            )
+        )
+
+    def _restore_scheduler_state(self, queue_key):
+        if queue_key in self.scheduler_state_loaded:
+            return
+        self.scheduler_state_loaded.add(queue_key)
+        if not self.config.get("persist_scheduler_state", True):
+            return
+        if self._shared_state():
+            self._restore_shared_scheduler_state(queue_key)
+            return
+        state_path = self._scheduler_state_path(queue_key)
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger(f"⚠️ Could not load scheduler state {state_path}: {e}")
+            return
+        if not isinstance(state, dict) or state.get("version") != SCHEDULER_STATE_VERSION:
+            self.logger(f"⚠️ Ignoring scheduler state with unknown version: {state_path}")
+            return
+        deficits = state.get("deficits") or {}
+        self.deficits[queue_key] = {
+            k: int(v) for k, v in deficits.items() if isinstance(v, (int, float))
+        }
+        self.current_index[queue_key] = int(state.get("current_index", 0) or 0)
+        self.restored_key_order[queue_key] = list(state.get("key_order") or [])
+        tree = state.get("tree")
+        if isinstance(tree, dict):
+            self.tree_state[queue_key] = {
+                level: {
+                    "deficits": {
+                        k: int(v)
+                        for k, v in (item.get("deficits") or {}).items()
+                        if isinstance(v, (int, float))
+                    },
+                    "next": item.get("next"),
+                }
+                for level, item in tree.items()
+                if isinstance(item, dict)
+            }
+        self.scheduler_state_seq[queue_key] = int(state.get("seq", 0) or 0)
+        self.logger(
+            f"DEBUG: Restored DRR state for {os.path.basename(queue_key)} "
+            f"(seq {self.scheduler_state_seq[queue_key]}, writer {state.get('writer')})"
+        )
+
+    def _shared_state(self):
+        # Pull workers and the lead all schedule from one queue; each writes only its own
+        # file so concurrent writers never overwrite each other through Syncthing.
+        return bool(self._settings_value("pull_mode", False)) and bool(
+            self.config.get("worker_id")
+        )
+
+    def _shared_state_files(self, base_path):
+        directory, name = os.path.split(base_path)
+        stem = name[: -len(".json")]
+        if self._state_suffix():
+            stem = stem[: -len(self._state_suffix())]
+        try:
+            names = [
+                entry
+                for entry in os.listdir(directory)
+                if entry.endswith(".json")
+                and ".sync-conflict-" not in entry
+                and (entry == f"{stem}.json" or entry.startswith(f"{stem}@"))
+            ]
+        except OSError:
+            return []
+        states = []
+        for entry in sorted(names):
+            try:
+                with open(os.path.join(directory, entry), "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if isinstance(state, dict) and state.get("version") == SCHEDULER_STATE_VERSION:
+                states.append((entry, state))
+        return states
+
+    def _scheduler_counts(self, queue_key):
+        return {
+            "deficits": dict(self.deficits.get(queue_key, {})),
+            "tree": {
+                level: dict(item.get("deficits") or {})
+                for level, item in self.tree_state.get(queue_key, {}).items()
+            },
+        }
+
+    def _restore_shared_scheduler_state(self, queue_key):
+        own_name = os.path.basename(self._scheduler_state_path(queue_key))
+        states = self._shared_state_files(self._scheduler_state_path(queue_key))
+        merged = {"deficits": {}, "tree": {}}
+        own = {}
+        latest = None
+        nexts = {}
+        for name, state in sorted(states, key=lambda item: item[1].get("updated_at", 0)):
+            if "@" in name:
+                add_counts(merged, state.get("contrib"))
+            else:
+                # Single-writer file left from before pull mode: its totals are the base.
+                add_counts(merged["deficits"], state.get("deficits"))
+                for level, item in (state.get("tree") or {}).items():
+                    if isinstance(item, dict):
+                        add_counts(merged["tree"].setdefault(level, {}), item.get("deficits"))
+            if name == own_name:
+                own = state.get("contrib") or {}
+            for level, item in (state.get("tree") or {}).items():
+                if isinstance(item, dict):
+                    nexts[level] = item.get("next")
+            latest = state
+        self.shared_contrib[queue_key] = add_counts({}, own)
+        self.shared_baseline[queue_key] = add_counts({}, merged)
+        if latest is None:
+            return
+        self.deficits[queue_key] = {k: int(v) for k, v in merged["deficits"].items()}
+        self.current_index[queue_key] = int(latest.get("current_index", 0) or 0)
+        self.restored_key_order[queue_key] = list(latest.get("key_order") or [])
+        self.tree_state[queue_key] = {
+            level: {
+                "deficits": {k: int(v) for k, v in merged["tree"].get(level, {}).items()},
+                "next": nexts.get(level),
+            }
+            for level in set(merged["tree"]) | set(nexts)
+        }
+        self.scheduler_state_seq[queue_key] = max(
+            int(state.get("seq", 0) or 0) for _name, state in states
+        )
+        self.logger(
+            f"DEBUG: Merged DRR state for {os.path.basename(queue_key)} "
+            f"from {len(states)} writer(s)"
+        )
+
+    def _scheduler_state_payload(self, queue_key, key_order):
+        return {
+            "version": SCHEDULER_STATE_VERSION,
+            "queue": os.path.basename(queue_key),
+            "seq": self.scheduler_state_seq.get(queue_key, 0),
+            "writer": self.config.get("worker_id"),
+            "updated_at": int(time.time()),
+            "key_order": key_order,
+            "current_index": self.current_index.get(queue_key, 0),
+            "deficits": self.deficits.get(queue_key, {}),
+            "tree": self.tree_state.get(queue_key, {}),
+        }
+
+    def save_scheduler_state(self):
+        if not self.config.get("persist_scheduler_state", True):
+            self.scheduler_state_dirty.clear()
+            return
+        shared = self._shared_state()
+        for queue_key in list(self.scheduler_state_dirty):
+            key_order = self.restored_key_order.get(queue_key, [])
+            self.scheduler_state_seq[queue_key] = (
+                self.scheduler_state_seq.get(queue_key, 0) + 1
+            )
+            payload = self._scheduler_state_payload(queue_key, key_order)
+            if shared:
+                counts = self._scheduler_counts(queue_key)
+                contrib = add_counts({}, self.shared_contrib.get(queue_key))
+                add_counts(contrib, counts)
+                add_counts(contrib, self.shared_baseline.get(queue_key), sign=-1)
+                payload["contrib"] = contrib
+            try:
+                write_json_atomic(self._scheduler_state_path(queue_key), payload)
+            except OSError as e:
+                self.logger(f"⚠️ Could not save scheduler state: {e}")
+                continue
+            if shared:
+                self.shared_contrib[queue_key] = payload["contrib"]
+                self.shared_baseline[queue_key] = counts
+            self.scheduler_state_dirty.discard(queue_key)
+        if self.runtime_state_dirty:
+            payload = self._runtime_state_payload()
+            if shared:
+                counts = self._runtime_counts()
+                contrib = add_counts({}, self.shared_contrib.get("runtime"))
+                add_counts(contrib, counts)
+                add_counts(contrib, self.shared_baseline.get("runtime"), sign=-1)
+                payload["contrib"] = contrib
+            try:
+                write_json_atomic(self._runtime_state_path(), payload)
+                self.runtime_state_dirty = False
+            except OSError as e:
+                self.logger(f"⚠️ Could not save runtime state: {e}")
+            else:
+                if shared:
+                    self.shared_contrib["runtime"] = payload["contrib"]
+                    self.shared_baseline["runtime"] = counts
+
+    def _runtime_state_path(self):
+        return self.get_sys_path(
+            os.path.join("_system", "scheduler_state", f"runtime{self._state_suffix()}.json")
+        )
+
+    def _state_suffix(self):
+        if (self._shard_mode() or self._shared_state()) and self.config.get("worker_id"):
+            return f"@{self.config['worker_id']}"
+        return ""
+
+    def _runtime_counts(self):
+        return {
+            "vruntime": add_counts({}, self.vruntime),
+            "bucket_runtime": add_counts({}, self.bucket_runtime),
+        }
+
+    def _runtime_state_payload(self):
+        return {
+            "version": SCHEDULER_STATE_VERSION,
+            "writer": self.config.get("worker_id"),
+            "updated_at": int(time.time()),
+            "vruntime": self.vruntime,
+            "vruntime_floor": self.vruntime_floor,
+            "active": {q: sorted(keys) for q, keys in self.vruntime_active.items()},
+            "bucket_runtime": self.bucket_runtime,
+            "sec_per_unit": self.sec_per_unit,
+            "bucket_sec_per_unit": self.bucket_sec_per_unit,
+            "usage_seen": {w: dict(jobs) for w, jobs in self.usage_seen.items()},
+            "pending": dict(self.runtime_pending),
+            "finished": dict(self.runtime_finished),
+            "last_assigned": dict(self.last_assigned),
+        }
+
+    def _restore_runtime_state(self):
+        if self.runtime_state_loaded:
+            return
+        self.runtime_state_loaded = True
+        if not self.config.get("persist_scheduler_state", True):
+            return
+        if self._shared_state():
+            self._restore_shared_runtime_state()
+            return
+        try:
+            with open(self._runtime_state_path(), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger(f"⚠️ Could not load runtime state: {e}")
+            return
+        if not isinstance(state, dict) or state.get("version") != SCHEDULER_STATE_VERSION:
+            return
+        self.vruntime = state.get("vruntime") or {}
+        self.vruntime_floor = state.get("vruntime_floor") or {}
+        self.vruntime_active = {
+            q: set(keys) for q, keys in (state.get("active") or {}).items()
+        }
+        self.bucket_runtime = state.get("bucket_runtime") or {}
+        self.sec_per_unit = state.get("sec_per_unit") or {}
+        self.bucket_sec_per_unit = state.get("bucket_sec_per_unit") or {}
+        self.usage_seen = {
+            w: OrderedDict(jobs) for w, jobs in (state.get("usage_seen") or {}).items()
+        }
+        self.runtime_pending = OrderedDict(state.get("pending") or {})
+        self.last_assigned = {
+            w: float(ts)
+            for w, ts in (state.get("last_assigned") or {}).items()
+            if isinstance(ts, (int, float))
+        }
+
+    def _restore_shared_runtime_state(self):
+        own_name = os.path.basename(self._runtime_state_path())
+        states = sorted(
+            self._shared_state_files(self._runtime_state_path()),
+            key=lambda item: item[1].get("updated_at", 0),
+        )
+        merged = {"vruntime": {}, "bucket_runtime": {}}
+        own = {}
+        floor = {}
+        usage_seen = {}
+        pending = {}
+        finished = {}
+        last_assigned = {}
+        for name, state in states:
+            if "@" in name:
+                add_counts(merged, state.get("contrib"))
+            else:
+                add_counts(merged["vruntime"], state.get("vruntime"))
+                add_counts(merged["bucket_runtime"], state.get("bucket_runtime"))
+            if name == own_name:
+                own = state.get("contrib") or {}
+            for queue_name, value in (state.get("vruntime_floor") or {}).items():
+                if isinstance(value, (int, float)):
+                    floor[queue_name] = max(floor.get(queue_name, value), value)
+            for worker_id, jobs in (state.get("usage_seen") or {}).items():
+                seen = usage_seen.setdefault(worker_id, {})
+                for job_name, record in (jobs or {}).items():
+                    previous = seen.get(job_name) or {}
+                    seen[job_name] = {
+                        "seconds": max(
+                            float(record.get("seconds", 0) or 0),
+                            float(previous.get("seconds", 0) or 0),
+                        ),
+                        "done": bool(record.get("done")) or bool(previous.get("done")),
+                    }
+            for job_name, record in (state.get("pending") or {}).items():
+                previous = pending.get(job_name)
+                if previous is None or record.get("remaining", 0) < previous.get("remaining", 0):
+                    pending[job_name] = dict(record)
+            for job_name, ts in (state.get("finished") or {}).items():
+                if isinstance(ts, (int, float)):
+                    finished[job_name] = max(finished.get(job_name, ts), ts)
+            for worker_id, ts in (state.get("last_assigned") or {}).items():
+                if isinstance(ts, (int, float)):
+                    last_assigned[worker_id] = max(last_assigned.get(worker_id, ts), float(ts))
+        self.shared_contrib["runtime"] = add_counts({}, own)
+        self.shared_baseline["runtime"] = add_counts({}, merged)
+        if not states:
+            return
+        latest = states[-1][1]
+        self.vruntime = merged["vruntime"]
+        self.bucket_runtime = merged["bucket_runtime"]
+        self.vruntime_floor = floor
+        self.vruntime_active = {
+            q: set(keys) for q, keys in (latest.get("active") or {}).items()
+        }
+        self.sec_per_unit = latest.get("sec_per_unit") or {}
+        self.bucket_sec_per_unit = latest.get("bucket_sec_per_unit") or {}
+        self.usage_seen = {w: OrderedDict(jobs) for w, jobs in usage_seen.items()}
+        # A job finished by any writer stays finished unless it was dispatched again later.
+        self.runtime_pending = OrderedDict(
+            (job_name, record)
+            for job_name, record in pending.items()
+            if finished.get(job_name, -1) < record.get("dispatched_at", 0)
+        )
+        self.runtime_finished = OrderedDict(sorted(finished.items(), key=lambda item: item[1]))
+        self.last_assigned = last_assigned
+
+    def _worker_health_path(self):
+        return self.get_sys_path(os.path.join("_system", "worker_health.json"))
+
+    def _load_worker_health(self):
+        if self.worker_health is not None:
+            return
+        self.worker_health = {}
+        try:
+            with open(self._worker_health_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        workers = data.get("workers") if isinstance(data, dict) else None
+        if isinstance(workers, dict):
+            self.worker_health = {
+                w: record for w, record in workers.items() if isinstance(record, dict)
+            }
+
+    def health_state(self, worker_id):
+        record = (self.worker_health or {}).get(worker_id) or {}
+        return record.get("state", "healthy")
+
+    def update_worker_health(self):
+        self._load_worker_health()
+        half_life = float(self._settings_value("health_half_life", 1800) or 0)
+        alpha = float(self._settings_value("health_alpha", 0.3))
+        degraded_below = float(self._settings_value("health_deprioritize", 0.6))
+        quarantine_below = float(self._settings_value("health_quarantine", 0.3))
+        min_events = int(self._settings_value("health_min_events", 3))
+        now = time.time()
+        changed = False
+        for data in self.get_heartbeat_registry().all():
+            counters = data.get("health")
+            if not isinstance(counters, dict):
+                continue
+            worker_id = data["worker_id"]
+            record = self.worker_health.setdefault(
+                worker_id,
+                {"score": 1.0, "state": "healthy", "events": 0, "ok": 0, "fail": 0},
+            )
+            score = float(record.get("score", 1.0))
+            elapsed = now - float(record.get("updated_at", now))
+            if half_life > 0 and elapsed > 0:
+                # Scores drift back to healthy so quarantined workers get retried.
+                score = 1.0 - (1.0 - score) * 0.5 ** (elapsed / half_life)
+            try:
+                ok = int(counters.get("ok", 0))
+                fail = int(counters.get("fail", 0))
+            except (TypeError, ValueError):
+                continue
+            if (
+                counters.get("since") != record.get("since")
+                or ok < record.get("ok", 0)
+                or fail < record.get("fail", 0)
+            ):
+                record.update(since=counters.get("since"), ok=0, fail=0)
+            new_ok = ok - record["ok"]
+            new_fail = fail - record["fail"]
+            events = new_ok + new_fail
+            if events > 0:
+                # n EWMA steps in closed form, each fed the batch success rate, so
+                # neither the order of outcomes nor the batch size costs a loop.
+                keep = (1.0 - alpha) ** events
+                score = keep * score + (1.0 - keep) * (new_ok / events)
+            record.update(
+                score=round(score, 4),
+                ok=ok,
+                fail=fail,
+                events=record.get("events", 0) + events,
+                updated_at=now,
+            )
+            if new_fail:
+                record["reasons"] = dict(counters.get("reasons") or {})
+            state = "healthy"
+            if record["events"] >= min_events:
+                if score < quarantine_below:
+                    state = "quarantined"
+                elif score < degraded_below:
+                    state = "degraded"
+            if state != record.get("state"):
+                icon = {"healthy": "💚", "degraded": "⚠️", "quarantined": "🚫"}[state]
+                self.logger(
+                    f"{icon} Worker {worker_id} is now {state} "
+                    f"(health {score:.2f}, failures {record.get('reasons') or {}})."
+                )
+                record["state"] = state
+                record["decided_at"] = int(now)
+                changed = True
+            elif new_ok or new_fail:
+                changed = True
+        if changed:
+            try:
+                write_json_atomic(
+                    self._worker_health_path(),
+                    {"updated_at": int(now), "workers": self.worker_health},
+                )
+            except OSError as e:
+                self.logger(f"⚠️ Could not save worker health: {e}")
+
+    def collect_runtime_usage(self):
+        self._restore_runtime_state()
+        usage_dir = self.get_sys_path(os.path.join("_system", "usage"))
+        try:
+            with os.scandir(usage_dir) as it:
+                ledgers = [e for e in it if e.name.endswith(".json")]
+        except OSError:
+            return
+        seen_limit = self.config.get("runtime_seen_per_worker", 500)
+        for entry in ledgers:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            stat_key = (st.st_mtime_ns, st.st_size)
+            if self.usage_stat.get(entry.name) == stat_key:
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    ledger = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            self.usage_stat[entry.name] = stat_key
+            if not isinstance(ledger, dict):
+                continue
+            worker_id = ledger.get("worker_id") or os.path.splitext(entry.name)[0]
+            seen = self.usage_seen.setdefault(worker_id, OrderedDict())
+            for job_name, record in (ledger.get("jobs") or {}).items():
+                if not isinstance(record, dict):
+                    continue
+                previous = seen.get(job_name) or {}
+                seconds = float(record.get("seconds", 0) or 0)
+                delta = seconds - float(previous.get("seconds", 0) or 0)
+                done = bool(record.get("done"))
+                queue_name = record.get("queue") or "img_queue"
+                if delta > 0:
+                    self._charge_runtime(queue_name, job_name, delta)
+                if done and (delta > 0 or not previous.get("done")):
+                    self._finish_runtime(job_name)
+                if delta > 0 or done != bool(previous.get("done")):
+                    seen[job_name] = {
+                        "seconds": max(seconds, float(previous.get("seconds", 0) or 0)),
+                        "done": done,
+                    }
+                    seen.move_to_end(job_name)
+            while len(seen) > seen_limit:
+                seen.popitem(last=False)
+
+    def _runtime_weight(self, bucket):
+        classifier = self._get_classifier(self._load_weights())
+        return max(1, int(classifier.weight_of(bucket)))
+
+    def _charge_runtime(self, queue_name, job_name, seconds):
+        pending = self.runtime_pending.get(job_name)
+        if pending:
+            bucket = pending["bucket"]
+            queue_name = pending["queue"]
+            credit = min(seconds, pending["remaining"])
+            pending["remaining"] -= credit
+            pending["actual"] = pending.get("actual", 0.0) + seconds
+        else:
+            bucket = self.job_bucket(job_name)
+            credit = 0.0
+        weight = self._runtime_weight(bucket)
+        queue_vr = self.vruntime.setdefault(queue_name, {})
+        queue_vr[bucket] = queue_vr.get(bucket, 0.0) + (seconds - credit) / weight
+        queue_rt = self.bucket_runtime.setdefault(queue_name, {})
+        queue_rt[bucket] = queue_rt.get(bucket, 0.0) + seconds
+        self.runtime_state_dirty = True
+
+    def _finish_runtime(self, job_name):
+        pending = self.runtime_pending.pop(job_name, None)
+        if not pending:
+            return
+        self.runtime_finished[job_name] = time.time()
+        while len(self.runtime_finished) > self.config.get("runtime_pending_limit", 5000):
+            self.runtime_finished.popitem(last=False)
+        queue_name = pending["queue"]
+        bucket = pending["bucket"]
+        weight = self._runtime_weight(bucket)
+        queue_vr = self.vruntime.setdefault(queue_name, {})
+        queue_vr[bucket] = queue_vr.get(bucket, 0.0) - pending["remaining"] / weight
+        actual = pending.get("actual", 0.0)
+        if actual > 0 and pending.get("cost"):
+            sample = actual / pending["cost"]
+            previous = self.sec_per_unit.get(queue_name)
+            self.sec_per_unit[queue_name] = (
+                sample if previous is None else 0.8 * previous + 0.2 * sample
+            )
+            bucket_rates = self.bucket_sec_per_unit.setdefault(queue_name, {})
+            previous = bucket_rates.get(bucket)
+            bucket_rates[bucket] = (
+                sample if previous is None else 0.8 * previous + 0.2 * sample
+            )
+        self.runtime_state_dirty = True
+
+    def _charge_dispatch_runtime(self, queue_name, job_name, bucket, cost):
+        self._restore_runtime_state()
+        if job_name in self.runtime_pending:
+            self._finish_runtime(job_name)
+        estimate = cost * self.sec_per_unit.get(
+            queue_name, self._settings_value("vruntime_default_seconds", 60)
+        )
+        weight = self._runtime_weight(bucket)
+        queue_vr = self.vruntime.setdefault(queue_name, {})
+        queue_vr[bucket] = queue_vr.get(bucket, 0.0) + estimate / weight
+        self.runtime_pending[job_name] = {
+            "queue": queue_name,
+            "bucket": bucket,
+            "cost": cost,
+            "remaining": estimate,
+            "actual": 0.0,
+            "dispatched_at": time.time(),
+        }
+        while len(self.runtime_pending) > self.config.get("runtime_pending_limit", 5000):
+            self.runtime_pending.popitem(last=False)
+        self.runtime_state_dirty = True
+
+    def _vruntime_pick(
+        self, queue_name, key_order, weight_of, head_of, admit=None, pick_of=None
+    ):
+        self._restore_runtime_state()
+        queue_vr = self.vruntime.setdefault(queue_name, {})
+        heads = {}
+        for key in key_order:
+            if int(weight_of(key)) <= 0:
+                continue
+            name = head_of(key)
+            if name is not None:
+                heads[key] = name
+        if not heads:
+            return None
+        floor = self.vruntime_floor.get(queue_name, 0.0)
+        previous = self.vruntime_active.get(queue_name, set())
+        for key in heads:
+            if key not in previous:
+                queue_vr[key] = max(queue_vr.get(key, 0.0), floor)
+        admitted = [k for k in heads if admit is None or admit(k)]
+        if not admitted:
+            self.vruntime_active[queue_name] = set(heads)
+            return None
+        best = min(admitted, key=lambda k: (queue_vr.get(k, 0.0), key_order.index(k)))
+        self.vruntime_floor[queue_name] = max(floor, queue_vr.get(best, 0.0))
+        self.vruntime_active[queue_name] = set(heads)
+        self.runtime_state_dirty = True
+        self.logger(
+            f"DEBUG: VRuntime State - Bucket: {best}, "
+            f"VRuntime: {queue_vr.get(best, 0.0):.1f}, Active: {len(heads)}"
+        )
+        return best, pick_of(best) if pick_of else heads[best]
 
     def _safe_move_dir(self, src, dst):
         if os.path.exists(dst):
@@ -22,221 +1567,1424 @@ class FleetDispatcher:
                 os.remove(dst)
         shutil.move(src, dst)
 
-    def _load_weights(self):
+    def _load_settings(self):
         root = self.config.get("syncthing_root") or "~/RenderFleet"
         root = os.path.abspath(os.path.expanduser(root))
         settings_path = os.path.join(root, "_system", "settings.json")
-        weights_cfg = self.config.get("weights", {}) or {}
-        if os.path.exists(settings_path):
-            try:
-                with open(settings_path, "r", encoding="utf-8") as f:
-                    settings = json.load(f)
-                if isinstance(settings, dict) and "weights" in settings:
-                    weights_cfg = settings.get("weights", weights_cfg) or weights_cfg
-            except (OSError, json.JSONDecodeError):
-                pass
+        try:
+            st = os.stat(settings_path)
+            settings_stat = (settings_path, st.st_mtime_ns, st.st_size)
+        except OSError:
+            self.settings_cache = {}
+            self.settings_cache_stat = None
+            return self.settings_cache
+        if self.settings_cache_stat == settings_stat:
+            return self.settings_cache
+        try:
+            with open(settings_path, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.settings_cache_stat = None
+            return self.settings_cache
+        self.settings_cache = settings if isinstance(settings, dict) else {}
+        self.settings_cache_stat = settings_stat
+        return self.settings_cache
+
+    def _settings_value(self, name, default=None):
+        settings = self._load_settings()
+        if name in settings:
+            return settings[name]
+        return self.config.get(name, default)
+
+    def _load_weights(self):
+        settings = self._load_settings()
+        settings_stat = self.settings_cache_stat
+        if (
+            settings_stat is not None
+            and self.weights_cache is not None
+            and self.weights_cache_stat == settings_stat
+        ):
+            return self.weights_cache
+        weights_cfg = dict(self.config.get("weights", {}) or {})
+        if "weights" in settings:
+            weights_cfg = dict(settings.get("weights", weights_cfg) or weights_cfg)
         if "default" not in weights_cfg:
             weights_cfg["default"] = 1
+        self.weights_cache = weights_cfg if settings_stat is not None else None
+        self.weights_cache_stat = settings_stat
         return weights_cfg
 
-    def check_dead_workers(self, heartbeat_dir, active_floor_path, job_queue_path):
-        hb_files = []
+    def dead_workers(self, registry, statuses=("BUSY",)):
+        now = time.time()
+        threshold = float(self._settings_value("phi_threshold", 8.0))
+        min_samples = int(self._settings_value("phi_min_samples", 5))
+        # Syncthing delivery routinely lags heartbeats by tens of seconds, so the
+        # spread floor and silence floor have to cover that jitter.
+        min_std = float(self._settings_value("phi_min_std", 15))
+        min_silence = float(self._settings_value("phi_min_silence", 180))
+        leased_silence = float(self._settings_value("phi_leased_min_silence", 30))
+        leases = self._settings_value("job_leases", False)
+        pause = float(self._settings_value("phi_acceptable_pause", 10))
+        fallback = self._settings_value("dead_worker_seconds", 180)
+        dead = []
+        for data in [d for status in statuses for d in registry.with_status(status)]:
+            worker_id = data.get("worker_id")
+            phi = registry.phi(
+                worker_id, now=now, min_samples=min_samples, min_std=min_std, pause=pause
+            )
+            if phi is None:
+                ts = data.get("timestamp")
+                if not isinstance(ts, int) or now - ts <= fallback:
+                    continue
+                reason = f"no heartbeat for {int(now - ts)}s"
+            else:
+                silence = registry.silence(worker_id, now=now)
+                floor = min_silence
+                job = str(data.get("current_job") or "").split("/")[0]
+                if leases and job and os.path.exists(self._lease_path(job)):
+                    # A leased job cannot be started twice, so recover it sooner.
+                    floor = leased_silence
+                if phi < threshold or silence < floor:
+                    continue
+                reason = f"phi {phi:.1f} after {silence:.0f}s of silence"
+            dead.append((data, reason))
+        return dead
+
+    def stranded_workers(self, registry, worker_ids):
+        now = time.time()
+        starting_grace = self._settings_value("starting_grace_seconds", 300)
+        paused_grace = self._settings_value("paused_grace_seconds", 600)
+        # Same window as the dead-worker fallback, measured from when this lead saw
+        # the worker, so a fresh lead or a slow sync does not empty healthy inboxes.
+        silent_grace = self._settings_value("dead_worker_seconds", 180)
+        stranded = {
+            data["worker_id"]: reason
+            for data, reason in self.dead_workers(registry, statuses=("BUSY", "IDLE"))
+        }
+        for worker_id in worker_ids:
+            data = registry.get(worker_id)
+            status = data.get("status") if data else None
+            if status != "PAUSED":
+                self.paused_since.pop(worker_id, None)
+            if data is not None:
+                self.missing_since.pop(worker_id, None)
+            if worker_id in stranded:
+                continue
+            if data is None:
+                missing = now - self.missing_since.setdefault(worker_id, now)
+                if missing > silent_grace:
+                    stranded[worker_id] = f"no heartbeat on record for {int(missing)}s"
+                continue
+            ts = data.get("timestamp")
+            age = now - ts if isinstance(ts, int) else 0
+            if status == "OFFLINE":
+                silence = registry.silence(worker_id, now=now) or 0
+                if silence > silent_grace:
+                    stranded[worker_id] = f"worker OFFLINE for {int(silence)}s"
+            elif status == "STARTING" and age > starting_grace:
+                stranded[worker_id] = f"stuck in STARTING for {int(age)}s"
+            elif status == "PAUSED":
+                since = self.paused_since.setdefault(worker_id, now)
+                if now - since > paused_grace:
+                    stranded[worker_id] = f"paused for {int(now - since)}s"
+        return stranded
+
+    def _carry_progress(self, progress_path, worker_id, existing_path=None):
+        progress = {}
+        for path in (existing_path, progress_path):
+            if not path:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if not isinstance(data, dict):
+                continue
+            completed = list(progress.get("completed_files", []))
+            for name in data.get("completed_files", []):
+                if name not in completed:
+                    completed.append(name)
+            progress.update(data)
+            progress["completed_files"] = completed
+        if not progress:
+            return
+        progress.update(
+            status="requeued", requeued_from=worker_id, requeued_at=int(time.time())
+        )
+        try:
+            write_json_atomic(progress_path, progress)
+        except OSError as e:
+            self.logger(f"⚠️ Could not update {progress_path}: {e}")
+
+    def recover_stranded_jobs(
+        self, heartbeat_dir, active_floor_path, img_queue_path, vid_queue_path
+    ):
+        registry = self.get_heartbeat_registry(heartbeat_dir)
+        try:
+            worker_ids = sorted(
+                name
+                for name in os.listdir(active_floor_path)
+                if os.path.isdir(os.path.join(active_floor_path, name, "inbox"))
+            )
+        except OSError:
+            return 0
+        if self._shard_mode():
+            worker_ids = [w for w in worker_ids if self._owns_for_recovery(registry, w)]
+        recovered = 0
+        for worker_id, reason in sorted(self.stranded_workers(registry, worker_ids).items()):
+            inbox_path = os.path.join(active_floor_path, worker_id, "inbox")
+            try:
+                entries = sorted(e for e in os.listdir(inbox_path) if not e.startswith("."))
+            except OSError:
+                continue
+            for entry in entries:
+                job_path = os.path.join(inbox_path, entry)
+                if self._requeue_job(worker_id, job_path, img_queue_path, vid_queue_path):
+                    recovered += 1
+                    self.logger(
+                        f"Recovered job {entry} from worker {worker_id} ({reason})"
+                    )
+        return recovered
+
+    def _owns_for_recovery(self, registry, worker_id):
+        lead_queue = "vid_queue" if self.config.get("initial_role") == "vid_lead" else "img_queue"
+        data = registry.get(worker_id) or {}
+        worker_queue = "vid_queue" if str(data.get("role", "")).startswith("vid") else "img_queue"
+        return worker_queue == lead_queue and self.owns_worker(worker_id, lead_queue)
+
+    def _requeue_job(self, worker_id, job_path, img_queue_path, vid_queue_path):
+        entry = os.path.basename(job_path)
+        is_dir = os.path.isdir(job_path)
+        if not (is_dir or os.path.isfile(job_path)):
+            return False
+        job_queue_path = vid_queue_path if is_dir else img_queue_path
+        dest = os.path.join(job_queue_path, entry)
+        try:
+            os.makedirs(job_queue_path, exist_ok=True)
+            if is_dir:
+                existing = os.path.join(dest, "progress.json")
+                self._carry_progress(
+                    os.path.join(job_path, "progress.json"),
+                    worker_id,
+                    existing if os.path.exists(existing) else None,
+                )
+                self._safe_move_dir(job_path, dest)
+            else:
+                self._carry_progress(
+                    self.get_sys_path(
+                        os.path.join(
+                            "03_review_room", os.path.splitext(entry)[0], "progress.json"
+                        )
+                    ),
+                    worker_id,
+                )
+                if os.path.exists(dest):
+                    os.remove(dest)
+                shutil.move(job_path, dest)
+        except OSError:
+            return False
+        self.get_queue_index(job_queue_path).add(entry)
+        self._drop_lease(entry)
+        return True
+
+    def _lease_path(self, job_name):
+        return self.get_sys_path(os.path.join("_system", "leases", f"{job_name}.json"))
+
+    def _lease_seconds(self, job_name):
+        # Renewal rides on heartbeats (every 10s) delivered through Syncthing, so a
+        # shorter lease could lapse between two renewals of a live worker.
+        try:
+            floor = float(self._settings_value("lease_min_seconds", 60))
+        except (TypeError, ValueError):
+            floor = 60.0
+        manifest = self.get_manifest_store().get(job_name)
+        for value in (
+            manifest.get("lease_seconds") if manifest else None,
+            self._settings_value("lease_seconds", 120),
+        ):
+            try:
+                if value is not None and float(value) > 0:
+                    return max(float(value), floor)
+            except (TypeError, ValueError):
+                continue
+        return max(120.0, floor)
+
+    def grant_lease(self, job_name, worker_id, queue_name):
+        if not self._settings_value("job_leases", False):
+            return None
+        now = time.time()
+        ttl = self._lease_seconds(job_name)
+        lease = {
+            "job": job_name,
+            "lease_id": uuid.uuid4().hex,
+            "worker_id": worker_id,
+            "queue": queue_name,
+            "ttl": ttl,
+            "granted_at": int(now),
+            "expires_at": int(now + ttl),
+        }
+        write_json_atomic(self._lease_path(job_name), lease)
+        return lease
+
+    def _drop_lease(self, job_name):
+        try:
+            os.remove(self._lease_path(job_name))
+        except OSError:
+            pass
+
+    def reload_shared_state(self, queue_path):
+        queue_key = os.path.abspath(queue_path)
+        self.scheduler_state_loaded = {
+            key
+            for key in self.scheduler_state_loaded
+            if key != queue_key and not key.startswith(f"{queue_key}#")
+        }
+        if not self.runtime_state_dirty:
+            self.runtime_state_loaded = False
+
+    def _claim_path(self, job_name):
+        return self.get_sys_path(os.path.join("_system", "claims", f"{job_name}.json"))
+
+    def claim_next_job(self, queue_path, worker_id):
+        inbox_path = self.get_sys_path(os.path.join("02_active_floor", worker_id, "inbox"))
+        os.makedirs(inbox_path, exist_ok=True)
+        queue_name = os.path.basename(os.path.abspath(queue_path))
+        target_type = "vid" if queue_name == "vid_queue" else "img"
+        # Health is scored by the lead; re-read its latest verdict.
+        self.worker_health = None
+        self._load_worker_health()
+        if self.health_state(worker_id) == "quarantined":
+            self.logger(f"DEBUG: Not claiming for {worker_id}; quarantined for poor health.")
+            return None
+        if worker_id not in self._resource_admit([worker_id], target_type):
+            return None
+        placeable = None
+        if self._placement_constrained([worker_id], target_type):
+            placeable = lambda name: self._can_run(worker_id, name, target_type)
+        index = self.get_queue_index(queue_path)
+        rescanned = False
+        for _attempt in range(int(self._settings_value("claim_attempts", 5))):
+            self.reload_shared_state(queue_path)
+            job_path = self.get_next_job(
+                queue_path, self.config.get("weights", {}), placeable=placeable
+            )
+            if not job_path:
+                if rescanned:
+                    return None
+                # Jobs synced in since the last periodic rescan; only pay for a full
+                # scan when the index comes up empty.
+                index.reconcile()
+                rescanned = True
+                continue
+            filename = os.path.basename(job_path)
+            dest = os.path.join(inbox_path, filename)
+            if os.path.exists(dest):
+                self.refund_dispatch(job_path)
+                index.discard(filename)
+                continue
+            try:
+                # rename is atomic: of several local claimers exactly one succeeds.
+                os.rename(job_path, dest)
+            except FileNotFoundError:
+                self.refund_dispatch(job_path)
+                index.discard(filename)
+                self.logger(f"DEBUG: Lost claim race for {filename}; retrying.")
+                continue
+            except OSError as e:
+                self.refund_dispatch(job_path)
+                self.logger(f"❌ CLAIM ERROR: Failed to claim {filename}. Reason: {e}")
+                return None
+            index.discard(filename)
+            now = time.time()
+            try:
+                write_json_atomic(
+                    self._claim_path(filename),
+                    {
+                        "job": filename,
+                        "worker_id": worker_id,
+                        "claim_id": uuid.uuid4().hex,
+                        "queue": queue_name,
+                        "claimed_at": now,
+                    },
+                )
+                self.grant_lease(filename, worker_id, queue_name)
+            except OSError as e:
+                self.logger(f"⚠️ Could not record claim for {filename}: {e}")
+            self.last_assigned[worker_id] = now
+            self.runtime_state_dirty = True
+            self.save_scheduler_state()
+            self.logger(f"CMD: {worker_id} claimed {filename}")
+            return dest
+        return None
+
+    def claim_winner(self, job_name):
+        claims_dir = self.get_sys_path(os.path.join("_system", "claims"))
+        conflict_prefix = f"{job_name}.sync-conflict-"
         try:
-            hb_files = [
-                os.path.join(heartbeat_dir, f)
-                for f in os.listdir(heartbeat_dir)
-                if f.endswith(".json")
+            names = [
+                name
+                for name in os.listdir(claims_dir)
+                if name == f"{job_name}.json"
+                or (name.startswith(conflict_prefix) and name.endswith(".json"))
             ]
         except OSError:
-            hb_files = []
+            return None
+        claims = []
+        for name in names:
+            try:
+                with open(os.path.join(claims_dir, name), "r", encoding="utf-8") as f:
+                    claim = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if isinstance(claim, dict) and claim.get("worker_id"):
+                claims.append((float(claim.get("claimed_at") or 0), claim["worker_id"]))
+        # Every node sees the same set after sync, so earliest-claim-wins is agreed on.
+        return min(claims)[1] if claims else None
 
-        now = int(time.time())
-        for hb_path in hb_files:
+    def prune_claims(self, max_age=600):
+        claims_dir = self.get_sys_path(os.path.join("_system", "claims"))
+        try:
+            with os.scandir(claims_dir) as it:
+                entries = [e for e in it if e.name.endswith(".json")]
+        except OSError:
+            return 0
+        now = time.time()
+        pruned = 0
+        for entry in entries:
             try:
-                with open(hb_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
+                if now - entry.stat().st_mtime < max_age:
+                    continue
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    claim = json.load(f)
             except (OSError, json.JSONDecodeError):
+                claim = None
+            if isinstance(claim, dict) and claim.get("worker_id") and claim.get("job"):
+                held = self.get_sys_path(
+                    os.path.join("02_active_floor", claim["worker_id"], "inbox", claim["job"])
+                )
+                if os.path.exists(held):
+                    continue
+            try:
+                os.remove(entry.path)
+                pruned += 1
+            except OSError:
+                pass
+        return pruned
+
+    def reclaim_expired_leases(self, queue_name):
+        if not self._settings_value("job_leases", False):
+            return 0
+        lease_dir = self.get_sys_path(os.path.join("_system", "leases"))
+        try:
+            with os.scandir(lease_dir) as it:
+                paths = [e.path for e in it if e.name.endswith(".json")]
+        except OSError:
+            paths = []
+        registry = self.get_heartbeat_registry()
+        renewals = {}
+        for data in registry.all():
+            held = data.get("leases")
+            if isinstance(held, dict):
+                for job_name, lease_id in held.items():
+                    renewals[(job_name, lease_id)] = data.get("worker_id")
+        img_queue = self.get_sys_path(os.path.join("01_job_factory", "img_queue"))
+        vid_queue = self.get_sys_path(os.path.join("01_job_factory", "vid_queue"))
+        now = time.time()
+        reclaimed = 0
+        for path in sorted(paths):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    lease = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if not isinstance(lease, dict) or lease.get("queue") != queue_name:
+                continue
+            job_name = lease.get("job")
+            worker_id = lease.get("worker_id")
+            if not job_name or not worker_id or not self.owns_worker(worker_id, queue_name):
+                continue
+            job_path = self.get_sys_path(
+                os.path.join("02_active_floor", worker_id, "inbox", job_name)
+            )
+            if not os.path.exists(job_path):
+                # Finished, yielded back or recovered: the lease has nothing left to guard.
+                self._drop_lease(job_name)
+                continue
+            ttl = self._lease_seconds(job_name)
+            expires_at = float(lease.get("expires_at") or 0)
+            if renewals.get((job_name, lease.get("lease_id"))) == worker_id:
+                seen = now - (registry.silence(worker_id, now=now) or 0)
+                if seen + ttl - expires_at >= ttl / 2:
+                    expires_at = seen + ttl
+                    lease.update(renewed_at=int(seen), expires_at=int(expires_at))
+                    try:
+                        write_json_atomic(path, lease)
+                    except OSError as e:
+                        self.logger(f"⚠️ Could not renew lease {job_name}: {e}")
+            if now <= expires_at:
+                continue
+            if self._requeue_job(worker_id, job_path, img_queue, vid_queue):
+                reclaimed += 1
+                self.logger(
+                    f"⏰ Lease on {job_name} held by {worker_id} expired "
+                    f"{now - expires_at:.0f}s ago; job requeued."
+                )
+        return reclaimed + self._settle_unleased_jobs(queue_name, registry, now)
+
+    def _settle_unleased_jobs(self, queue_name, registry, now):
+        # Jobs already in an inbox when leases were switched on, or whose lease was
+        # lost, would otherwise never start: the worker waits for a lease nobody grants.
+        grace = float(self._settings_value("lease_grace_seconds", 60))
+        roles = self._roles_for_queue(queue_name)
+        img_queue = self.get_sys_path(os.path.join("01_job_factory", "img_queue"))
+        vid_queue = self.get_sys_path(os.path.join("01_job_factory", "vid_queue"))
+        active_floor = self.get_sys_path("02_active_floor")
+        seen_since = self.unleased_since.get(queue_name, {})
+        unleased = {}
+        requeued = 0
+        for data in registry.all():
+            worker_id = data.get("worker_id")
+            if data.get("role") not in roles or not self.owns_worker(worker_id, queue_name):
                 continue
+            inbox_path = os.path.join(active_floor, worker_id, "inbox")
+            try:
+                entries = sorted(e for e in os.listdir(inbox_path) if not e.startswith("."))
+            except OSError:
+                continue
+            ts = data.get("timestamp")
+            live = (
+                data.get("status") in ("IDLE", "BUSY")
+                and isinstance(ts, int)
+                and now - ts < 90
+            )
+            for entry in entries:
+                if os.path.exists(self._lease_path(entry)):
+                    continue
+                key = (worker_id, entry)
+                since = seen_since.get(key, now)
+                if now - since < grace:
+                    unleased[key] = since
+                    continue
+                if live:
+                    try:
+                        self.grant_lease(entry, worker_id, queue_name)
+                    except OSError as e:
+                        self.logger(f"⚠️ Could not lease {entry} to {worker_id}: {e}")
+                        unleased[key] = since
+                        continue
+                    self.logger(
+                        f"🔏 Granted lease on {entry} to {worker_id}; "
+                        f"it sat unleased for {now - since:.0f}s."
+                    )
+                elif self._requeue_job(
+                    worker_id, os.path.join(inbox_path, entry), img_queue, vid_queue
+                ):
+                    self.logger(f"⏰ Unleased job {entry} requeued from {worker_id}.")
+                    requeued += 1
+        self.unleased_since[queue_name] = unleased
+        return requeued
+
+    def _get_idle_workers(self, target_type=None, include_self_id=False, local_worker_id=None):
+        registry = self.get_heartbeat_registry()
+        allowed_roles = None
+        if target_type == "img":
+            allowed_roles = {"img_worker", "img_lead"}
+        elif target_type == "vid":
+            allowed_roles = {"vid_worker", "vid_lead"}
+
+        idle_workers = [
+            worker_id
+            for role, workers in registry.idle_by_role(max_age=90).items()
+            if allowed_roles is None or role in allowed_roles
+            for worker_id in workers
+        ]
+
+        if include_self_id or local_worker_id:
+            self_id = local_worker_id or self.config.get("worker_id")
+            self_role = self.config.get("initial_role")
+            self_status = self.config.get("last_status")
+            if (
+                self_id
+                and self_id not in idle_workers
+                and self_status == "IDLE"
+                and (allowed_roles is None or self_role in allowed_roles)
+            ):
+                idle_workers.append(self_id)
+
+        self._restore_runtime_state()
+        idle_workers.sort(key=lambda w: (self.last_assigned.get(w, 0), w))
+        self.logger(
+            f"DEBUG: Active idle workers within 90s window: {len(idle_workers)}"
+        )
+        return idle_workers
+
+    def parse_priority(self, value):
+        if isinstance(value, bool) or value is None:
+            return None
+        if isinstance(value, (int, float)):
+            priority = int(value)
+        elif isinstance(value, str):
+            text = value.strip().lower()
+            if text in ("vip", "urgent"):
+                return 0
+            if text.startswith("p"):
+                text = text[1:]
+            try:
+                priority = int(text)
+            except ValueError:
+                return None
+        else:
+            return None
+        classes = int(self.config.get("priority_classes", PRIORITY_CLASSES))
+        return min(max(priority, 0), classes - 1)
+
+    def _default_priority(self):
+        return self.parse_priority(
+            self._settings_value("default_priority_class", DEFAULT_PRIORITY_CLASS)
+        )
+
+    def job_priority(self, name):
+        manifest = self.get_manifest_store().get(name)
+        if manifest and manifest.get("priority") is not None:
+            priority = self.parse_priority(manifest.get("priority"))
+            if priority is not None:
+                return priority
+        # Names are free text; only an explicit _PRIO<n> suffix (like _VIP) sets a class.
+        match = PRIORITY_MARKER_PATTERN.search(os.path.splitext(name)[0])
+        if match:
+            priority = self.parse_priority(int(match.group(1)))
+            if priority is not None:
+                return priority
+        if VIP_PATTERN.search(name):
+            return 0
+        return self._default_priority()
+
+    def _class_state_key(self, queue_key, priority):
+        if priority == self._default_priority():
+            return queue_key
+        return f"{queue_key}#P{priority}"
+
+    def _class_rate_limit(self, priority):
+        limits = self._settings_value("priority_rate_limits") or {}
+        if not isinstance(limits, dict):
+            return None
+        limit = limits.get(f"P{priority}", limits.get(str(priority)))
+        if isinstance(limit, (int, float)) and limit > 0:
+            return limit
+        return None
+
+    def _class_rate_limited(self, queue_key, priority):
+        limit = self._class_rate_limit(priority)
+        if limit is None:
+            return False
+        recent = self.class_dispatches.get((queue_key, priority))
+        if not recent:
+            return False
+        cutoff = time.time() - 60
+        while recent and recent[0] < cutoff:
+            recent.popleft()
+        return len(recent) >= limit
+
+    def _note_class_dispatch(self, queue_key, priority):
+        if self._class_rate_limit(priority) is None:
+            return
+        recent = self.class_dispatches.setdefault((queue_key, priority), deque())
+        recent.append(time.time())
+
+    def _concurrency_caps(self):
+        caps = self._settings_value("max_concurrent") or {}
+        if not isinstance(caps, dict):
+            return {}
+        return {
+            key: int(cap)
+            for key, cap in caps.items()
+            if isinstance(cap, (int, float)) and not isinstance(cap, bool) and cap >= 0
+        }
+
+    def count_running_buckets(self):
+        registry = self.get_heartbeat_registry()
+        now = int(time.time())
+        jobs = set()
+        active_floor = self.get_sys_path("02_active_floor")
+        for record in registry.all():
+            ts = record.get("timestamp")
+            if not isinstance(ts, int) or now - ts >= 90:
+                continue
+            if record.get("status") == "BUSY" and record.get("current_job"):
+                jobs.add(str(record["current_job"]).split("/")[0])
+            inbox_path = os.path.join(active_floor, str(record.get("worker_id")), "inbox")
+            try:
+                jobs.update(n for n in os.listdir(inbox_path) if not n.startswith("."))
+            except OSError:
+                continue
+        counts = {}
+        for job in jobs:
+            bucket = self.job_bucket(job)
+            counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def _concurrency_admit(self):
+        caps = self._concurrency_caps()
+        if not caps:
+            return None
+        running = self.running_buckets
+        if running is None:
+            running = self.count_running_buckets()
+        tree = self.weight_tree
+        node_running = {}
+        for bucket, count in running.items():
+            for node in tree.prefixes.get(bucket, tree.prefixes["default"])[1:]:
+                node_running[node] = node_running.get(node, 0) + count
+        full = {
+            node
+            for node in tree.weights
+            if node[-1] in caps and node_running.get(node, 0) >= caps[node[-1]]
+        }
+        if full:
+            self.logger(
+                "DEBUG: Concurrency caps reached for "
+                + ", ".join(sorted("/".join(node) for node in full))
+            )
+        return lambda node: node not in full
+
+    def _prepare_index(self, queue_path):
+        index = self.get_queue_index(queue_path)
+        weights_cfg = self._load_weights()
+        classifier = self._get_classifier(weights_cfg)
+        index.set_classifier(
+            (self.classifier_signature, self._default_priority()),
+            self.job_bucket,
+            self.job_priority,
+            self._default_priority(),
+        )
+        changed = self.get_manifest_store().take_changes(index.queue_path)
+        if changed:
+            index.reclassify(changed)
+        index.maybe_reconcile()
+        return index, weights_cfg, classifier
+
+    def get_next_job(
+        self,
+        queue_path,
+        config_weights,
+        job_filter=None,
+        min_priority=None,
+        placeable=None,
+    ):
+        self.logger(f"DEBUG: Scanning queue at {queue_path}")
+        index, weights_cfg, classifier = self._prepare_index(queue_path)
+
+        if not len(index):
+            self.logger("DEBUG: Queue empty (0 valid jobs found).")
+            return None
+
+        key_order = self._get_weight_tree(weights_cfg).key_order()
+
+        admit_node = self._concurrency_admit()
+        vip_class = self._vip_class()
+        queue_key = index.queue_path
+        priorities = index.priorities()
+        limited = [p for p in priorities if self._class_rate_limited(queue_key, p)]
+        for priority in [p for p in priorities if p not in limited] + limited:
+            if min_priority is not None and priority < min_priority:
+                continue
+            if priority in limited:
+                self.logger(
+                    f"DEBUG: Class P{priority} is over its rate limit; "
+                    "serving it because no other class has work."
+                )
+            class_filter = job_filter if priority > vip_class else None
+            if placeable is not None:
+                class_filter = (
+                    placeable
+                    if class_filter is None
+                    else lambda name, f=class_filter: f(name) and placeable(name)
+                )
+            selected = self._select_in_class(
+                index,
+                classifier,
+                key_order,
+                queue_key,
+                priority,
+                admit_node,
+                class_filter,
+            )
+            if selected is None:
+                continue
+            self._note_class_dispatch(queue_key, priority)
+            self.last_pick["job"] = selected[1]
+            self.last_pick["priority"] = priority
+            if self._settings_value("scheduler_mode", "drr") == "vruntime":
+                self._charge_dispatch_runtime(
+                    os.path.basename(queue_key),
+                    selected[1],
+                    selected[0],
+                    self.job_cost(os.path.join(index.queue_path, selected[1])),
+                )
+                self.last_pick["runtime"] = True
+            self.logger(f"DEBUG: Selected job: {selected[1]} (P{priority})")
+            self._record_queue_wait(index, selected[1])
+            return os.path.join(index.queue_path, selected[1])
+        return None
+
+    def refund_dispatch(self, job_path):
+        pick = self.last_pick
+        self.last_pick = None
+        if not pick or pick.get("job") != os.path.basename(job_path):
+            return
+        state_key = pick["state_key"]
+        self.deficits[state_key] = pick["deficits"]
+        self.current_index[state_key] = pick["index"]
+        self.tree_state[state_key] = pick["tree"]
+        self.scheduler_state_dirty.add(state_key)
+        recent = self.class_dispatches.get((pick["queue_key"], pick["priority"]))
+        if recent:
+            recent.pop()
+        pending = self.runtime_pending.pop(pick["job"], None) if pick.get("runtime") else None
+        if pending:
+            queue_vr = self.vruntime.setdefault(pending["queue"], {})
+            bucket = pending["bucket"]
+            queue_vr[bucket] = (
+                queue_vr.get(bucket, 0.0) - pending["remaining"] / self._runtime_weight(bucket)
+            )
+            self.runtime_state_dirty = True
+        self.logger(f"DEBUG: Refunded the dispatch charge for {pick['job']}.")
+
+    def _select_in_class(
+        self,
+        index,
+        classifier,
+        key_order,
+        queue_key,
+        priority,
+        admit_node=None,
+        job_filter=None,
+    ):
+        state_key = self._class_state_key(queue_key, priority)
+        self._restore_scheduler_state(state_key)
+        if state_key not in self.deficits:
+            self.deficits[state_key] = {}
+        if state_key not in self.current_index:
+            self.current_index[state_key] = 0
+        previous_order = self.restored_key_order.get(state_key)
+        if previous_order and previous_order != key_order:
+            previous_idx = self.current_index[state_key] % len(previous_order)
+            previous_key = previous_order[previous_idx]
+            self.current_index[state_key] = (
+                key_order.index(previous_key) if previous_key in key_order else 0
+            )
+        self.restored_key_order[state_key] = key_order
+        self.scheduler_state_dirty.add(state_key)
+        # Remember the credit before charging so a failed move can be refunded.
+        self.last_pick = {
+            "queue_key": queue_key,
+            "state_key": state_key,
+            "deficits": dict(self.deficits[state_key]),
+            "index": self.current_index[state_key],
+            "tree": {
+                level: {"deficits": dict(item["deficits"]), "next": item["next"]}
+                for level, item in self.tree_state.get(state_key, {}).items()
+            },
+        }
+
+        prefixes = self.weight_tree.prefixes
+        scan_depth = self.config.get("reserve_scan_depth", 32)
+        admit = None
+        tree_admit = None
+        if admit_node is not None or job_filter is not None:
+
+            def has_match(bucket):
+                if job_filter is None or not index.count(bucket, priority):
+                    return True
+                return index.find(bucket, job_filter, priority, scan_depth) is not None
+
+            admit = lambda bucket: (
+                admit_node is None
+                or all(admit_node(node) for node in prefixes.get(bucket, [])[1:])
+            ) and has_match(bucket)
+            tree_admit = lambda node: (admit_node is None or admit_node(node)) and (
+                node in self.weight_tree.groups or has_match(node[-1])
+            )
+
+        def pick_of(bucket):
+            if job_filter is None:
+                return index.peek(bucket, priority)
+            return index.find(bucket, job_filter, priority, scan_depth)
+
+        head_of = lambda bucket: pick_of(bucket) if admit is None or admit(bucket) else None
+        count_of = lambda bucket: index.count(bucket, priority)
+        cost_of = None
+        if self._settings_value("drr_cost_mode", "count") == "cost":
+            cost_of = lambda name: self.job_cost(os.path.join(index.queue_path, name))
+
+        vruntime_mode = self._settings_value("scheduler_mode", "drr") == "vruntime"
+        tree = self.weight_tree if self.weight_tree.nested and not vruntime_mode else None
+        queue_name = os.path.basename(queue_key)
+        selected = None
+        if self._settings_value("edf_mode", False):
+            selected = self._pick_deadline(index, queue_name, priority, admit, job_filter)
+        if selected is None:
+            selected = self._pick_aged(head_of, index, key_order)
+        if selected is not None:
+            if tree is not None:
+                cost = self.job_cost(os.path.join(index.queue_path, selected[1]))
+                self._charge_tree(state_key, tree, selected[0], cost if cost_of else 1)
+            elif not vruntime_mode:
+                cost = self.job_cost(os.path.join(index.queue_path, selected[1]))
+                deficits = self.deficits[state_key]
+                deficits[selected[0]] = max(
+                    0, deficits.get(selected[0], 0) - (cost if cost_of else 1)
+                )
+            return selected
+        if vruntime_mode:
+            return self._vruntime_pick(
+                queue_name,
+                key_order,
+                classifier.weight_of,
+                lambda bucket: index.peek(bucket, priority),
+                admit=admit,
+                pick_of=pick_of,
+            )
+        if tree is not None:
+            return self._tree_pick(
+                state_key,
+                tree,
+                index,
+                priority,
+                pick_of,
+                cost_of=cost_of,
+                admit_node=tree_admit,
+            )
+        return self._drr_pick(
+            state_key,
+            key_order,
+            classifier.weight_of,
+            pick_of,
+            count_of,
+            cost_of=cost_of,
+            queue_size=len(index),
+            admit=admit,
+        )
+
+    def get_manifest_store(self):
+        if self.manifest_store is None:
+            manifest_dir = self.config.get("manifest_path") or os.path.join(
+                "01_job_factory", "manifests"
+            )
+            self.manifest_store = ManifestStore(
+                self.get_sys_path(manifest_dir),
+                refresh_interval=self.config.get("manifest_refresh_interval", 5.0),
+            )
+        return self.manifest_store
+
+    def _roles_for_queue(self, queue_name):
+        if queue_name == "vid_queue":
+            return {"vid_worker", "vid_lead"}
+        return {"img_worker", "img_lead"}
+
+    def _shard_mode(self):
+        mode = self._settings_value("lead_sharding")
+        return mode if mode in ("workers", "buckets") else None
+
+    def _lead_ring(self, queue_name):
+        registry = self.get_heartbeat_registry()
+        cached = self.rings.get(queue_name)
+        if cached is not None and cached[0] == registry.last_refresh:
+            return cached[1]
+        ring = None
+        if self._shard_mode():
+            lead_role = "vid_lead" if queue_name == "vid_queue" else "img_lead"
+            now = int(time.time())
+            leads = {
+                data["worker_id"]
+                for data in registry.all()
+                if data.get("role") == lead_role
+                and data.get("status") != "OFFLINE"
+                and isinstance(data.get("timestamp"), int)
+                and now - data["timestamp"] < 90
+            }
+            self_id = self.config.get("worker_id")
+            if self_id and self.config.get("initial_role") == lead_role:
+                leads.add(self_id)
+            members = tuple(sorted(leads))
+            previous = self.ring_leads.get(queue_name)
+            if previous is None or previous[0] != members:
+                self.logger(f"🔀 {queue_name} lead shards: {', '.join(members) or 'none'}")
+                try:
+                    replicas = max(1, int(self._settings_value("ring_replicas", 64)))
+                except (TypeError, ValueError):
+                    replicas = 64
+                previous = (members, HashRing(members, replicas=replicas))
+                self.ring_leads[queue_name] = previous
+            if len(members) > 1:
+                ring = previous[1]
+        self.rings[queue_name] = (registry.last_refresh, ring)
+        return ring
+
+    def owns_worker(self, worker_id, queue_name):
+        ring = self._lead_ring(queue_name)
+        return ring is None or ring.owner(f"worker:{worker_id}") == self.config.get("worker_id")
+
+    def owns_job(self, job_name, queue_name):
+        ring = self._lead_ring(queue_name)
+        if ring is None:
+            return True
+        if self._shard_mode() == "buckets":
+            key = f"bucket:{self.job_bucket(job_name)}"
+        else:
+            key = f"job:{job_name}"
+        return ring.owner(key) == self.config.get("worker_id")
 
-            if not isinstance(data, dict):
-                continue
+    def _shard_stats_path(self):
+        return self.get_sys_path(
+            os.path.join("_system", "shards", f"{self.config.get('worker_id')}.json")
+        )
 
-            ts = data.get("timestamp")
-            status = data.get("status")
-            worker_id = data.get("worker_id")
-            if not worker_id or not isinstance(ts, int):
-                continue
+    def _shard_drift_window(self):
+        try:
+            return max(1.0, float(self._settings_value("shard_drift_window", 600)))
+        except (TypeError, ValueError):
+            return 600.0
 
-            if now - ts <= 180 or status != "BUSY":
-                continue
+    def _dispatch_units(self, queue_name, job_path):
+        # Measure service in the unit the scheduler balances, not in job counts.
+        if self._settings_value("scheduler_mode", "drr") == "vruntime":
+            return self.job_cost(job_path) * self.sec_per_unit.get(
+                queue_name, self._settings_value("vruntime_default_seconds", 60)
+            )
+        if self._settings_value("drr_cost_mode", "count") == "cost":
+            return self.job_cost(job_path)
+        return 1
 
-            inbox_path = os.path.join(active_floor_path, worker_id, "inbox")
-            try:
-                entries = sorted(os.listdir(inbox_path))
-            except OSError:
-                entries = []
+    def _sample_shard_backlog(self, queue_name, source_path):
+        index, _weights_cfg, _classifier = self._prepare_index(source_path)
+        backlogged = {
+            bucket
+            for priority in index.priorities()
+            for bucket, count in index.bucket_counts(priority).items()
+            if count > 0
+        }
+        now = time.time()
+        since = self.shard_backlog.get(queue_name, {})
+        self.shard_backlog[queue_name] = {b: since.get(b, now) for b in backlogged}
+        return set(since) != backlogged
 
-            for entry in entries:
-                job_path = os.path.join(inbox_path, entry)
-                if not (os.path.isfile(job_path) or os.path.isdir(job_path)):
-                    continue
-                is_dir = os.path.isdir(job_path)
-                is_file = os.path.isfile(job_path)
-                queue_name = os.path.basename(job_queue_path)
-                if is_dir and queue_name != "vid_queue":
-                    continue
-                if is_file and queue_name != "img_queue":
-                    continue
-                try:
-                    os.makedirs(job_queue_path, exist_ok=True)
-                    dest = os.path.join(job_queue_path, entry)
-                    if os.path.exists(dest):
-                        if os.path.isdir(dest):
-                            shutil.rmtree(dest)
-                        else:
-                            os.remove(dest)
-                    if is_dir:
-                        self._safe_move_dir(job_path, dest)
-                    else:
-                        shutil.move(job_path, dest)
-                    self.logger(f"Recovered job {entry} from dead worker {worker_id}")
-                except OSError:
-                    continue
+    def _record_shard_dispatch(self, queue_name, bucket, units):
+        counts = self.shard_dispatched.setdefault(queue_name, {})
+        counts[bucket] = counts.get(bucket, 0) + 1
+        recent = self.shard_recent.setdefault(queue_name, deque())
+        recent.append([time.time(), bucket, units])
 
-    def _get_idle_workers(self, target_type=None, include_self_id=False, local_worker_id=None):
-        hb_dir = self.config.get("heartbeat_path")
-        if hb_dir:
-            hb_dir = os.path.abspath(os.path.expanduser(hb_dir))
-        else:
-            hb_dir = self.get_sys_path(os.path.join("_system", "heartbeats"))
+    def publish_shard_stats(self, queue_name, workers):
+        ring = self._lead_ring(queue_name)
+        recent = self.shard_recent.get(queue_name, deque())
+        horizon = time.time() - self._shard_drift_window()
+        while recent and recent[0][0] < horizon:
+            recent.popleft()
+        stats = {
+            "lead": self.config.get("worker_id"),
+            "queue": queue_name,
+            "mode": self._shard_mode(),
+            "leads": ring.nodes if ring else [self.config.get("worker_id")],
+            "workers": sorted(workers),
+            "dispatched": self.shard_dispatched.get(queue_name, {}),
+            "recent": list(recent),
+            "backlog_since": self.shard_backlog.get(queue_name, {}),
+            "updated_at": int(time.time()),
+        }
         try:
-            hb_files = [
-                os.path.join(hb_dir, f)
-                for f in os.listdir(hb_dir)
-                if f.endswith(".json")
-            ]
-        except OSError:
-            hb_files = []
+            write_json_atomic(self._shard_stats_path(), stats)
+        except OSError as e:
+            self.logger(f"⚠️ Could not save shard stats: {e}")
+            return
+        drift = self.shard_drift(queue_name)
+        if drift is None:
+            return
+        tolerance = float(self._settings_value("shard_drift_tolerance", 0.05))
+        if drift > tolerance:
+            self.logger(
+                f"⚠️ {queue_name} bucket ratios drift {drift:.3f} from weights "
+                f"(tolerance {tolerance})."
+            )
+        else:
+            self.logger(f"DEBUG: {queue_name} shard ratio drift {drift:.3f}.")
 
-        now = int(time.time())
-        idle_workers = []
-        allowed_roles = None
-        if target_type == "img":
-            allowed_roles = {"img_worker", "img_lead"}
-        elif target_type == "vid":
-            allowed_roles = {"vid_worker", "vid_lead"}
+    def _load_shard_counts(self):
+        if self.shard_dispatched is not None:
+            return
+        self.shard_dispatched = {}
+        try:
+            with open(self._shard_stats_path(), "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if not isinstance(stats, dict):
+            return
+        queue_name = stats.get("queue")
+        if isinstance(stats.get("dispatched"), dict):
+            self.shard_dispatched[queue_name] = dict(stats["dispatched"])
+        self.shard_recent[queue_name] = deque(
+            item for item in stats.get("recent") or [] if isinstance(item, list) and len(item) == 3
+        )
 
-        for hb_path in hb_files:
+    def shard_drift(self, queue_name):
+        shards_dir = self.get_sys_path(os.path.join("_system", "shards"))
+        try:
+            with os.scandir(shards_dir) as it:
+                paths = [e.path for e in it if e.name.endswith(".json")]
+        except OSError:
+            return None
+        start = time.time() - self._shard_drift_window()
+        units = {}
+        since = None
+        for path in paths:
             try:
-                with open(hb_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
+                with open(path, "r", encoding="utf-8") as f:
+                    stats = json.load(f)
             except (OSError, json.JSONDecodeError):
                 continue
-
-            if not isinstance(data, dict):
+            if not isinstance(stats, dict) or stats.get("queue") != queue_name:
                 continue
+            for ts, bucket, amount in stats.get("recent") or []:
+                if isinstance(amount, (int, float)) and ts >= start:
+                    units[bucket] = units.get(bucket, 0) + amount
+            # A bucket counts only if every lead saw it backlogged for the whole window.
+            backlog = stats.get("backlog_since") or {}
+            if since is None:
+                since = dict(backlog)
+            else:
+                since = {b: max(t, backlog[b]) for b, t in since.items() if b in backlog}
+        # DRR only promises weight ratios among buckets that always had work waiting.
+        buckets = [b for b, t in (since or {}).items() if t <= start]
+        total = sum(units.get(b, 0) for b in buckets)
+        if len(buckets) < 2 or not total:
+            return None
+        flat = self._get_weight_tree(self._load_weights()).flat
+        weights = {b: flat.get(b, flat.get("default", 1)) for b in buckets}
+        weight_sum = sum(weights.values()) or 1
+        return max(abs(units.get(b, 0) / total - weights[b] / weight_sum) for b in buckets)
 
-            ts = data.get("timestamp")
-            status = data.get("status")
-            role = data.get("role")
-            worker_id = data.get("worker_id")
-            if not worker_id or not isinstance(ts, int):
-                continue
+    def _live_workers(self, queue_name):
+        roles = self._roles_for_queue(queue_name)
+        now = int(time.time())
+        registry = self.get_heartbeat_registry()
+        return [
+            data["worker_id"]
+            for data in registry.all()
+            if data.get("role") in roles
+            and data.get("status") in ("IDLE", "BUSY")
+            and isinstance(data.get("timestamp"), int)
+            and now - data["timestamp"] < 90
+        ]
 
-            if now - ts < 90 and status == "IDLE":
-                if allowed_roles is not None and role not in allowed_roles:
-                    continue
-                idle_workers.append(worker_id)
+    def _role_capacity(self, queue_name):
+        return len(self._live_workers(queue_name))
 
-        if local_worker_id:
-            if local_worker_id in idle_workers:
-                idle_workers.remove(local_worker_id)
-            idle_workers.insert(0, local_worker_id)
-        elif include_self_id:
-            self_id = self.config.get("worker_id")
-            self_role = self.config.get("initial_role")
-            self_status = self.config.get("last_status")
-            if (
-                self_id
-                and self_status == "IDLE"
-                and (allowed_roles is None or self_role in allowed_roles)
-            ):
-                if self_id in idle_workers:
-                    idle_workers.remove(self_id)
-                idle_workers.insert(0, self_id)
+    def _worker_capabilities(self, worker_id):
+        data = self.get_heartbeat_registry().get(worker_id) or {}
+        caps = data.get("capabilities")
+        return caps if isinstance(caps, dict) else None
 
-        self.logger(
-            f"DEBUG: Active idle workers within 90s window: {len(idle_workers)}"
-        )
-        return idle_workers
+    def _worker_slots(self, worker_id):
+        caps = self._worker_capabilities(worker_id) or {}
+        try:
+            return max(1, int(caps.get("slots", 1)))
+        except (TypeError, ValueError):
+            return 1
 
-    def get_next_job(self, queue_path, config_weights):
-        self.logger(f"DEBUG: Scanning queue at {queue_path}")
+    def _job_requirements(self, job_name, target_type):
+        scripts = {f"{target_type}_gen"}
+        displays = 1
+        manifest = self.get_manifest_store().get(job_name)
+        requires = manifest.get("requires") if manifest else None
+        if isinstance(requires, (list, str)):
+            requires = {"scripts": requires}
+        if isinstance(requires, dict):
+            extra = requires.get("scripts") or []
+            if isinstance(extra, str):
+                extra = [extra]
+            scripts.update(str(key) for key in extra)
+            try:
+                displays = max(displays, int(requires.get("displays", 1)))
+            except (TypeError, ValueError):
+                pass
+        return scripts, displays
+
+    def _can_run(self, worker_id, job_name, target_type):
+        caps = self._worker_capabilities(worker_id)
+        if caps is None:
+            # Workers that predate capability heartbeats are treated as generic.
+            return True
+        scripts, displays = self._job_requirements(job_name, target_type)
+        if not scripts.issubset(caps.get("scripts") or ()):
+            return False
         try:
-            entries = []
-            for name in os.listdir(queue_path):
-                if name.startswith("."):
-                    self.logger(f"DEBUG: Skipping system file: {name}")
-                    continue
-                entries.append(os.path.join(queue_path, name))
-        except OSError as e:
-            self.logger(f"DEBUG: Failed to list queue: {e}")
-            entries = []
+            return int(caps.get("displays", 1)) >= displays
+        except (TypeError, ValueError):
+            return displays <= 1
 
-        jobs = [p for p in entries if os.path.isfile(p) or os.path.isdir(p)]
-        if not jobs:
-            self.logger("DEBUG: Queue empty (0 valid jobs found).")
+    def _resource_shortfall(self, worker_id, target_type):
+        data = self.get_heartbeat_registry().get(worker_id) or {}
+        resources = data.get("resources")
+        if not isinstance(resources, dict):
             return None
+        limits = dict(RESOURCE_LIMITS.get(target_type, {}))
+        configured = self._settings_value("resource_limits") or {}
+        if isinstance(configured.get(target_type), dict):
+            limits.update(configured[target_type])
+        for name, limit in limits.items():
+            value = resources.get(name)
+            if limit is None or not isinstance(value, (int, float)):
+                continue
+            if name in RESOURCE_FLOORS and value < limit:
+                return f"{name} {value} < {limit}"
+            if name not in RESOURCE_FLOORS and value > limit:
+                return f"{name} {value} > {limit}"
+        return None
 
-        for job in jobs:
-            name = os.path.basename(job)
-            if re.search(r"(vip|urgent)", name, re.IGNORECASE):
-                self.logger(f"DEBUG: Selected VIP job: {os.path.basename(job)}")
-                return job
+    def _resource_admit(self, worker_ids, target_type):
+        admitted = set()
+        for worker_id in worker_ids:
+            shortfall = self._resource_shortfall(worker_id, target_type)
+            previous = self.resource_blocked.get(worker_id)
+            if shortfall and not previous:
+                self.logger(f"💾 Holding jobs from {worker_id}: {shortfall}.")
+            elif previous and not shortfall:
+                self.logger(f"✅ {worker_id} has resources again; resuming placement.")
+            if shortfall:
+                self.resource_blocked[worker_id] = shortfall
+            else:
+                self.resource_blocked.pop(worker_id, None)
+                admitted.add(worker_id)
+        return admitted
 
-        weights_cfg = self._load_weights()
-        default_weight = int(weights_cfg.get("default", 1))
-        keys = [k for k in weights_cfg.keys() if k != "default"]
+    def _placement_constrained(self, worker_ids, target_type):
+        if self.get_manifest_store().has_requirements():
+            return True
+        base = f"{target_type}_gen"
+        for worker_id in worker_ids:
+            caps = self._worker_capabilities(worker_id)
+            if caps is not None and base not in (caps.get("scripts") or ()):
+                return True
+        return False
 
-        buckets = {k: [] for k in keys}
-        buckets["default"] = []
+    def estimate_job_seconds(self, queue_name, bucket, job_path, manifest=None):
+        if manifest and manifest.get("cost_estimate"):
+            return manifest["cost_estimate"]
+        per_unit = (
+            self.bucket_sec_per_unit.get(queue_name, {}).get(bucket)
+            or self.sec_per_unit.get(queue_name)
+            or self._settings_value("vruntime_default_seconds", 60)
+        )
+        return self.job_cost(job_path) * per_unit
 
-        for job in jobs:
-            name = os.path.basename(job)
-            lower_name = name.lower()
-            matched_key = None
-            matched_weight = None
-            for key in keys:
-                if key.lower() in lower_name:
-                    weight = int(weights_cfg.get(key, default_weight))
-                    if matched_weight is None or weight > matched_weight:
-                        matched_key = key
-                        matched_weight = weight
-            if matched_key:
-                self.logger(
-                    f"DEBUG: 🎯 Match! {name} contains '{matched_key}' -> Weight: {matched_weight}"
+    def _pick_deadline(
+        self, index, queue_name, priority=None, admit=None, job_filter=None
+    ):
+        self._restore_runtime_state()
+        candidates = []
+        for deadline, name, record in self.get_manifest_store().with_deadline():
+            if index.arrival_of(name) is None:
+                continue
+            if priority is not None and index.priority_of(name) != priority:
+                continue
+            if not os.path.exists(os.path.join(index.queue_path, name)):
+                index.discard(name)
+                continue
+            candidates.append((deadline, name, record))
+        if not candidates:
+            self.deadline_flags[queue_name] = []
+            return None
+
+        now = time.time()
+        capacity = max(1, self._role_capacity(queue_name))
+        horizon = self._settings_value("edf_horizon_seconds", 3600)
+        cumulative = 0.0
+        engaged = False
+        flagged = []
+        for deadline, name, record in candidates:
+            bucket = index.bucket_of(name) or "default"
+            estimate = self.estimate_job_seconds(
+                queue_name, bucket, os.path.join(index.queue_path, name), record
+            )
+            cumulative += estimate
+            projected = now + cumulative / capacity
+            if deadline - now - estimate <= horizon:
+                engaged = True
+            if projected > deadline:
+                engaged = True
+                flagged.append(
+                    {
+                        "job": name,
+                        "deadline": deadline,
+                        "projected_finish": round(projected),
+                        "late_by": round(projected - deadline),
+                    }
                 )
-                buckets.setdefault(matched_key, []).append(job)
-            else:
+
+        previous = {item["job"] for item in self.deadline_flags.get(queue_name, [])}
+        for item in flagged:
+            if item["job"] not in previous:
                 self.logger(
-                    f"DEBUG: ℹ️ No keyword found in {name}, falling back to 'default' ({default_weight})"
+                    f"⏰ Deadline risk: {item['job']} projected to finish "
+                    f"{item['late_by']}s late at current capacity ({capacity} workers)."
                 )
-                buckets.setdefault("default", []).append(job)
+        self.deadline_flags[queue_name] = flagged
+
+        if not engaged:
+            return None
+        for deadline, name, _record in candidates:
+            bucket = index.bucket_of(name) or "default"
+            if admit is not None and not admit(bucket):
+                continue
+            if job_filter is not None and not job_filter(name):
+                continue
+            self.logger(f"DEBUG: EDF selected {name} (deadline {deadline:.0f})")
+            return bucket, name
+        return None
 
-        key_order = [k for k in keys] + ["default"]
-        if not key_order:
-            key_order = ["default"]
+    def deadline_report(self):
+        return {queue_name: list(items) for queue_name, items in self.deadline_flags.items()}
 
-        queue_key = os.path.abspath(queue_path)
-        if queue_key not in self.deficits:
-            self.deficits[queue_key] = {}
-        if queue_key not in self.current_index:
-            self.current_index[queue_key] = 0
+    def _max_wait_for(self, bucket, max_wait=None):
+        if max_wait is None:
+            max_wait = self._settings_value("max_wait_seconds")
+        if isinstance(max_wait, dict):
+            max_wait = max_wait.get(bucket, max_wait.get("default"))
+        if isinstance(max_wait, (int, float)) and max_wait > 0:
+            return max_wait
+        return None
 
+    def _pick_aged(self, head_of, index, key_order):
+        max_wait = self._settings_value("max_wait_seconds")
+        if not max_wait:
+            return None
+        now = time.time()
+        best = None
+        best_overdue = 0
         for key in key_order:
-            self.deficits[queue_key].setdefault(key, 0)
+            bound = self._max_wait_for(key, max_wait)
+            if bound is None:
+                continue
+            name = head_of(key)
+            if name is None:
+                continue
+            arrival = index.arrival_of(name)
+            if arrival is None:
+                continue
+            overdue = now - arrival - bound
+            if overdue > best_overdue:
+                best = (key, name)
+                best_overdue = overdue
+        if best is not None:
+            self.logger(
+                f"DEBUG: Aging promoted {best[1]} from bucket {best[0]} "
+                f"({best_overdue:.0f}s past its wait bound)"
+            )
+        return best
+
+    def _record_queue_wait(self, index, name):
+        arrival = index.arrival_of(name)
+        if arrival is None:
+            return
+        queue_name = os.path.basename(index.queue_path)
+        bucket = index.bucket_of(name) or "default"
+        waits = self.queue_waits.setdefault(queue_name, {})
+        if bucket not in waits:
+            waits[bucket] = deque(maxlen=self.config.get("queue_wait_samples", 1000))
+        waits[bucket].append(max(0.0, time.time() - arrival))
+
+    def queue_wait_stats(self):
+        stats = {}
+        for queue_name, buckets in self.queue_waits.items():
+            for bucket, samples in buckets.items():
+                ordered = sorted(samples)
+                if not ordered:
+                    continue
+                stats.setdefault(queue_name, {})[bucket] = {
+                    "count": len(ordered),
+                    "p50": round(ordered[int(0.50 * (len(ordered) - 1))], 1),
+                    "p99": round(ordered[int(0.99 * (len(ordered) - 1))], 1),
+                    "max": round(ordered[-1], 1),
+                }
+        return stats
+
+    def report_queue_waits(self, force=False):
+        interval = self.config.get("queue_wait_report_interval", 300)
+        if not force and time.time() - self.last_wait_report < interval:
+            return None
+        self.last_wait_report = time.time()
+        stats = self.queue_wait_stats()
+        if not stats:
+            return stats
+        for queue_name, buckets in stats.items():
+            summary = ", ".join(
+                f"{bucket} p50={s['p50']}s p99={s['p99']}s (n={s['count']})"
+                for bucket, s in sorted(buckets.items())
+            )
+            self.logger(f"📊 Queue wait {queue_name}: {summary}")
+        try:
+            write_json_atomic(
+                self.get_sys_path(
+                    os.path.join("_system", "scheduler_state", "queue_waits.json")
+                ),
+                {"updated_at": int(time.time()), "queues": stats},
+            )
+        except OSError as e:
+            self.logger(f"⚠️ Could not write queue wait report: {e}")
+        return stats
 
+    def job_cost(self, job_path):
+        try:
+            st = os.stat(job_path)
+        except OSError:
+            return 1
+        stat_key = (st.st_mtime_ns, st.st_size)
+        cached = self.job_costs.get(job_path)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        count = 0
+        if os.path.isdir(job_path):
+            try:
+                count = sum(
+                    1
+                    for name in os.listdir(job_path)
+                    if not name.startswith(".")
+                    and os.path.splitext(name)[1].lower() in IMAGE_EXTS
+                )
+            except OSError:
+                count = 0
+        elif job_path.lower().endswith(".txt"):
+            try:
+                with open(job_path, "r", encoding="utf-8", errors="ignore") as f:
+                    count = sum(1 for line in f if line.strip())
+            except OSError:
+                count = 0
+        cost = max(1, count)
+        if len(self.job_costs) >= self.config.get("job_cost_cache_size", 50000):
+            self.job_costs.clear()
+        self.job_costs[job_path] = (stat_key, cost)
+        return cost
+
+    def _drr_pick(
+        self,
+        queue_key,
+        key_order,
+        weight_of,
+        head_of,
+        count_of,
+        cost_of=None,
+        queue_size=None,
+        admit=None,
+    ):
+        deficits = self.deficits.setdefault(queue_key, {})
+        self.current_index.setdefault(queue_key, 0)
+        for key in key_order:
+            deficits.setdefault(key, 0)
         total_keys = len(key_order)
+        if not total_keys:
+            return None
 
         def _try_select_job():
             attempts = 0
@@ -244,104 +2992,364 @@ class FleetDispatcher:
                 idx = self.current_index[queue_key] % total_keys
                 category = key_order[idx]
 
+                if admit is not None and not admit(category):
+                    self.current_index[queue_key] = (idx + 1) % total_keys
+                    attempts += 1
+                    continue
+
                 self.logger(
                     f"DEBUG: DRR State - Bucket: {category}, "
-                    f"Credit: {self.deficits[queue_key][category]}, "
-                    f"Total Jobs in Queue: {len(jobs)}"
+                    f"Credit: {deficits[category]}, "
+                    f"Total Jobs in Queue: {queue_size}"
                 )
 
-                if buckets.get(category) and self.deficits[queue_key][category] > 0:
-                    job = buckets[category].pop(0)
-                    self.deficits[queue_key][category] -= 1
-                    if (
-                        self.deficits[queue_key][category] == 0
-                        or not buckets.get(category)
-                    ):
-                        self.current_index[queue_key] = (idx + 1) % total_keys
-                    self.logger(f"DEBUG: Selected job: {os.path.basename(job)}")
-                    return job
+                if deficits[category] > 0:
+                    name = head_of(category)
+                    if name is not None:
+                        cost = cost_of(name) if cost_of else 1
+                        if cost <= deficits[category]:
+                            deficits[category] -= cost
+                            drained = count_of(category) <= 1
+                            if drained and cost_of:
+                                deficits[category] = 0
+                            if deficits[category] == 0 or drained:
+                                self.current_index[queue_key] = (idx + 1) % total_keys
+                            return category, name
+                    elif cost_of:
+                        deficits[category] = 0
 
                 self.current_index[queue_key] = (idx + 1) % total_keys
                 attempts += 1
 
             return None
 
-        job = _try_select_job()
-        if job is not None:
-            return job
+        selected = _try_select_job()
+        if selected is not None:
+            return selected
 
-        for key in key_order:
-            self.deficits[queue_key][key] = max(
-                0, int(weights_cfg.get(key, default_weight))
-            )
+        if cost_of is None:
+            for key in key_order:
+                if admit is not None and not admit(key) and deficits[key] > 0:
+                    continue
+                deficits[key] = max(0, int(weight_of(key)))
+            return _try_select_job()
 
+        quantum_unit = self._settings_value("drr_quantum", 1)
+        quanta = {}
+        rounds = None
+        for key in key_order:
+            if admit is not None and not admit(key):
+                continue
+            name = head_of(key)
+            if name is None:
+                deficits[key] = 0
+                continue
+            quantum = int(max(0, int(weight_of(key))) * quantum_unit)
+            if quantum <= 0:
+                continue
+            quanta[key] = quantum
+            needed = cost_of(name) - deficits[key]
+            key_rounds = max(1, -(-needed // quantum))
+            rounds = key_rounds if rounds is None else min(rounds, key_rounds)
+        if rounds is None:
+            return None
+        for key, quantum in quanta.items():
+            deficits[key] += rounds * quantum
         return _try_select_job()
 
-    def enforce_vip_preemption(self, queue_path, active_floor_path):
+    def _tree_level(self, state_key, node):
+        levels = self.tree_state.setdefault(state_key, {})
+        return levels.setdefault("/".join(node), {"deficits": {}, "next": None})
+
+    def _tree_level_pick(
+        self, state_key, tree, node, totals, quantum_unit, admit_node=None
+    ):
+        level = self._tree_level(state_key, node)
+        deficits = level["deficits"]
+        order = tree.children.get(node, [])
+        start = order.index(level["next"]) if level["next"] in order else 0
+        candidates = []
+        for child in order[start:] + order[:start]:
+            if totals.get(node + (child,), 0) <= 0:
+                deficits.pop(child, None)
+            elif admit_node is None or admit_node(node + (child,)):
+                candidates.append(child)
+        for child in list(deficits):
+            if child not in order:
+                del deficits[child]
+        for child in candidates:
+            if deficits.get(child, 0) > 0:
+                return child
+
+        quanta = {}
+        rounds = None
+        for child in candidates:
+            quantum = int(max(0, tree.weights[node + (child,)]) * quantum_unit)
+            if quantum <= 0:
+                continue
+            quanta[child] = quantum
+            needed = 1 - deficits.get(child, 0)
+            child_rounds = max(1, -(-needed // quantum))
+            rounds = child_rounds if rounds is None else min(rounds, child_rounds)
+        if rounds is None:
+            return None
+        for child, quantum in quanta.items():
+            deficits[child] = deficits.get(child, 0) + rounds * quantum
+        for child in candidates:
+            if deficits.get(child, 0) > 0:
+                return child
+        return None
+
+    def _charge_tree(self, state_key, tree, bucket, cost, totals=None):
+        path = tree.leaf_path(bucket)
+        for depth in range(len(path)):
+            node, child = path[:depth], path[depth]
+            level = self._tree_level(state_key, node)
+            deficits = level["deficits"]
+            deficits[child] = deficits.get(child, 0) - cost
+            drained = totals is not None and totals.get(path[: depth + 1], 0) <= 1
+            if deficits[child] > 0 and not drained:
+                level["next"] = child
+                continue
+            if drained and deficits[child] > 0:
+                deficits[child] = 0
+            order = tree.children.get(node, [])
+            if child in order:
+                level["next"] = order[(order.index(child) + 1) % len(order)]
+
+    def _tree_pick(
+        self, state_key, tree, index, priority, head_of, cost_of=None, admit_node=None
+    ):
+        quantum_unit = self._settings_value("drr_quantum", 1) if cost_of else 1
+        totals = tree.subtree_counts(index.bucket_counts(priority))
+        dead = set()
+        node_ok = lambda node: node not in dead and (
+            admit_node is None or admit_node(node)
+        )
+        while totals.get((), 0) > 0:
+            node = ()
+            name = None
+            while True:
+                child = self._tree_level_pick(
+                    state_key, tree, node, totals, quantum_unit, node_ok
+                )
+                if child is None:
+                    break
+                node = node + (child,)
+                if node in tree.groups:
+                    continue
+                name = head_of(child)
+                break
+            if name is not None:
+                self.logger(
+                    f"DEBUG: DRR Tree State - Path: {'/'.join(node)}, "
+                    f"Total Jobs in Queue: {totals.get((), 0)}"
+                )
+                self._charge_tree(
+                    state_key, tree, node[-1], cost_of(name) if cost_of else 1, totals
+                )
+                return node[-1], name
+            if not node:
+                return None
+            if node in tree.groups:
+                dead.add(node)
+                continue
+            stale = totals.get(node, 0)
+            if stale <= 0:
+                return None
+            for depth in range(len(node) + 1):
+                totals[node[:depth]] = totals.get(node[:depth], 0) - stale
+        return None
+
+    def _running_job_priority(self, current_job):
+        if not current_job:
+            return self._default_priority()
+        return self.job_priority(str(current_job).split("/")[0])
+
+    def _vip_class(self):
+        preempt_class = self.parse_priority(self._settings_value("preempt_max_class", 0))
+        return 0 if preempt_class is None else preempt_class
+
+    def _vip_reserve(self, queue_name, pool_size):
+        reserve = self._settings_value("vip_reserve")
+        if isinstance(reserve, dict):
+            role = "vid_worker" if queue_name == "vid_queue" else "img_worker"
+            reserve = reserve.get(role, reserve.get(queue_name.split("_")[0]))
+        if isinstance(reserve, bool) or not isinstance(reserve, (int, float)):
+            return 0
+        if reserve <= 0:
+            return 0
+        if reserve < 1:
+            return min(pool_size, int(-(-reserve * pool_size // 1)))
+        return min(pool_size, int(reserve))
+
+    def _is_short_job(self, job_path):
         try:
-            entries = [
-                f for f in os.listdir(queue_path) if not f.startswith(".")
-            ]
-        except OSError:
-            entries = []
+            max_cost = float(self._settings_value("short_job_max_cost", 5))
+        except (TypeError, ValueError):
+            max_cost = 5.0
+        return self.job_cost(job_path) <= max_cost
 
-        if not any("vip" in name.lower() for name in entries):
-            return
+    def _holds_long_job(self, worker_id, vip_class):
+        inbox_path = self.get_sys_path(os.path.join("02_active_floor", worker_id, "inbox"))
+        try:
+            names = [n for n in os.listdir(inbox_path) if not n.startswith(".")]
+        except OSError:
+            return False
+        return any(
+            self.job_priority(name) > vip_class
+            and not self._is_short_job(os.path.join(inbox_path, name))
+            for name in names
+        )
 
-        hb_dir = self.config.get("heartbeat_path")
-        if hb_dir:
-            hb_dir = os.path.abspath(os.path.expanduser(hb_dir))
+    def _job_progress(self, worker_id, current_job):
+        job_name = str(current_job).split("/")[0]
+        job_path = self.get_sys_path(
+            os.path.join("02_active_floor", worker_id, "inbox", job_name)
+        )
+        if os.path.isdir(job_path):
+            progress_path = os.path.join(job_path, "progress.json")
         else:
-            hb_dir = self.get_sys_path(os.path.join("_system", "heartbeats"))
+            progress_path = self.get_sys_path(
+                os.path.join(
+                    "03_review_room", os.path.splitext(job_name)[0], "progress.json"
+                )
+            )
+        try:
+            with open(progress_path, "r", encoding="utf-8") as f:
+                completed = json.load(f).get("completed_files", [])
+        except (OSError, json.JSONDecodeError, AttributeError):
+            completed = []
+        done = len(completed) if isinstance(completed, list) else 0
+        return done, max(done, self.job_cost(job_path))
+
+    def _prompt_elapsed(self, registry, data):
+        elapsed = data.get("prompt_elapsed")
+        if isinstance(elapsed, bool) or not isinstance(elapsed, (int, float)):
+            return None
+        observed = registry.observed_at(data.get("worker_id"))
+        if observed is None:
+            return float(elapsed)
+        return float(elapsed) + max(0.0, time.time() - observed)
 
+    def _yield_pending(self, cmd_dir, worker_id):
+        cmd_path = os.path.join(cmd_dir, f"{worker_id}.cmd")
         try:
-            hb_files = [
-                os.path.join(hb_dir, f)
-                for f in os.listdir(hb_dir)
-                if f.endswith(".json")
-            ]
-        except OSError:
-            hb_files = []
+            with open(cmd_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("action") == "yield"
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return False
 
-        idle_found = False
-        victim_worker = None
-        for hb_path in hb_files:
-            try:
-                with open(hb_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except (OSError, json.JSONDecodeError):
+    def _reclaim_prefetched(self, worker_id, current_job, queue_path):
+        inbox_path = self.get_sys_path(os.path.join("02_active_floor", worker_id, "inbox"))
+        current = str(current_job or "").split("/")[0]
+        want_dirs = os.path.basename(queue_path) == "vid_queue"
+        try:
+            entries = sorted(os.listdir(inbox_path))
+        except OSError:
+            return 0
+        reclaimed = 0
+        for entry in entries:
+            if entry.startswith(".") or entry == current:
                 continue
-
-            if not isinstance(data, dict):
+            src = os.path.join(inbox_path, entry)
+            dest = os.path.join(queue_path, entry)
+            if os.path.isdir(src) != want_dirs or os.path.exists(dest):
                 continue
-
-            status = data.get("status")
-            worker_id = data.get("worker_id")
-            current_job = data.get("current_job", "") or ""
-            if not worker_id:
+            try:
+                if want_dirs:
+                    self._safe_move_dir(src, dest)
+                else:
+                    shutil.move(src, dest)
+            except OSError:
                 continue
+            self.get_queue_index(queue_path).add(entry)
+            self._drop_lease(entry)
+            reclaimed += 1
+            self.logger(f"Reclaimed prefetched job {entry} from {worker_id}")
+        return reclaimed
 
-            if status == "IDLE":
-                idle_found = True
+    def enforce_vip_preemption(self, queue_path, active_floor_path):
+        index, _weights_cfg, _classifier = self._prepare_index(queue_path)
+        preempt_class = self._vip_class()
+        waiting = None
+        for priority in index.priorities():
+            if priority > preempt_class:
                 break
+            if index.has_priority(priority):
+                waiting = priority
+                break
+        if waiting is None:
+            return 0
 
-            if status == "BUSY" and "vip" not in current_job.lower():
-                victim_worker = worker_id
+        queue_name = os.path.basename(index.queue_path)
+        roles = self._roles_for_queue(queue_name)
+        registry = self.get_heartbeat_registry()
+        now = int(time.time())
+        pool = [
+            data
+            for data in registry.all()
+            if data.get("role") in roles
+            and isinstance(data.get("timestamp"), int)
+            and now - data["timestamp"] < 90
+            and self.owns_worker(data["worker_id"], queue_name)
+        ]
+        cmd_dir = self.get_sys_path(os.path.join("_system", "commands"))
+        pending = {
+            data["worker_id"]
+            for data in pool
+            if self._yield_pending(cmd_dir, data["worker_id"])
+        }
+        idle = sum(1 for data in pool if data.get("status") == "IDLE")
+        budget = index.count_up_to(preempt_class) - idle - len(pending)
+        if budget <= 0:
+            return 0
 
-        if idle_found or not victim_worker:
-            return
+        prompt_seconds = self.sec_per_unit.get(
+            queue_name, self._settings_value("vruntime_default_seconds", 60)
+        )
+        candidates = []
+        for data in pool:
+            worker_id = data["worker_id"]
+            current_job = data.get("current_job")
+            if data.get("status") != "BUSY" or not current_job or worker_id in pending:
+                continue
+            running = self._running_job_priority(current_job)
+            if running <= waiting:
+                continue
+            done, total = self._job_progress(worker_id, current_job)
+            if total - done <= 1:
+                continue
+            elapsed = self._prompt_elapsed(registry, data)
+            if elapsed is None:
+                elapsed = prompt_seconds / 2
+            candidates.append((-running, elapsed, done - total, worker_id, current_job))
+        candidates.sort()
 
-        cmd_dir = self.get_sys_path(os.path.join("_system", "commands"))
         os.makedirs(cmd_dir, exist_ok=True)
-        cmd_path = os.path.join(cmd_dir, f"{victim_worker}.cmd")
-        try:
-            with open(cmd_path, "w", encoding="utf-8") as f:
-                json.dump({"action": "yield", "reason": "vip_waiting"}, f)
+        sent = 0
+        for _neg_priority, elapsed, _left, worker_id, current_job in candidates[:budget]:
+            cmd_path = os.path.join(cmd_dir, f"{worker_id}.cmd")
+            try:
+                with open(cmd_path, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {
+                            "action": "yield",
+                            "reason": "vip_waiting",
+                            "job": current_job,
+                            "queue": queue_name,
+                        },
+                        f,
+                    )
+            except OSError:
+                continue
+            sent += 1
             self.logger(
-                f"⚠️ VIP Waiting. Commanding worker {victim_worker} to YIELD current job."
+                f"⚠️ VIP Waiting. Commanding worker {worker_id} to YIELD {current_job} "
+                f"(~{elapsed:.0f}s of in-flight work)."
             )
-        except OSError:
-            return
+            self._reclaim_prefetched(worker_id, current_job, index.queue_path)
+        return sent
 
     def dispatch_smart(self):
         role = self.config.get("initial_role")
@@ -353,74 +3361,304 @@ class FleetDispatcher:
             source_rel = os.path.join("01_job_factory", "vid_queue")
             target_type = "vid"
         else:
-            return
+            return 0
 
         self.logger(f"DEBUG: Dispatching for role {role}, looking in {source_rel}")
         source_path = self.get_sys_path(source_rel)
+        cycle_start = time.time()
+        if self._shared_state():
+            self.reload_shared_state(source_path)
+        self.get_heartbeat_registry(force=True)
+        self.collect_runtime_usage()
+        self.update_worker_health()
         idle_workers = self._get_idle_workers(
             target_type=target_type,
             include_self_id=True,
             local_worker_id=self.config.get("worker_id"),
         )
         self.logger(f"DEBUG: Found {len(idle_workers)} idle workers: {idle_workers}")
-        if not idle_workers:
-            return
+        prefetch_depth = int(self._settings_value("prefetch_depth", 0) or 0)
+        queue_name = os.path.basename(source_path)
+        live_workers = self._live_workers(queue_name)
+        ring = self._lead_ring(queue_name)
+        if ring is not None:
+            idle_workers = [w for w in idle_workers if self.owns_worker(w, queue_name)]
+            live_workers = [w for w in live_workers if self.owns_worker(w, queue_name)]
+            self.logger(
+                f"DEBUG: Shard {self.config.get('worker_id')} of {len(ring.nodes)} owns "
+                f"{len(live_workers)} live worker(s)."
+            )
+        self._load_shard_counts()
+        backlog_changed = self._shard_mode() and self._sample_shard_backlog(
+            queue_name, source_path
+        )
+        if (
+            not idle_workers
+            and prefetch_depth <= 0
+            and all(self._worker_slots(w) <= 1 for w in live_workers)
+        ):
+            if backlog_changed:
+                self.publish_shard_stats(queue_name, live_workers)
+            return 0
 
-        job_path = self.get_next_job(source_path, self.config.get("weights", {}))
-        if not job_path:
-            return
+        batch = self.config.get("batch_dispatch", True)
+        assigned = 0
+        queue_drained = False
+        self.running_buckets = None
+        if self._concurrency_caps():
+            self._get_classifier(self._load_weights())
+            self.running_buckets = self.count_running_buckets()
+        vip_class = self._vip_class()
+        reserve = self._vip_reserve(queue_name, len(live_workers))
+        long_running = 0
+        if reserve:
+            long_running = sum(
+                1 for w in live_workers if self._holds_long_job(w, vip_class)
+            )
+            self.logger(
+                f"DEBUG: VIP reserve {reserve}/{len(live_workers)} workers, "
+                f"{long_running} on long jobs."
+            )
+        short_only = lambda name: self._is_short_job(os.path.join(source_path, name))
+        owned = None
+        if ring is not None:
+            owned = lambda name: self.owns_job(name, queue_name)
+        # Two leads may move the same stolen job on different replicas; only leases
+        # let the workers tell which copy is real.
+        steal = self._settings_value("job_leases", False) and self._settings_value(
+            "shard_steal", True
+        )
 
-        filename = os.path.basename(job_path)
-        selected_worker = None
-        selected_inbox = None
-        for worker_id in idle_workers:
+        def pick(min_priority=None, placeable=None):
+            job_filter = None
+            if reserve and long_running + 1 > len(live_workers) - reserve:
+                job_filter = short_only
+            attempts = [placeable]
+            if owned is not None:
+                shard_filter = (
+                    owned
+                    if placeable is None
+                    else lambda name: owned(name) and placeable(name)
+                )
+                # Fall back to other shards' jobs only when this shard has none.
+                attempts = [shard_filter, placeable] if steal else [shard_filter]
+            for attempt in attempts:
+                job_path = self.get_next_job(
+                    source_path,
+                    self.config.get("weights", {}),
+                    job_filter=job_filter,
+                    min_priority=min_priority,
+                    placeable=attempt,
+                )
+                if job_path:
+                    return job_path
+            return None
+
+        def deliver(worker_id, inbox_path, job_path):
+            nonlocal long_running
+            filename = os.path.basename(job_path)
+            if not os.path.exists(job_path):
+                self.refund_dispatch(job_path)
+                self.get_queue_index(source_path).discard(filename)
+                self.logger(f"DEBUG: {filename} was taken by another lead.")
+                return "lost"
+            try:
+                self.logger(
+                    f"DEBUG: Attempting to move {filename} to {inbox_path}"
+                )
+                dest = os.path.join(inbox_path, filename)
+                if os.path.isdir(job_path):
+                    self._safe_move_dir(job_path, dest)
+                else:
+                    shutil.move(job_path, dest)
+                self.get_queue_index(source_path).discard(filename)
+                # Lease only what actually landed; an unleased inbox job is settled later.
+                try:
+                    self.grant_lease(filename, worker_id, queue_name)
+                except OSError as e:
+                    self.logger(f"⚠️ Could not lease {filename} to {worker_id}: {e}")
+                self.logger(f"CMD: Dispatched {filename} to {worker_id}")
+                self.last_assigned[worker_id] = time.time()
+                self.runtime_state_dirty = True
+                bucket = self.job_bucket(filename)
+                self._record_shard_dispatch(
+                    queue_name, bucket, self._dispatch_units(queue_name, dest)
+                )
+                if self.running_buckets is not None:
+                    self.running_buckets[bucket] = self.running_buckets.get(bucket, 0) + 1
+                if (
+                    reserve
+                    and self.job_priority(filename) > vip_class
+                    and not self._is_short_job(dest)
+                ):
+                    long_running += 1
+            except Exception as e:
+                self.refund_dispatch(job_path)
+                self.logger(f"❌ DISPATCH ERROR: Failed to move {filename}. Reason: {e}")
+                return "error"
+            return "assigned"
+
+        def inbox_load(worker_id):
             inbox_path = self.get_sys_path(
                 os.path.join("02_active_floor", worker_id, "inbox")
             )
-            os.makedirs(inbox_path, exist_ok=True)
             try:
-                inbox_entries = [
-                    name
-                    for name in os.listdir(inbox_path)
-                    if not name.startswith(".")
-                ]
+                return inbox_path, sum(
+                    1 for name in os.listdir(inbox_path) if not name.startswith(".")
+                )
             except OSError:
-                inbox_entries = []
-            if inbox_entries:
+                return inbox_path, None
+
+        cmd_dir = self.get_sys_path(os.path.join("_system", "commands"))
+        quarantined = {w for w in live_workers if self.health_state(w) == "quarantined"}
+        # Pull-mode workers claim their own jobs; pushing to them would double up.
+        pulling = {
+            w
+            for w in set(idle_workers) | set(live_workers)
+            if (self._worker_capabilities(w) or {}).get("pull")
+        }
+        if pulling:
+            self.reload_shared_state(source_path)
+        admitted = self._resource_admit(set(idle_workers) | set(live_workers), target_type)
+        free = {}
+        for worker_id in idle_workers:
+            if worker_id in pulling:
+                continue
+            if worker_id in quarantined:
+                self.logger(f"DEBUG: Skipping {worker_id}; quarantined for poor health.")
+                continue
+            if worker_id not in admitted:
+                self.logger(
+                    f"DEBUG: Skipping {worker_id}; {self.resource_blocked[worker_id]}."
+                )
+                continue
+            inbox_path, pending = inbox_load(worker_id)
+            if pending is None:
+                os.makedirs(inbox_path, exist_ok=True)
+                pending = 0
+            if pending >= self._worker_slots(worker_id):
                 self.logger(
-                    f"DEBUG: Skipping {worker_id}; inbox not empty ({len(inbox_entries)} items)."
+                    f"DEBUG: Skipping {worker_id}; inbox not empty ({pending} items)."
                 )
                 continue
-            selected_worker = worker_id
-            selected_inbox = inbox_path
-            break
+            free[worker_id] = [pending, inbox_path]
+        for worker_id in live_workers:
+            if worker_id in free or worker_id in quarantined or worker_id in pulling:
+                continue
+            if worker_id not in admitted:
+                continue
+            if self._worker_slots(worker_id) <= 1:
+                continue
+            if self._yield_pending(cmd_dir, worker_id):
+                continue
+            inbox_path, pending = inbox_load(worker_id)
+            if pending is not None and pending < self._worker_slots(worker_id):
+                free[worker_id] = [pending, inbox_path]
 
-        if not selected_worker:
-            self.logger("DEBUG: No idle workers with empty inbox found.")
-            return
+        constrained = self._placement_constrained(free, target_type)
+        outcome = None
+        while free:
+            order = sorted(
+                free,
+                key=lambda w: (
+                    self.health_state(w) == "degraded",
+                    free[w][0],
+                    self.last_assigned.get(w, 0),
+                    w,
+                ),
+            )
+            placeable = None
+            if constrained:
+                placeable = lambda name: any(
+                    self._can_run(w, name, target_type) for w in order
+                )
+            job_path = pick(placeable=placeable)
+            if not job_path:
+                outcome = "drained"
+                queue_drained = True
+                break
+            filename = os.path.basename(job_path)
+            worker_id = next(
+                w for w in order if not constrained or self._can_run(w, filename, target_type)
+            )
+            outcome = deliver(worker_id, free[worker_id][1], job_path)
+            if outcome == "lost":
+                continue
+            if outcome != "assigned":
+                break
+            assigned += 1
+            free[worker_id][0] += 1
+            if free[worker_id][0] >= self._worker_slots(worker_id):
+                del free[worker_id]
+            if not batch:
+                break
 
-        try:
+        if prefetch_depth > 0 and outcome in (None, "assigned") and (batch or not assigned):
+            prefetch = {}
+            for worker_id in live_workers:
+                if self.health_state(worker_id) != "healthy" or worker_id not in admitted:
+                    continue
+                if worker_id in pulling:
+                    continue
+                if self._yield_pending(cmd_dir, worker_id):
+                    continue
+                inbox_path, pending = inbox_load(worker_id)
+                if pending and pending <= prefetch_depth:
+                    prefetch[worker_id] = (pending, inbox_path)
+            constrained = constrained or self._placement_constrained(prefetch, target_type)
+            stop = False
+            for level in range(1, prefetch_depth + 1):
+                rotation = sorted(
+                    prefetch, key=lambda w: (self.last_assigned.get(w, 0), w)
+                )
+                for worker_id in rotation:
+                    pending, inbox_path = prefetch[worker_id]
+                    if pending != level:
+                        continue
+                    placeable = None
+                    if constrained:
+                        placeable = lambda name, w=worker_id: self._can_run(
+                            w, name, target_type
+                        )
+                    job_path = pick(min_priority=vip_class + 1, placeable=placeable)
+                    if not job_path and placeable is not None:
+                        continue
+                    outcome = (
+                        deliver(worker_id, inbox_path, job_path) if job_path else "drained"
+                    )
+                    if outcome == "lost":
+                        continue
+                    if outcome != "assigned":
+                        queue_drained = outcome == "drained"
+                        stop = True
+                        break
+                    prefetch[worker_id] = (pending + 1, inbox_path)
+                    assigned += 1
+                    self.logger(f"DEBUG: Prefetched a job for {worker_id} (depth {level}).")
+                    if not batch:
+                        stop = True
+                        break
+                if stop:
+                    break
+
+        self.running_buckets = None
+        if assigned or self.runtime_state_dirty:
+            self.save_scheduler_state()
+        if (assigned or backlog_changed) and self._shard_mode():
+            self.publish_shard_stats(queue_name, live_workers)
+        self.report_queue_waits()
+        if not assigned and not queue_drained:
+            self.logger("DEBUG: No idle workers with empty inbox found.")
+        else:
             self.logger(
-                f"DEBUG: Attempting to move {filename} to {selected_inbox}"
+                f"DEBUG: Dispatch cycle assigned {assigned} job(s) in "
+                f"{time.time() - cycle_start:.2f}s."
             )
-            dest = os.path.join(selected_inbox, filename)
-            if os.path.isdir(job_path):
-                self._safe_move_dir(job_path, dest)
-            else:
-                shutil.move(job_path, dest)
-            self.logger(f"CMD: Dispatched {filename} to {selected_worker}")
-        except Exception as e:
-            self.logger(f"❌ DISPATCH ERROR: Failed to move {filename}. Reason: {e}")
-            return
+        return assigned
 
     def recover_dead_workers(self):
-        hb_dir = self.config.get("heartbeat_path")
-        if hb_dir:
-            hb_dir = os.path.abspath(os.path.expanduser(hb_dir))
-        else:
-            hb_dir = self.get_sys_path(os.path.join("_system", "heartbeats"))
+        hb_dir = self._heartbeat_dir()
         active_floor = self.get_sys_path("02_active_floor")
         img_queue = self.get_sys_path(os.path.join("01_job_factory", "img_queue"))
         vid_queue = self.get_sys_path(os.path.join("01_job_factory", "vid_queue"))
-        self.check_dead_workers(hb_dir, active_floor, img_queue)
-        self.check_dead_workers(hb_dir, active_floor, vid_queue)
+        return self.recover_stranded_jobs(hb_dir, active_floor, img_queue, vid_queue)
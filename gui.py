@@ -719,6 +719,8 @@ class RenderFleetApp(ctk.CTk):
 
         weights = cfg.get("weights", {}) or {"default": 10}
         for key, value in weights.items():
+            if isinstance(value, dict):
+                value = json.dumps(value)
             self._add_weight_row(name=key, value=str(value))
 
     def _add_weight_row(self, name=None, value=None):
@@ -754,10 +756,16 @@ class RenderFleetApp(ctk.CTk):
         weights = {}
         for key, entry_row in self.weights_entries.items():
             entry = entry_row[0]
+            text = entry.get().strip()
             try:
-                weights[key] = int(entry.get().strip())
+                weights[key] = int(text)
             except ValueError:
-                continue
+                try:
+                    group = json.loads(text)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(group, dict):
+                    weights[key] = group
 
         settings_path = os.path.join(self.syncthing_root, "_system", "settings.json")
         try:
@@ -904,7 +912,19 @@ class RenderFleetApp(ctk.CTk):
             with open(settings_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
             weights = data.get("weights", {})
-            keys = [k for k in weights.keys() if isinstance(k, str)]
+            keys = []
+            pending = [weights]
+            while pending:
+                level = pending.pop(0)
+                for k, v in level.items():
+                    if not isinstance(k, str) or k in keys:
+                        continue
+                    if isinstance(v, dict):
+                        children = v.get("children")
+                        if isinstance(children, dict):
+                            pending.append(children)
+                    if k != "default" or level is weights:
+                        keys.append(k)
         except (OSError, json.JSONDecodeError, AttributeError):
             keys = []
         if "default" not in keys:
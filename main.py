@@ -8,11 +8,13 @@ import sys
 import time
 import threading
 import tempfile
+import psutil
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
-from dispatcher import FleetDispatcher
+from dispatcher import DispatchWakeup, FleetDispatcher, write_json_atomic
 
 DATA_ROOT = None
+PULL_DISPATCHER = None
 
 
 def get_sys_path(subpath):
@@ -296,7 +298,9 @@ class ActionaRunner:
             files = []
         return files
 
-    def _move_landing_zone_images(self, landing_zone, completed_dir, job_name=None):
+    def _move_landing_zone_images(
+        self, landing_zone, completed_dir, job_name=None, names=None
+    ):
         os.makedirs(completed_dir, exist_ok=True)
         moved = []
         print(
@@ -313,6 +317,7 @@ class ActionaRunner:
             for name in landing_contents
             if os.path.isfile(os.path.join(landing_zone, name))
             and os.path.splitext(name)[1].lower() in image_exts
+            and (names is None or name in names)
         ]
         print(f"DEBUG: Filtered image files found: {files}")
         files.sort(key=lambda name: os.path.getctime(os.path.join(landing_zone, name)))
@@ -339,7 +344,112 @@ class ActionaRunner:
                     print(f"❌ CRITICAL: Failed to move/copy {name}: {e2}")
         return moved
 
-    def _run_refresh(self, env):
+    def _move_landing_zone_outputs(
+        self, landing_zone, output_dir, job_name, output_ext, names=None
+    ):
+        os.makedirs(output_dir, exist_ok=True)
+        files = [
+            os.path.join(landing_zone, f)
+            for f in os.listdir(landing_zone)
+            if os.path.isfile(os.path.join(landing_zone, f))
+            and (names is None or f in names)
+        ]
+        if output_ext:
+            files = [f for f in files if f.lower().endswith(output_ext)]
+        files.sort(key=os.path.getctime)
+        moved = []
+        for idx, src in enumerate(files, start=1):
+            new_name = f"{job_name}_take{idx:03d}{output_ext}"
+            dest = os.path.join(output_dir, new_name)
+            shutil.move(src, dest)
+            print(
+                f"♻️ Collected and renamed {os.path.basename(src)} -> {new_name}"
+            )
+            moved.append(dest)
+        return moved
+
+    def _snapshot_outputs(self, landing_zone):
+        snapshot = {}
+        for name in self._list_files(landing_zone):
+            try:
+                st = os.stat(os.path.join(landing_zone, name))
+            except OSError:
+                continue
+            snapshot[name] = (st.st_size, st.st_mtime)
+        return snapshot
+
+    def _salvage_yielded(
+        self,
+        landing_zone,
+        snapshot,
+        yielded_at,
+        target_dir,
+        job_name,
+        is_image,
+        output_ext,
+        num_outputs,
+    ):
+        settle = float(self.config.get("output_settle_seconds", 5))
+        exts = {".png", ".jpg", ".jpeg"} if is_image else {(output_ext or "").lower()}
+        finished = set()
+        for name in self._list_files(landing_zone):
+            if os.path.splitext(name)[1].lower() not in exts:
+                continue
+            before = (snapshot or {}).get(name)
+            try:
+                st = os.stat(os.path.join(landing_zone, name))
+            except OSError:
+                continue
+            if (
+                before is not None
+                and before == (st.st_size, st.st_mtime)
+                and st.st_size > 0
+                and yielded_at - st.st_mtime >= settle
+            ):
+                finished.add(name)
+        for name in self._list_files(landing_zone):
+            if name in finished:
+                continue
+            try:
+                os.remove(os.path.join(landing_zone, name))
+                print(f"🗑️ Discarded unfinished output {name}")
+            except OSError:
+                pass
+        if len(finished) < num_outputs or not target_dir or not job_name:
+            print(
+                f"🛑 Job {job_name} yielded with {len(finished)}/{num_outputs} "
+                "finished output(s); prompt will be re-rendered."
+            )
+            return "yielded"
+        if is_image:
+            salvaged = self._move_landing_zone_images(
+                landing_zone, target_dir, job_name=job_name, names=finished
+            )
+        else:
+            salvaged = self._move_landing_zone_outputs(
+                landing_zone, target_dir, job_name, output_ext, names=finished
+            )
+        print(f"🛑 Job {job_name} yielded; salvaged {len(salvaged)} output(s).")
+        return "yielded_complete" if len(salvaged) >= num_outputs else "yielded"
+
+    def _sleep_unless_yield(self, seconds):
+        if not self.config.get("fast_preemption", False):
+            time.sleep(seconds)
+            return False
+        poll = max(0.2, float(self.config.get("yield_poll_interval", 1.0)))
+        deadline = time.time() + seconds
+        while True:
+            running = str(self.config.get("current_job") or "").split("/")[0]
+            if check_yield_command(self.config, running or None):
+                return True
+            if CONFIG.get("paused") or CONFIG.get("fleet_paused"):
+                return False
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll, remaining))
+
+    def _run_refresh(self, env, heartbeat_callback=None):
         refresh_script_cfg = (
             self.config.get("scripts", {}).get("refresh")
             or self.config.get("refresh_script")
@@ -349,9 +459,27 @@ class ActionaRunner:
         cmd = ["actexec", refresh_script]
         try:
             proc = subprocess.Popen(cmd, env=env)
-            proc.wait()
         except OSError:
-            pass
+            return
+        # Keep heartbeats flowing so the lead's failure detector sees a live worker.
+        while True:
+            try:
+                proc.wait(timeout=10)
+                return
+            except subprocess.TimeoutExpired:
+                if heartbeat_callback:
+                    heartbeat_callback()
+
+    def _note_health(self, ok, reason=None):
+        health = self.config.setdefault(
+            "health", {"since": int(time.time()), "ok": 0, "fail": 0, "reasons": {}}
+        )
+        if ok:
+            health["ok"] += 1
+            return
+        health["fail"] += 1
+        if reason:
+            health["reasons"][reason] = health["reasons"].get(reason, 0) + 1
 
     def _consume_flags(self, flags_dir):
         image_open_fail = os.path.join(flags_dir, "ImageOpenFail.txt")
@@ -379,6 +507,10 @@ class ActionaRunner:
                 except OSError:
                     pass
 
+        if has_image_open_fail:
+            self._note_health(False, "ImageOpenFail")
+        if has_no_hotbar:
+            self._note_health(False, "NOHOTBAR")
         if has_image_open_fail or has_no_hotbar:
             return "retry_refresh"
         if has_sensitive:
@@ -411,6 +543,9 @@ class ActionaRunner:
         partial_success = False
         retry_reason = None
         aborted = False
+        yielded = False
+        yielded_at = None
+        yield_snapshot = None
         stdout_file = None
         stderr_file = None
         timeout_val = (
@@ -431,6 +566,7 @@ class ActionaRunner:
                 cwd=get_sys_path(""),
                 shell=False,
             )
+            self.config["actexec_pid"] = proc.pid
         except OSError:
             if stdout_file:
                 stdout_file.close()
@@ -471,7 +607,13 @@ class ActionaRunner:
             if proc.poll() is not None:
                 break
 
-            time.sleep(10)
+            if self._sleep_unless_yield(10):
+                print("🛑 Yield received mid-prompt. Terminating script...")
+                yielded_at = time.time()
+                yield_snapshot = self._snapshot_outputs(landing_zone)
+                self._terminate_process(proc)
+                yielded = True
+                break
 
         stdout_data = ""
         stderr_data = ""
@@ -502,6 +644,9 @@ class ActionaRunner:
             "stderr": stderr_data,
             "retry_reason": retry_reason,
             "aborted": aborted,
+            "yielded": yielded,
+            "yielded_at": yielded_at,
+            "yield_snapshot": yield_snapshot,
         }
 
     def run(
@@ -540,6 +685,7 @@ class ActionaRunner:
         script_path = self._resolve_script_path(script_key)
         if not os.path.exists(script_path):
             print(f"❌ Script not found: {script_path}")
+            self._note_health(False, "script_missing")
             return False
 
         env = self._build_env()
@@ -586,14 +732,28 @@ class ActionaRunner:
                 heartbeat_callback=heartbeat_callback,
                 global_timeout_seconds=timeout_val,
             )
+            self.config.pop("actexec_pid", None)
             if result.get("aborted"): 
                 print(f"🛑 Job {job_name} aborted due to Pause.") 
                 return "aborted"
+            if result.get("yielded"):
+                return self._salvage_yielded(
+                    landing_zone,
+                    result.get("yield_snapshot"),
+                    result.get("yielded_at") or time.time(),
+                    completed_dir if is_image else output_dir,
+                    job_name,
+                    is_image,
+                    output_ext,
+                    num_outputs,
+                )
 
             if result.get("start_failed"):
+                self._note_health(False, "start_failed")
                 return False
             if result.get("retry_reason") == "global_timeout":
-                self._run_refresh(env)
+                self._note_health(False, "global_timeout")
+                self._run_refresh(env, heartbeat_callback)
                 if attempt < max_attempts:
                     continue
                 return False
@@ -601,7 +761,7 @@ class ActionaRunner:
             if not result.get("partial_success"):
                 flag_action = self._consume_flags(flags_dir)
                 if flag_action == "retry_refresh":
-                    self._run_refresh(env)
+                    self._run_refresh(env, heartbeat_callback)
                     if attempt < max_attempts:
                         continue
                     return False
@@ -633,6 +793,7 @@ class ActionaRunner:
             ):
                 if result.get("stderr"):
                     print(result["stderr"])
+                self._note_health(False, "script_error")
                 return False
 
             if is_image:
@@ -643,7 +804,9 @@ class ActionaRunner:
                     print(
                         "⚠️ Actiona finished but NO images were produced. Marking as failed."
                     )
+                    self._note_health(False, "empty_output")
                     return False
+                self._note_health(True)
                 return True
 
             if not output_dir or not job_name:
@@ -659,23 +822,166 @@ class ActionaRunner:
                 files = [f for f in files if f.lower().endswith(output_ext)]
             if not files:
                 print("❌ Actiona finished but NO videos were produced")
+                self._note_health(False, "empty_output")
                 if attempt < max_attempts:
                     continue
                 return False
-            files.sort(key=os.path.getctime)
-
-            for idx, src in enumerate(files, start=1):
-                new_name = f"{job_name}_take{idx:03d}{output_ext}"
-                dest = os.path.join(output_dir, new_name)
-                shutil.move(src, dest)
-                print(
-                    f"♻️ Collected and renamed {os.path.basename(src)} -> {new_name}"
-                )
+            self._move_landing_zone_outputs(landing_zone, output_dir, job_name, output_ext)
+            self._note_health(True)
             return True
 
         return False
 
 
+def worker_capabilities(config):
+    scripts = []
+    for key, value in (config.get("scripts") or {}).items():
+        if not isinstance(value, str) or not value:
+            continue
+        path = os.path.expanduser(value)
+        if not os.path.isabs(path):
+            path = get_sys_path(path)
+        if os.path.exists(path):
+            scripts.append(key)
+    displays = config.get("displays")
+    if not isinstance(displays, list):
+        displays = [config["display"]] if config.get("display") else []
+    try:
+        slots = max(1, int(config.get("slots", 1)))
+    except (TypeError, ValueError):
+        slots = 1
+    return {
+        "scripts": sorted(scripts),
+        "displays": len(displays),
+        "slots": slots,
+        "pull": bool(config.get("pull_mode")),
+    }
+
+
+def resource_telemetry(config):
+    mb = 1024 * 1024
+    now = time.time()
+    memory = psutil.virtual_memory()
+    swap = psutil.swap_memory()
+    telemetry = {
+        "cpu_percent": psutil.cpu_percent(interval=None),
+        "load_per_cpu": round(psutil.getloadavg()[0] / (psutil.cpu_count() or 1), 2),
+        "mem_available_mb": round(memory.available / mb),
+        "swap_percent": swap.percent,
+        "swap_io_mb_s": 0.0,
+    }
+    swap_io = swap.sin + swap.sout
+    last = config.get("swap_sample")
+    if last and now > last[0]:
+        telemetry["swap_io_mb_s"] = round(max(0, swap_io - last[1]) / mb / (now - last[0]), 2)
+    config["swap_sample"] = (now, swap_io)
+    try:
+        telemetry["disk_free_mb"] = round(psutil.disk_usage(get_sys_path("")).free / mb)
+    except OSError:
+        pass
+    rss = 0
+    pid = config.get("actexec_pid")
+    if pid:
+        try:
+            proc = psutil.Process(pid)
+            for member in [proc] + proc.children(recursive=True):
+                try:
+                    rss += member.memory_info().rss
+                except psutil.Error:
+                    pass
+        except psutil.Error:
+            pass
+    telemetry["actexec_rss_mb"] = round(rss / mb)
+    return telemetry
+
+
+def lease_status(config, job_name):
+    lease_path = get_sys_path(os.path.join("_system", "leases", f"{job_name}.json"))
+    try:
+        with open(lease_path, "r", encoding="utf-8") as f:
+            lease = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return "missing", None
+    if not isinstance(lease, dict):
+        return "missing", None
+    if lease.get("worker_id") != config.get("worker_id"):
+        return "foreign", lease
+    expires_at = lease.get("expires_at")
+    skew = config.get("lease_skew_seconds", 30)
+    if isinstance(expires_at, (int, float)) and time.time() > expires_at + skew:
+        return "expired", lease
+    return "held", lease
+
+
+def drop_duplicate(config, job_path, holder):
+    entry = os.path.basename(job_path)
+    print(f"⚠️ {entry} belongs to {holder}; dropping duplicate copy.")
+    log_activity(f"⚠️ Dropped duplicate {entry} owned by {holder}")
+    dup_dir = get_sys_path(os.path.join("_system", "duplicates", config.get("worker_id", "")))
+    os.makedirs(dup_dir, exist_ok=True)
+    try:
+        dest = os.path.join(dup_dir, entry)
+        if os.path.isdir(job_path):
+            safe_move_dir(job_path, dest)
+        else:
+            shutil.move(job_path, dest)
+    except OSError:
+        pass
+
+
+def pull_dispatcher(config):
+    global PULL_DISPATCHER
+    if PULL_DISPATCHER is None:
+        PULL_DISPATCHER = FleetDispatcher(config, get_sys_path)
+    return PULL_DISPATCHER
+
+
+def claim_job(config):
+    if not config.get("pull_mode"):
+        return False
+    role = config.get("initial_role", "")
+    if role not in ("img_worker", "img_lead", "vid_worker", "vid_lead"):
+        return False
+    queue_name = "vid_queue" if role.startswith("vid") else "img_queue"
+    queue_path = get_sys_path(os.path.join("01_job_factory", queue_name))
+    claimed = pull_dispatcher(config).claim_next_job(queue_path, config.get("worker_id"))
+    if not claimed:
+        return False
+    print(f"📥 Claimed {os.path.basename(claimed)} from {queue_name}")
+    # Start right away: lost_claim re-checks the winner before every prompt. A settle
+    # delay is opt-in for fleets that would rather wait than abort a started prompt.
+    settle = float(config.get("claim_settle_seconds", 0) or 0)
+    if settle > 0:
+        time.sleep(settle)
+    return True
+
+
+def lost_claim(config, job_path):
+    if not config.get("pull_mode"):
+        return False
+    winner = pull_dispatcher(config).claim_winner(os.path.basename(job_path))
+    if not winner or winner == config.get("worker_id"):
+        return False
+    drop_duplicate(config, job_path, winner)
+    return True
+
+
+def held_leases(config):
+    inbox_path = get_sys_path(
+        os.path.join("02_active_floor", config.get("worker_id", ""), "inbox")
+    )
+    try:
+        entries = [name for name in os.listdir(inbox_path) if not name.startswith(".")]
+    except OSError:
+        return {}
+    held = {}
+    for name in entries:
+        status, lease = lease_status(config, name)
+        if status in ("held", "expired"):
+            held[name] = lease.get("lease_id")
+    return held
+
+
 def send_heartbeat(config, status="IDLE", current_job=None):
     config["last_status"] = status
     if current_job is not None:
@@ -686,7 +992,17 @@ def send_heartbeat(config, status="IDLE", current_job=None):
         "status": status,
         "role": config.get("initial_role"),
         "current_job": current_job,
+        "capabilities": worker_capabilities(config),
+        "resources": resource_telemetry(config),
     }
+    if config.get("job_leases"):
+        heartbeat["leases"] = held_leases(config)
+    health = config.get("health")
+    if health:
+        heartbeat["health"] = dict(health, reasons=dict(health.get("reasons", {})))
+    prompt_started_at = config.get("prompt_started_at")
+    if status == "BUSY" and prompt_started_at:
+        heartbeat["prompt_elapsed"] = round(max(0.0, time.time() - prompt_started_at), 1)
 
     hb_folder = get_sys_path(os.path.join("_system", "heartbeats"))
     os.makedirs(hb_folder, exist_ok=True)
@@ -699,7 +1015,47 @@ def send_heartbeat(config, status="IDLE", current_job=None):
     print(f"♥ Heartbeat sent: {status}")
 
 
-def check_yield_command(config):
+def report_job_runtime(config, job_name, queue_name, seconds, done=False):
+    worker_id = config.get("worker_id")
+    if not worker_id or not job_name:
+        return
+    usage_path = get_sys_path(os.path.join("_system", "usage", f"{worker_id}.json"))
+    try:
+        with open(usage_path, "r", encoding="utf-8") as f:
+            ledger = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        ledger = {}
+    if not isinstance(ledger, dict):
+        ledger = {}
+    jobs = ledger.get("jobs") if isinstance(ledger.get("jobs"), dict) else {}
+    record = jobs.pop(job_name, None) or {}
+    record["seconds"] = round(float(record.get("seconds", 0) or 0) + max(0.0, seconds), 3)
+    record["queue"] = queue_name
+    record["done"] = done
+    record["updated_at"] = int(time.time())
+    jobs[job_name] = record
+    while len(jobs) > config.get("usage_ledger_size", 200):
+        jobs.pop(next(iter(jobs)))
+    ledger = {"worker_id": worker_id, "updated_at": int(time.time()), "jobs": jobs}
+    try:
+        write_json_atomic(usage_path, ledger)
+    except OSError as e:
+        print(f"⚠️ Could not write usage ledger: {e}")
+
+
+def clear_job_manifest(config, job_name):
+    manifest_dir = get_sys_path(
+        config.get("manifest_path") or os.path.join("01_job_factory", "manifests")
+    )
+    manifest_path = os.path.join(manifest_dir, f"{job_name}.json")
+    if os.path.exists(manifest_path):
+        try:
+            os.remove(manifest_path)
+        except OSError:
+            pass
+
+
+def check_yield_command(config, job_name=None):
     worker_id = config.get("worker_id")
     if not worker_id:
         return False
@@ -716,10 +1072,16 @@ def check_yield_command(config):
         return False
     if data.get("action") != "yield":
         return False
+    target = data.get("job")
+    # Heartbeats report video jobs as "<folder>/<image>"; match on the job itself.
+    stale = bool(job_name and target and str(target).split("/")[0] != job_name)
     try:
         os.remove(cmd_path)
     except OSError:
         pass
+    if stale:
+        print(f"⚠️ Ignoring stale yield for {target}; running {job_name}.")
+        return False
     return True
 
 
@@ -738,22 +1100,132 @@ def load_fleet_settings(config):
         return
     if "weights" in settings:
         config["weights"] = settings["weights"]
+    if "job_leases" in settings:
+        config["job_leases"] = bool(settings["job_leases"])
+    if "pull_mode" in settings:
+        config["pull_mode"] = bool(settings["pull_mode"])
     config["fleet_paused"] = settings.get("paused", False)
 
 
+class QueueIndexHandler(FileSystemEventHandler):
+    def __init__(self, dispatcher, wakeup=None):
+        super().__init__()
+        self.dispatcher = dispatcher
+        self.wakeup = wakeup
+
+    def _wake(self):
+        if self.wakeup:
+            self.wakeup.notify()
+
+    def on_created(self, event):
+        self.dispatcher.handle_queue_event("created", event.src_path)
+        self._wake()
+
+    def on_deleted(self, event):
+        self.dispatcher.handle_queue_event("deleted", event.src_path)
+
+    def on_moved(self, event):
+        self.dispatcher.handle_queue_event(
+            "moved", event.src_path, getattr(event, "dest_path", None)
+        )
+        self._wake()
+
+
+class HeartbeatWakeHandler(FileSystemEventHandler):
+    def __init__(self, wakeup, own_file=None):
+        super().__init__()
+        self.wakeup = wakeup
+        self.own_file = own_file
+        self.statuses = {}
+
+    def _wake(self, path):
+        name = os.path.basename(path or "")
+        if not name.endswith(".json") or name == self.own_file:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                status = json.load(f).get("status")
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return
+        previous = self.statuses.get(name)
+        self.statuses[name] = status
+        if status == previous or status not in ("IDLE", "OFFLINE"):
+            return
+        self.wakeup.notify()
+
+    def on_created(self, event):
+        self._wake(event.src_path)
+
+    def on_modified(self, event):
+        self._wake(event.src_path)
+
+    def on_moved(self, event):
+        self._wake(getattr(event, "dest_path", None))
+
+
+def start_dispatch_observer(dispatcher, wakeup=None):
+    observer = Observer()
+    handler = QueueIndexHandler(dispatcher, wakeup)
+    for queue_name in ("img_queue", "vid_queue"):
+        queue_path = get_sys_path(os.path.join("01_job_factory", queue_name))
+        os.makedirs(queue_path, exist_ok=True)
+        dispatcher.get_queue_index(queue_path)
+        observer.schedule(handler, queue_path, recursive=False)
+        print(f"DEBUG: 👀 Indexing QUEUE at: '{queue_path}'")
+    if wakeup:
+        hb_dir = dispatcher.config.get("heartbeat_path") or get_sys_path(
+            os.path.join("_system", "heartbeats")
+        )
+        os.makedirs(hb_dir, exist_ok=True)
+        own_file = f"{dispatcher.config.get('worker_id')}.json"
+        observer.schedule(HeartbeatWakeHandler(wakeup, own_file), hb_dir, recursive=False)
+        print(f"DEBUG: 👀 Watching HEARTBEATS at: '{hb_dir}'")
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
 def dispatcher_loop(config):
     dispatcher = FleetDispatcher(config, get_sys_path)
+    wakeup = DispatchWakeup(
+        debounce=config.get("dispatch_debounce", 0.5),
+        max_delay=config.get("dispatch_max_delay", 2.0),
+    )
+    dispatcher.wakeup = wakeup
+    fallback_interval = config.get("dispatch_fallback_interval", 60)
+    min_interval = config.get("dispatch_min_interval", 1.0)
+    try:
+        start_dispatch_observer(dispatcher, wakeup)
+    except OSError as e:
+        print(f"⚠️ Dispatch watcher unavailable, polling every 15s: {e}")
+        fallback_interval = 15
+    first_event = None
     while True:
+        cycle_start = time.time()
         load_fleet_settings(config)
         role = config.get("initial_role", "")
         if role.endswith("_lead"):
+            dispatcher.get_heartbeat_registry(force=True)
             dispatcher.recover_dead_workers()
-            img_queue = get_sys_path(os.path.join("01_job_factory", "img_queue"))
+            queue_name = "vid_queue" if role == "vid_lead" else "img_queue"
+            lead_queue = get_sys_path(os.path.join("01_job_factory", queue_name))
             active_floor = get_sys_path("02_active_floor")
-            dispatcher.enforce_vip_preemption(img_queue, active_floor)
+            dispatcher.enforce_vip_preemption(lead_queue, active_floor)
+            dispatcher.reclaim_expired_leases(queue_name)
+            if config.get("pull_mode"):
+                dispatcher.prune_claims()
             load_fleet_settings(config)
             dispatcher.dispatch_smart()
-        time.sleep(15)
+            latency = wakeup.record_dispatch(first_event)
+            if latency is not None:
+                print(
+                    f"DEBUG: Event-to-dispatch latency {latency:.2f}s "
+                    f"{wakeup.latency_stats()}"
+                )
+        remaining = min_interval - (time.time() - cycle_start)
+        if remaining > 0:
+            time.sleep(remaining)
+        first_event = wakeup.wait(fallback_interval)
 
 
 def process_command_file(file_path, config):
@@ -907,6 +1379,16 @@ def check_commands(config):
     return True
 
 
+def inbox_pending(config):
+    inbox_path = get_sys_path(
+        os.path.join("02_active_floor", config.get("worker_id", ""), "inbox")
+    )
+    try:
+        return any(not name.startswith(".") for name in os.listdir(inbox_path))
+    except OSError:
+        return False
+
+
 def process_jobs(config):
     inbox_rel = os.path.join("02_active_floor", config.get("worker_id", ""), "inbox")
     review_rel = "03_review_room"
@@ -925,9 +1407,20 @@ def process_jobs(config):
             print(f"DEBUG: Skipping system file: {entry}")
             continue
         candidate = os.path.join(inbox_path, entry)
-        if os.path.isfile(candidate) or os.path.isdir(candidate):
-            job_path = candidate
-            break
+        if not (os.path.isfile(candidate) or os.path.isdir(candidate)):
+            continue
+        if lost_claim(config, candidate):
+            continue
+        if config.get("job_leases"):
+            status, lease = lease_status(config, entry)
+            if status == "foreign":
+                drop_duplicate(config, candidate, lease.get("worker_id"))
+                continue
+            if status != "held":
+                print(f"DEBUG: No valid lease for {entry} ({status}); not starting it.")
+                continue
+        job_path = candidate
+        break
 
     if not job_path:
         return False
@@ -972,7 +1465,11 @@ def process_jobs(config):
             prompt_job_name = f"{job_name}_p{prompt_index}"
             if prompt_job_name in completed:
                 continue
+            if lost_claim(config, job_path):
+                return True
             print(f"🎨 Generating Image for prompt: \"{prompt}\"")
+            run_start = time.time()
+            config["prompt_started_at"] = run_start
             result = runner.run(
                 "img_gen",
                 prompt,
@@ -981,6 +1478,11 @@ def process_jobs(config):
                 is_image=True,
                 heartbeat_callback=hb_callback,
             )
+            config.pop("prompt_started_at", None)
+            report_job_runtime(config, filename, "img_queue", time.time() - run_start)
+            yielded = result in ("yielded", "yielded_complete")
+            if yielded:
+                result = result == "yielded_complete"
             if result:
                 completed.append(prompt_job_name)
                 log_activity(f"✅ Image set done: {prompt_job_name}")
@@ -1004,10 +1506,10 @@ def process_jobs(config):
                 except OSError as e:
                     print(f"❌ ERROR writing progress.json: {e}")
                     log_activity(f"❌ ERROR: writing progress.json failed: {e}")
-            else:
+            elif not yielded:
                 log_activity(f"❌ ERROR: Image set failed: {prompt_job_name}")
             print(f"DEBUG: Checking for preemption commands for {config.get('worker_id')}...")
-            if check_yield_command(config):
+            if yielded or check_yield_command(config, filename):
                 print("🛑 Preemption requested. Yielding job...")
                 img_queue = get_sys_path(os.path.join("01_job_factory", "img_queue"))
                 os.makedirs(img_queue, exist_ok=True)
@@ -1028,6 +1530,8 @@ def process_jobs(config):
             log_activity(f"⚠️ WARNING: Failed to move finished job: {e}")
             print(f"⚠️ WARNING: Failed to move finished job: {e}")
             return True
+        report_job_runtime(config, filename, "img_queue", 0, done=True)
+        clear_job_manifest(config, filename)
         print(f"✅ Job finished: {filename}")
         log_activity(f"✅ Job finished: {filename}")
         return True
@@ -1075,6 +1579,8 @@ def process_jobs(config):
         for image_name in images:
             if image_name in completed:
                 continue
+            if lost_claim(config, job_path):
+                return True
             image_path = os.path.join(job_path, image_name)
             prompt_path = os.path.splitext(image_path)[0] + ".txt"
             try:
@@ -1127,6 +1633,8 @@ def process_jobs(config):
             image_hb_callback = lambda: send_heartbeat(
                 config, status="BUSY", current_job=image_job_id
             )
+            run_start = time.time()
+            config["prompt_started_at"] = run_start
             success = runner.run(
                 "vid_gen",
                 prompt_text,
@@ -1138,6 +1646,8 @@ def process_jobs(config):
                 heartbeat_callback=image_hb_callback,
                 global_timeout=45 * 60,
             )
+            config.pop("prompt_started_at", None)
+            report_job_runtime(config, filename, "vid_queue", time.time() - run_start)
             if success == "aborted":
                 print("🛑 Video job aborted. Returning job to queue.")
                 vid_queue = get_sys_path(os.path.join("01_job_factory", "vid_queue"))
@@ -1148,6 +1658,9 @@ def process_jobs(config):
                 except OSError:
                     pass
                 return True
+            yielded = success in ("yielded", "yielded_complete")
+            if yielded:
+                success = success == "yielded_complete"
             if success:
                 completed.append(image_name)
                 try:
@@ -1161,7 +1674,7 @@ def process_jobs(config):
                 except OSError as e:
                     print(f"❌ ERROR writing progress.json: {e}")
                     log_activity(f"❌ ERROR: writing progress.json failed: {e}")
-            else:
+            elif not yielded:
                 log_activity(f"❌ ERROR: Video generation failed: {image_name}")
                 print("🛑 Video job failed. Returning job to queue.")
                 vid_queue = get_sys_path(os.path.join("01_job_factory", "vid_queue"))
@@ -1173,7 +1686,7 @@ def process_jobs(config):
                     pass
                 return True
             print(f"DEBUG: Checking for preemption commands for {config.get('worker_id')}...")
-            if check_yield_command(config):
+            if yielded or check_yield_command(config, filename):
                 print("🛑 Preemption requested. Yielding job...")
                 vid_queue = get_sys_path(os.path.join("01_job_factory", "vid_queue"))
                 os.makedirs(vid_queue, exist_ok=True)
@@ -1203,6 +1716,8 @@ def process_jobs(config):
             log_activity(f"❌ ERROR: Failed to move finished job: {e}")
             print(f"❌ ERROR: Failed to move finished job: {e}")
             return True
+        report_job_runtime(config, filename, "vid_queue", 0, done=True)
+        clear_job_manifest(config, filename)
         print(f"✅ Video Job finished: {filename}")
         log_activity(f"✅ Job finished: {filename}")
         return True
@@ -1327,7 +1842,10 @@ def main():
                 time.sleep(2)
                 continue
             did_work = process_jobs(CONFIG)
-            send_heartbeat(CONFIG, status="IDLE")
+            if not did_work and claim_job(CONFIG):
+                continue
+            if not (did_work and inbox_pending(CONFIG)):
+                send_heartbeat(CONFIG, status="IDLE")
             time.sleep(0.5)
             if did_work:
                 continue
@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import tempfile
+
+from dispatcher import FleetDispatcher
+
+
+def make_job(queue, name, mtime):
+    path = os.path.join(queue, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("prompt\n")
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def main():
+    root = tempfile.mkdtemp(prefix="rf_index_")
+    try:
+        queue = os.path.join(root, "01_job_factory", "img_queue")
+        os.makedirs(queue, exist_ok=True)
+        os.makedirs(os.path.join(root, "_system"), exist_ok=True)
+        weights = {"default": 1, "test": 2}
+        with open(os.path.join(root, "_system", "settings.json"), "w", encoding="utf-8") as f:
+            json.dump({"weights": weights}, f)
+
+        base = 1_700_000_000
+        make_job(queue, "test_c.txt", base + 30)
+        make_job(queue, "test_a.txt", base + 10)
+        make_job(queue, "test_b.txt", base + 20)
+        make_job(queue, "plain_z.txt", base + 5)
+        make_job(queue, ".syncthing.tmp", base)
+
+        dispatcher = FleetDispatcher(
+            {"syncthing_root": root, "weights": weights},
+            lambda p: os.path.join(root, p),
+            logger=lambda _msg: None,
+        )
+
+        # Validation A: FIFO by arrival inside a bucket, hidden files ignored
+        order = []
+        for _ in range(4):
+            job = dispatcher.get_next_job(queue, weights)
+            order.append(os.path.basename(job))
+            os.remove(job)
+            dispatcher.get_queue_index(queue).discard(os.path.basename(job))
+        assert order == ["test_a.txt", "test_b.txt", "plain_z.txt", "test_c.txt"], (
+            f"[FAIL] Unexpected dispatch order {order}"
+        )
+        assert dispatcher.get_next_job(queue, weights) is None, "[FAIL] Queue should be empty"
+        print("[PASS] Validation A: per-bucket FIFO + DRR order")
+
+        # Validation B: events keep the index current without a rescan
+        make_job(queue, "urgent_job.txt", base)
+        dispatcher.handle_queue_event("created", os.path.join(queue, "urgent_job.txt"))
+        job = dispatcher.get_next_job(queue, weights)
+        assert job and os.path.basename(job) == "urgent_job.txt", f"[FAIL] VIP not selected: {job}"
+        os.remove(job)
+        dispatcher.handle_queue_event("deleted", job)
+        assert len(dispatcher.get_queue_index(queue)) == 0, "[FAIL] Deleted job still indexed"
+        print("[PASS] Validation B: created/deleted events applied")
+
+        # Validation C: a missed delete is caught at selection time
+        make_job(queue, "test_d.txt", base)
+        dispatcher.get_queue_index(queue).add("test_d.txt")
+        os.remove(os.path.join(queue, "test_d.txt"))
+        assert dispatcher.get_next_job(queue, weights) is None, "[FAIL] Stale entry dispatched"
+        print("[PASS] Validation C: stale entries dropped")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,997 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import dispatcher as dispatcher_module
+from dispatcher import FleetDispatcher
+
+
+def write_settings(root, settings):
+    os.makedirs(os.path.join(root, "_system"), exist_ok=True)
+    with open(os.path.join(root, "_system", "settings.json"), "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+
+
+def make_txt_job(queue, name, prompts):
+    with open(os.path.join(queue, name), "w", encoding="utf-8") as f:
+        for p in range(prompts):
+            f.write(f"prompt {p}\n")
+
+
+def make_dispatcher(root, **overrides):
+    config = {"syncthing_root": root, "persist_scheduler_state": False}
+    config.update(overrides)
+    return FleetDispatcher(config, lambda p: os.path.join(root, p), logger=lambda _msg: None)
+
+
+def drain(dispatcher, queue, limit):
+    picked = []
+    for _ in range(limit):
+        job = dispatcher.get_next_job(queue, {})
+        if not job:
+            break
+        picked.append(os.path.basename(job))
+        os.remove(job)
+        dispatcher.get_queue_index(queue).discard(os.path.basename(job))
+    return picked
+
+
+def validate_cost_mode(root):
+    queue = os.path.join(root, "cost", "img_queue")
+    os.makedirs(queue, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1, "heavy": 1, "light": 1}})
+    for i in range(20):
+        make_txt_job(queue, f"heavy_{i:02d}.txt", 8)
+        make_txt_job(queue, f"light_{i:02d}.txt", 2)
+
+    dispatcher = make_dispatcher(root, drr_cost_mode="cost")
+    picked = drain(dispatcher, queue, 20)
+    heavy_work = sum(8 for name in picked if name.startswith("heavy"))
+    light_work = sum(2 for name in picked if name.startswith("light"))
+    assert abs(heavy_work - light_work) <= 8, (
+        f"[FAIL] Cost DRR work split heavy={heavy_work} light={light_work}"
+    )
+    assert not dispatcher.runtime_pending, "[FAIL] Cost mode charged runtime estimates"
+    state_key = dispatcher._class_state_key(
+        dispatcher.get_queue_index(queue).queue_path, dispatcher._default_priority()
+    )
+    before = dict(dispatcher.deficits[state_key])
+    job = dispatcher.get_next_job(queue, {})
+    dispatcher.refund_dispatch(job)
+    assert dispatcher.deficits[state_key] == before, "[FAIL] Failed move kept its DRR charge"
+    print(f"[PASS] Cost mode: work split heavy={heavy_work} light={light_work}, refunds restored")
+
+
+def validate_vruntime_mode(root):
+    queue = os.path.join(root, "vruntime", "img_queue")
+    os.makedirs(queue, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1, "slow": 1, "fast": 1}})
+    for i in range(40):
+        make_txt_job(queue, f"slow_{i:02d}.txt", 1)
+        make_txt_job(queue, f"fast_{i:02d}.txt", 1)
+
+    dispatcher = make_dispatcher(root, scheduler_mode="vruntime")
+    usage_path = os.path.join(root, "_system", "usage", "w1.json")
+    os.makedirs(os.path.dirname(usage_path), exist_ok=True)
+    runtime = {"slow": 0.0, "fast": 0.0}
+    ledger = {}
+    for step in range(33):
+        job = dispatcher.get_next_job(queue, {})
+        name = os.path.basename(job)
+        os.remove(job)
+        dispatcher.get_queue_index(queue).discard(name)
+        bucket = name.split("_")[0]
+        seconds = 100.0 if bucket == "slow" else 10.0
+        runtime[bucket] += seconds
+        ledger[name] = {"seconds": seconds, "queue": "img_queue", "done": True}
+        with open(usage_path, "w", encoding="utf-8") as f:
+            json.dump({"worker_id": "w1", "step": step, "jobs": ledger}, f)
+        dispatcher.collect_runtime_usage()
+    assert abs(runtime["slow"] - runtime["fast"]) <= 200, (
+        f"[FAIL] VRuntime compute split {runtime}"
+    )
+    before = dict(dispatcher.vruntime["img_queue"])
+    job = dispatcher.get_next_job(queue, {})
+    dispatcher.refund_dispatch(job)
+    assert os.path.basename(job) not in dispatcher.runtime_pending, "[FAIL] Refund left pending"
+    after = dispatcher.vruntime["img_queue"]
+    assert all(abs(after[b] - before[b]) < 1e-6 for b in before), (
+        f"[FAIL] Refund did not restore vruntime {before} -> {after}"
+    )
+    print(f"[PASS] VRuntime mode: compute split {runtime}, refund restored vruntime")
+
+
+def validate_aging(root):
+    queue = os.path.join(root, "aging", "img_queue")
+    os.makedirs(queue, exist_ok=True)
+    write_settings(
+        root,
+        {"weights": {"default": 10, "background": 1}, "max_wait_seconds": {"background": 600}},
+    )
+    for i in range(30):
+        make_txt_job(queue, f"render_{i:02d}.txt", 1)
+    make_txt_job(queue, "background_old.txt", 1)
+    old = os.path.getmtime(os.path.join(queue, "background_old.txt")) - 3600
+    os.utime(os.path.join(queue, "background_old.txt"), (old, old))
+
+    dispatcher = make_dispatcher(root)
+    picked = drain(dispatcher, queue, 3)
+    assert picked[0] == "background_old.txt", f"[FAIL] Aged job not promoted: {picked}"
+    stats = dispatcher.queue_wait_stats().get("img_queue", {})
+    assert stats.get("background", {}).get("p99", 0) >= 3600, f"[FAIL] Wait stats {stats}"
+    print(f"[PASS] Aging: overdue background job promoted, stats {sorted(stats)}")
+
+
+def validate_deadlines(root):
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    manifests = os.path.join(root, "01_job_factory", "manifests")
+    os.makedirs(queue, exist_ok=True)
+    os.makedirs(manifests, exist_ok=True)
+    write_settings(root, {"weights": {"default": 10, "client": 1}, "edf_mode": True})
+    for i in range(10):
+        make_txt_job(queue, f"render_{i:02d}.txt", 1)
+    make_txt_job(queue, "client_late.txt", 4)
+    make_txt_job(queue, "client_soon.txt", 4)
+    now = time.time()
+    with open(os.path.join(manifests, "client_late.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"deadline": now + 600, "cost_estimate": 1200}, f)
+    with open(os.path.join(manifests, "client_soon.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"deadline": datetime.fromtimestamp(now + 300).isoformat()}, f)
+
+    dispatcher = make_dispatcher(root)
+    picked = drain(dispatcher, queue, 2)
+    assert picked == ["client_soon.txt", "client_late.txt"], f"[FAIL] EDF order {picked}"
+    print("[PASS] Deadlines: EDF order ahead of weights")
+
+    make_txt_job(queue, "client_hopeless.txt", 1)
+    with open(os.path.join(manifests, "client_hopeless.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"deadline": now + 10, "cost_estimate": 900}, f)
+    dispatcher.get_queue_index(queue).add("client_hopeless.txt")
+    dispatcher.get_manifest_store().refresh(force=True)
+    dispatcher.get_next_job(queue, {})
+    flagged = [item["job"] for item in dispatcher.deadline_report().get("img_queue", [])]
+    assert "client_hopeless.txt" in flagged, f"[FAIL] Missed deadline not flagged: {flagged}"
+    print("[PASS] Deadlines: projected miss flagged")
+
+
+def validate_priority_classes(root):
+    queue = os.path.join(root, "classes", "img_queue")
+    os.makedirs(queue, exist_ok=True)
+    write_settings(
+        root,
+        {"weights": {"default": 1}, "priority_rate_limits": {"P0": 2}},
+    )
+    for i in range(5):
+        make_txt_job(queue, f"flood_{i}_VIP.txt", 1)
+    make_txt_job(queue, "normal_job.txt", 1)
+    make_txt_job(queue, "rush_job_PRIO1.txt", 1)
+
+    dispatcher = make_dispatcher(root)
+    picked = drain(dispatcher, queue, 7)
+    assert picked[:2] == ["flood_0_VIP.txt", "flood_1_VIP.txt"], f"[FAIL] P0 FIFO {picked}"
+    assert picked[2:4] == ["rush_job_PRIO1.txt", "normal_job.txt"], f"[FAIL] Class order {picked}"
+    assert picked[4:] == ["flood_2_VIP.txt", "flood_3_VIP.txt", "flood_4_VIP.txt"], (
+        f"[FAIL] Rate-limited class not resumed {picked}"
+    )
+    for name in ("default_shoot_p0.txt", "default_sku-p0-final.txt", "default_catalog_p1.txt"):
+        assert dispatcher.job_priority(name) == dispatcher._default_priority(), (
+            f"[FAIL] Free-text name {name} set a priority class"
+        )
+    print("[PASS] Priority classes: FIFO in class, rate limit yields to lower classes")
+
+
+def validate_manifest_reprioritize(root):
+    queue = os.path.join(root, "reprio", "img_queue")
+    manifests = os.path.join(root, "01_job_factory", "manifests")
+    os.makedirs(queue, exist_ok=True)
+    os.makedirs(manifests, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}})
+    for i in range(50):
+        make_txt_job(queue, f"bulk_{i:02d}.txt", 1)
+        os.utime(os.path.join(queue, f"bulk_{i:02d}.txt"), (1000 + i, 1000 + i))
+
+    dispatcher = make_dispatcher(root)
+    assert drain(dispatcher, queue, 1) == ["bulk_00.txt"], "[FAIL] FIFO before manifests"
+    index = dispatcher.get_queue_index(queue)
+    rebuilt = []
+    make_entry = index._make_entry
+    index._make_entry = lambda name, arrival: rebuilt.append(name) or make_entry(name, arrival)
+    with open(os.path.join(manifests, "bulk_40.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"priority": 0}, f)
+    with open(os.path.join(manifests, "gone_job.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"priority": 0}, f)
+    dispatcher.get_manifest_store().refresh(force=True)
+    assert drain(dispatcher, queue, 1) == ["bulk_40.txt"], "[FAIL] Manifest priority ignored"
+    os.remove(os.path.join(manifests, "gone_job.txt.json"))
+    dispatcher.get_manifest_store().refresh(force=True)
+    assert drain(dispatcher, queue, 1) == ["bulk_01.txt"], "[FAIL] FIFO after manifests"
+    assert rebuilt == ["bulk_40.txt"], f"[FAIL] Manifest change rebuilt the index {rebuilt}"
+    print("[PASS] Manifest changes: only the affected job was re-prioritized")
+
+
+def validate_hierarchy(root):
+    queue = os.path.join(root, "tree", "img_queue")
+    os.makedirs(queue, exist_ok=True)
+    write_settings(
+        root,
+        {
+            "weights": {
+                "default": 1,
+                "acme": {
+                    "weight": 1,
+                    "children": {**{f"acmeproj{p}": 1 for p in range(5)}, "default": 5},
+                },
+                "solo": {"weight": 1, "children": {"soloproj": 1}},
+            }
+        },
+    )
+    for i in range(20):
+        for p in range(5):
+            make_txt_job(queue, f"acmeproj{p}_{i:02d}.txt", 1)
+        make_txt_job(queue, f"soloproj_{i:02d}.txt", 1)
+    make_txt_job(queue, "misc_job.txt", 1)
+    manifests = os.path.join(root, "01_job_factory", "manifests")
+    os.makedirs(manifests, exist_ok=True)
+    with open(os.path.join(manifests, "misc_job.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"weight_path": "solo/soloproj"}, f)
+
+    dispatcher = make_dispatcher(root)
+    assert dispatcher.job_bucket("misc_job.txt") == "soloproj", "[FAIL] Manifest path ignored"
+    assert dispatcher.job_bucket("acmeproj3_00.txt") == "acmeproj3", (
+        "[FAIL] Group catch-all outranked a child key"
+    )
+    assert dispatcher.job_bucket("acme_misc.txt") == "acme", "[FAIL] Group catch-all unused"
+    picked = drain(dispatcher, queue, 30)
+    acme = sum(1 for name in picked if name.startswith("acme"))
+    solo = len(picked) - acme
+    assert abs(acme - solo) <= 1, f"[FAIL] Customer split acme={acme} solo={solo}"
+    print(f"[PASS] Hierarchy: customer split acme={acme} solo={solo}")
+
+
+def validate_concurrency_caps(root):
+    queue = os.path.join(root, "caps", "img_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    busy_inbox = os.path.join(root, "02_active_floor", "w2", "inbox")
+    os.makedirs(queue, exist_ok=True)
+    os.makedirs(hb_dir, exist_ok=True)
+    os.makedirs(busy_inbox, exist_ok=True)
+    write_settings(
+        root, {"weights": {"default": 1, "acct": 5}, "max_concurrent": {"acct": 2}}
+    )
+    for worker_id, job, age in (
+        ("w1", "acct_running.txt", 0),
+        ("w2", None, 0),
+        ("w3", "acct_dead.txt", 600),
+    ):
+        with open(os.path.join(hb_dir, f"{worker_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "worker_id": worker_id,
+                    "role": "img_worker",
+                    "status": "BUSY" if job else "IDLE",
+                    "current_job": job,
+                    "timestamp": int(time.time()) - age,
+                },
+                f,
+            )
+    make_txt_job(busy_inbox, "acct_assigned.txt", 1)
+    for i in range(5):
+        make_txt_job(queue, f"acct_{i}.txt", 1)
+        make_txt_job(queue, f"other_{i}.txt", 1)
+
+    dispatcher = make_dispatcher(root)
+    picked = drain(dispatcher, queue, 3)
+    assert all(name.startswith("other") for name in picked), f"[FAIL] Cap ignored {picked}"
+    os.remove(os.path.join(busy_inbox, "acct_assigned.txt"))
+    picked = drain(dispatcher, queue, 1)
+    assert picked == ["acct_0.txt"], f"[FAIL] Capped bucket not resumed {picked}"
+    os.remove(os.path.join(hb_dir, "w3.json"))
+    print(
+        "[PASS] Concurrency caps: capped bucket skipped, resumed when a slot frees, "
+        "stale heartbeats ignored"
+    )
+
+
+def validate_vip_reserve(root):
+    root = os.path.join(root, "reserve")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    os.makedirs(queue, exist_ok=True)
+    os.makedirs(hb_dir, exist_ok=True)
+    write_settings(
+        root,
+        {"weights": {"default": 1}, "vip_reserve": {"img_worker": 2}, "short_job_max_cost": 3},
+    )
+    workers = ["w1", "w2", "w3", "w4"]
+    for worker_id in workers:
+        with open(os.path.join(hb_dir, f"{worker_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "worker_id": worker_id,
+                    "role": "img_worker",
+                    "status": "IDLE",
+                    "timestamp": int(time.time()),
+                },
+                f,
+            )
+    base = time.time() - 600
+    for i, (name, prompts) in enumerate(
+        [("long_0.txt", 10), ("long_1.txt", 10), ("long_2.txt", 10), ("short_0.txt", 2)]
+    ):
+        make_txt_job(queue, name, prompts)
+        os.utime(os.path.join(queue, name), (base + i, base + i))
+
+    dispatcher = make_dispatcher(root, worker_id="w1", initial_role="img_lead")
+    assigned = dispatcher.dispatch_smart()
+    inboxes = {}
+    for worker_id in workers:
+        inbox = os.path.join(root, "02_active_floor", worker_id, "inbox")
+        for name in os.listdir(inbox) if os.path.isdir(inbox) else []:
+            inboxes[name] = worker_id
+    assert assigned == 3, f"[FAIL] Reserve assignments {inboxes}"
+    assert set(inboxes) == {"long_0.txt", "long_1.txt", "short_0.txt"}, (
+        f"[FAIL] Reserved workers took long jobs {inboxes}"
+    )
+    write_settings(root, {"weights": {"default": 1}, "short_job_max_cost": "three"})
+    dispatcher = make_dispatcher(root, worker_id="w1", initial_role="img_lead")
+    assert not dispatcher._is_short_job(os.path.join(queue, "long_2.txt")), (
+        "[FAIL] Bad short_job_max_cost not defaulted"
+    )
+    print("[PASS] VIP reserve: reserved workers only took short jobs")
+
+
+def validate_preemption_victims(root):
+    root = os.path.join(root, "preempt")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    cmd_dir = os.path.join(root, "_system", "commands")
+    img_queue = os.path.join(root, "01_job_factory", "img_queue")
+    vid_queue = os.path.join(root, "01_job_factory", "vid_queue")
+    for path in (hb_dir, img_queue, vid_queue):
+        os.makedirs(path, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}})
+    running = [
+        ("w1", "img_worker", "bg_a.txt", 300, 2),
+        ("w2", "img_worker", "bg_b.txt", 20, 1),
+        ("w3", "img_worker", "bg_c.txt", 5, 9),
+        ("w4", "vid_worker", "clip_d/frame_000.png", 1, 0),
+    ]
+    for worker_id, role, current_job, elapsed, done in running:
+        inbox = os.path.join(root, "02_active_floor", worker_id, "inbox")
+        os.makedirs(inbox, exist_ok=True)
+        job_name = current_job.split("/")[0]
+        if role == "vid_worker":
+            job_dir = os.path.join(inbox, job_name)
+            os.makedirs(job_dir, exist_ok=True)
+            for i in range(3):
+                with open(os.path.join(job_dir, f"frame_{i:03d}.png"), "w") as f:
+                    f.write("png")
+            progress_dir = job_dir
+        else:
+            make_txt_job(inbox, job_name, 10)
+            progress_dir = os.path.join(root, "03_review_room", job_name[:-4])
+            os.makedirs(progress_dir, exist_ok=True)
+        with open(os.path.join(progress_dir, "progress.json"), "w", encoding="utf-8") as f:
+            json.dump({"completed_files": [f"p{i}" for i in range(done)]}, f)
+        with open(os.path.join(hb_dir, f"{worker_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "worker_id": worker_id,
+                    "role": role,
+                    "status": "BUSY",
+                    "current_job": current_job,
+                    "prompt_elapsed": elapsed,
+                    "timestamp": int(time.time()),
+                },
+                f,
+            )
+    make_txt_job(img_queue, "launch_VIP.txt", 1)
+
+    dispatcher = make_dispatcher(root)
+    assert dispatcher.enforce_vip_preemption(img_queue, None) == 1, "[FAIL] No yield sent"
+    assert sorted(os.listdir(cmd_dir)) == ["w2.cmd"], f"[FAIL] Victims {os.listdir(cmd_dir)}"
+    assert dispatcher.enforce_vip_preemption(img_queue, None) == 0, "[FAIL] Extra yield sent"
+    os.makedirs(os.path.join(vid_queue, "promo_VIP"), exist_ok=True)
+    assert dispatcher.enforce_vip_preemption(vid_queue, None) == 1, "[FAIL] Vid yield missing"
+    assert os.path.exists(os.path.join(cmd_dir, "w4.cmd")), "[FAIL] Vid worker not preempted"
+    print("[PASS] Preemption: least in-flight work yields, one per VIP job, both queues")
+
+
+def write_heartbeat(hb_dir, worker_id, status, current_job=None, role="img_worker", **extra):
+    with open(os.path.join(hb_dir, f"{worker_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "worker_id": worker_id,
+                "role": role,
+                "status": status,
+                "current_job": current_job,
+                "timestamp": int(time.time()),
+                **extra,
+            },
+            f,
+        )
+
+
+def validate_prefetch(root):
+    root = os.path.join(root, "prefetch")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    inbox = lambda worker_id: os.path.join(root, "02_active_floor", worker_id, "inbox")
+    for path in (queue, hb_dir, inbox("w1")):
+        os.makedirs(path, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}, "prefetch_depth": 1})
+    make_txt_job(inbox("w1"), "current_a.txt", 5)
+    write_heartbeat(hb_dir, "w1", "BUSY", "current_a.txt")
+    write_heartbeat(hb_dir, "w2", "IDLE")
+    for i in range(4):
+        make_txt_job(queue, f"job_{i}.txt", 5)
+
+    dispatcher = make_dispatcher(root, worker_id="w2", initial_role="img_lead")
+    assert dispatcher.dispatch_smart() == 3, "[FAIL] Prefetch assignments"
+    assert sorted(os.listdir(inbox("w1"))) == ["current_a.txt", "job_1.txt"], (
+        f"[FAIL] Busy worker not prefetched {os.listdir(inbox('w1'))}"
+    )
+    assert len(os.listdir(inbox("w2"))) == 2, "[FAIL] Idle worker prefetch"
+    print("[PASS] Prefetch: busy and newly assigned workers hold one extra job")
+
+    write_heartbeat(hb_dir, "w2", "BUSY", "job_0.txt")
+    make_txt_job(queue, "launch_VIP.txt", 1)
+    dispatcher.handle_queue_event("created", os.path.join(queue, "launch_VIP.txt"))
+    dispatcher.get_heartbeat_registry(force=True)
+    assert dispatcher.enforce_vip_preemption(queue, None) == 1, "[FAIL] No yield sent"
+    reclaimed = [name for name in ("job_1.txt", "job_2.txt") if os.path.exists(os.path.join(queue, name))]
+    assert len(reclaimed) == 1, f"[FAIL] Prefetched job not reclaimed {os.listdir(queue)}"
+    assert dispatcher.dispatch_smart() == 0, "[FAIL] Yielding worker was refilled"
+    print(f"[PASS] Prefetch: {reclaimed[0]} reclaimed from the yielding worker")
+
+
+def validate_placement(root):
+    root = os.path.join(root, "placement")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    manifests = os.path.join(root, "01_job_factory", "manifests")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    floor = os.path.join(root, "02_active_floor")
+    for path in (queue, manifests, hb_dir):
+        os.makedirs(path, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}})
+    generic = {"scripts": ["img_gen"], "displays": 1, "slots": 1}
+    for worker_id in ("w1", "w2", "w3"):
+        write_heartbeat(hb_dir, worker_id, "IDLE", capabilities=generic)
+    dispatcher = make_dispatcher(root, worker_id="w1", initial_role="img_lead", last_status="IDLE")
+
+    order = []
+    for i in range(6):
+        make_txt_job(queue, f"job_{i}.txt", 1)
+        dispatcher.handle_queue_event("created", os.path.join(queue, f"job_{i}.txt"))
+        assert dispatcher.dispatch_smart() == 1, "[FAIL] Single job not placed"
+        for worker_id in os.listdir(floor):
+            inbox = os.path.join(floor, worker_id, "inbox")
+            if os.listdir(inbox):
+                order.append(worker_id)
+                shutil.rmtree(inbox)
+    assert order == ["w1", "w2", "w3", "w1", "w2", "w3"], f"[FAIL] Placement rotation {order}"
+    print(f"[PASS] Placement: least-recently-assigned rotation {order}")
+
+    write_heartbeat(
+        hb_dir, "w3", "IDLE", capabilities={"scripts": ["img_gen", "img_upscale"], "displays": 2}
+    )
+    with open(os.path.join(manifests, "hd_job.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"requires": {"scripts": ["img_upscale"], "displays": 2}}, f)
+    make_txt_job(queue, "hd_job.txt", 1)
+    dispatcher.handle_queue_event("created", os.path.join(queue, "hd_job.txt"))
+    dispatcher.get_manifest_store().refresh(force=True)
+    assert dispatcher.dispatch_smart() == 1, "[FAIL] Constrained job not placed"
+    assert os.listdir(os.path.join(floor, "w3", "inbox")) == ["hd_job.txt"], (
+        "[FAIL] Constrained job went to a worker without the script"
+    )
+    write_heartbeat(hb_dir, "w3", "BUSY", "hd_job.txt", capabilities=generic)
+    shutil.rmtree(os.path.join(floor, "w3", "inbox"))
+    make_txt_job(queue, "hd_job.txt", 1)
+    dispatcher.handle_queue_event("created", os.path.join(queue, "hd_job.txt"))
+    assert dispatcher.dispatch_smart() == 0, "[FAIL] Constrained job placed on an incapable worker"
+    print("[PASS] Placement: script/display requirements matched to capabilities")
+
+
+def validate_worker_health(root):
+    root = os.path.join(root, "health")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    floor = os.path.join(root, "02_active_floor")
+    for path in (queue, hb_dir):
+        os.makedirs(path, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}})
+    counters = {
+        "w1": {"since": 1, "ok": 0, "fail": 6, "reasons": {"NOHOTBAR": 6}},
+        "w2": {"since": 1, "ok": 1, "fail": 3, "reasons": {"global_timeout": 3}},
+        "w3": {"since": 1, "ok": 5, "fail": 0, "reasons": {}},
+    }
+    for worker_id, health in counters.items():
+        write_heartbeat(hb_dir, worker_id, "IDLE", health=health)
+    dispatcher = make_dispatcher(root, worker_id="lead", initial_role="img_lead")
+
+    placed = []
+    for i in range(3):
+        make_txt_job(queue, f"job_{i}.txt", 1)
+        dispatcher.handle_queue_event("created", os.path.join(queue, f"job_{i}.txt"))
+        if dispatcher.dispatch_smart():
+            placed += [
+                w
+                for w in sorted(os.listdir(floor))
+                if f"job_{i}.txt" in os.listdir(os.path.join(floor, w, "inbox"))
+            ]
+    assert placed == ["w3", "w2"], f"[FAIL] Health-aware placement {placed}"
+    with open(os.path.join(root, "_system", "worker_health.json"), "r", encoding="utf-8") as f:
+        record = json.load(f)["workers"]
+    states = {w: record[w]["state"] for w in sorted(record)}
+    assert states == {"w1": "quarantined", "w2": "degraded", "w3": "healthy"}, (
+        f"[FAIL] Health states {states}"
+    )
+    assert record["w1"]["reasons"] == {"NOHOTBAR": 6}, "[FAIL] Failure reasons not recorded"
+
+    dispatcher.worker_health["w1"]["updated_at"] -= 4 * 3600
+    dispatcher.update_worker_health()
+    assert dispatcher.health_state("w1") == "healthy", "[FAIL] Quarantine never decays"
+
+    burst = {"since": 1, "ok": 10**9, "fail": 10**9, "reasons": {}}
+    write_heartbeat(hb_dir, "w4", "IDLE", health=burst)
+    dispatcher.get_heartbeat_registry(force=True)
+    dispatcher.update_worker_health()
+    score = dispatcher.worker_health["w4"]["score"]
+    assert abs(score - 0.5) < 0.01, f"[FAIL] Counter burst scored {score}"
+    print(f"[PASS] Worker health: {states}, quarantine decays back to healthy")
+
+
+def validate_resource_admission(root):
+    root = os.path.join(root, "resources")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    floor = os.path.join(root, "02_active_floor")
+    for path in (queue, hb_dir):
+        os.makedirs(path, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}})
+    healthy = {"disk_free_mb": 4000, "mem_available_mb": 2000, "swap_io_mb_s": 0.0}
+    write_heartbeat(hb_dir, "w1", "IDLE", resources=dict(healthy, disk_free_mb=300))
+    write_heartbeat(hb_dir, "w2", "IDLE", resources=dict(healthy, swap_io_mb_s=40.0))
+    write_heartbeat(hb_dir, "w3", "IDLE", resources=healthy)
+    for i in range(3):
+        make_txt_job(queue, f"job_{i}.txt", 1)
+    dispatcher = make_dispatcher(root, worker_id="lead", initial_role="img_lead")
+
+    assert dispatcher.dispatch_smart() == 1, "[FAIL] Starved nodes received jobs"
+    assert os.listdir(floor) == ["w3"], f"[FAIL] Wrong node admitted {os.listdir(floor)}"
+    assert dispatcher._resource_shortfall("w3", "vid"), "[FAIL] Video disk floor not applied"
+    write_settings(
+        root, {"weights": {"default": 1}, "resource_limits": {"img": {"swap_io_mb_s": None}}}
+    )
+    assert dispatcher._resource_shortfall("w2", "img") is None, "[FAIL] Limit override ignored"
+    print("[PASS] Resources: low-disk and swapping nodes held, stricter video floor")
+
+
+class SimClock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def validate_failure_detector(root):
+    root = os.path.join(root, "detector")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    floor = os.path.join(root, "02_active_floor")
+    os.makedirs(queue, exist_ok=True)
+    os.makedirs(hb_dir, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}, "job_leases": True})
+    now = time.time()
+    # (worker, seconds since last arrival, heartbeat clock offset, beats sent)
+    workers = [
+        ("w1", 40, 0, 12),
+        ("w2", 12, 0, 12),
+        ("w3", 100, 0, 1),
+        ("w4", 200, 0, 1),
+        ("w5", 1, -400, 12),
+        ("w6", 60, 0, 12),
+        ("w7", 120, 0, 12),
+        ("w8", 200, 0, 12),
+    ]
+    arrivals = []
+    for worker_id, silence, skew, beats in workers:
+        os.makedirs(os.path.join(floor, worker_id, "inbox"), exist_ok=True)
+        make_txt_job(os.path.join(floor, worker_id, "inbox"), f"{worker_id}_job.txt", 3)
+        at = now - silence
+        # Watchdog cadence is 10s; jitter models Syncthing delivery.
+        for beat in range(beats):
+            arrivals.append((at, worker_id, skew))
+            at -= (9.0, 10.0, 11.0)[beat % 3]
+    dispatcher = make_dispatcher(root)
+    dispatcher.grant_lease("w7_job.txt", "w7", "img_queue")
+    clock = SimClock(min(at for at, _w, _s in arrivals) - 1)
+    dispatcher_module.time = clock
+    try:
+        registry = dispatcher.get_heartbeat_registry(hb_dir)
+        for at, worker_id, skew in sorted(arrivals):
+            clock.now = at
+            write_heartbeat(
+                hb_dir, worker_id, "BUSY", f"{worker_id}_job.txt", timestamp=int(at + skew)
+            )
+            os.utime(os.path.join(hb_dir, f"{worker_id}.json"), (at, at))
+            registry.refresh(force=True)
+    finally:
+        dispatcher_module.time = time
+    assert len(registry.intervals.get("w1", ())) == 11, "[FAIL] Arrivals not recorded"
+    assert "w3" not in registry.intervals, "[FAIL] Single arrival produced an interval"
+
+    dispatcher.recover_stranded_jobs(hb_dir, floor, queue, queue)
+    recovered = sorted(os.listdir(queue))
+    assert "w1_job.txt" not in recovered and "w6_job.txt" not in recovered, (
+        f"[FAIL] Worker lagging 40-60s was recovered {recovered}"
+    )
+    assert recovered == ["w4_job.txt", "w7_job.txt", "w8_job.txt"], (
+        f"[FAIL] Recovered {recovered}"
+    )
+    print(
+        "[PASS] Failure detector: 40-60s lag tolerated, leased job recovered early, "
+        "skewed clock tolerated"
+    )
+
+
+def validate_stranded_recovery(root):
+    root = os.path.join(root, "stranded")
+    img_queue = os.path.join(root, "01_job_factory", "img_queue")
+    vid_queue = os.path.join(root, "01_job_factory", "vid_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    floor = os.path.join(root, "02_active_floor")
+    for path in (img_queue, vid_queue, hb_dir):
+        os.makedirs(path, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}, "paused_grace_seconds": 0})
+    workers = {
+        "w_off": "OFFLINE",
+        "w_start": "STARTING",
+        "w_pause": "PAUSED",
+        "w_idle": "IDLE",
+        "w_busy": "BUSY",
+        "w_gone": None,
+    }
+    for worker_id, status in workers.items():
+        inbox = os.path.join(floor, worker_id, "inbox")
+        os.makedirs(inbox, exist_ok=True)
+        make_txt_job(inbox, f"{worker_id}.txt", 2)
+        if status:
+            write_heartbeat(hb_dir, worker_id, status, f"{worker_id}.txt")
+    clip = os.path.join(floor, "w_off", "inbox", "clip_a")
+    os.makedirs(clip)
+    with open(os.path.join(clip, "progress.json"), "w", encoding="utf-8") as f:
+        json.dump({"completed_files": ["f1.png"], "status": "in_progress"}, f)
+    queued_clip = os.path.join(vid_queue, "clip_a")
+    os.makedirs(queued_clip)
+    with open(os.path.join(queued_clip, "progress.json"), "w", encoding="utf-8") as f:
+        json.dump({"completed_files": ["f0.png"]}, f)
+
+    dispatcher = make_dispatcher(root, starting_grace_seconds=60)
+    registry = dispatcher.get_heartbeat_registry(hb_dir)
+    registry.get("w_start")["timestamp"] = int(time.time()) - 120
+    dispatcher.stranded_workers(registry, ["w_pause"])
+    time.sleep(0.01)
+    assert dispatcher.recover_stranded_jobs(hb_dir, floor, img_queue, vid_queue) == 2, (
+        "[FAIL] OFFLINE or missing worker recovered before the silence window"
+    )
+    # Past the dead-worker window the OFFLINE and missing workers are recovered too
+    later = time.time() + 200
+    dispatcher_module.time = SimClock(later)
+    try:
+        for worker_id in ("w_idle", "w_busy"):
+            write_heartbeat(
+                hb_dir, worker_id, workers[worker_id], f"{worker_id}.txt", timestamp=int(later)
+            )
+        registry.refresh(force=True)
+        assert dispatcher.recover_stranded_jobs(hb_dir, floor, img_queue, vid_queue) == 3, (
+            "[FAIL] Wrong number of stranded jobs recovered"
+        )
+    finally:
+        dispatcher_module.time = time
+    recovered = sorted(os.listdir(img_queue))
+    assert recovered == ["w_gone.txt", "w_off.txt", "w_pause.txt", "w_start.txt"], (
+        f"[FAIL] Recovered {recovered}"
+    )
+    with open(os.path.join(queued_clip, "progress.json"), "r", encoding="utf-8") as f:
+        progress = json.load(f)
+    assert progress["completed_files"] == ["f0.png", "f1.png"], "[FAIL] Progress not merged"
+    assert progress["requeued_from"] == "w_off", "[FAIL] Requeue not recorded"
+    print("[PASS] Stranded recovery: OFFLINE/STARTING/PAUSED/missing in one pass, progress kept")
+
+
+def validate_leases(root):
+    root = os.path.join(root, "leases")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    manifests = os.path.join(root, "01_job_factory", "manifests")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    lease_dir = os.path.join(root, "_system", "leases")
+    floor = os.path.join(root, "02_active_floor")
+    for path in (queue, manifests, hb_dir):
+        os.makedirs(path, exist_ok=True)
+    write_settings(root, {"weights": {"default": 1}, "job_leases": True, "lease_seconds": 60})
+    with open(os.path.join(manifests, "fast_job.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"lease_seconds": 90}, f)
+    with open(os.path.join(manifests, "tiny_job.txt.json"), "w", encoding="utf-8") as f:
+        json.dump({"lease_seconds": 5}, f)
+    make_txt_job(queue, "fast_job.txt", 1)
+    make_txt_job(queue, "slow_job.txt", 1)
+    write_heartbeat(hb_dir, "w1", "IDLE")
+    write_heartbeat(hb_dir, "w2", "IDLE")
+    dispatcher = make_dispatcher(root, worker_id="lead", initial_role="img_lead")
+    assert dispatcher.dispatch_smart() == 2, "[FAIL] Jobs not dispatched"
+
+    leases = {}
+    for name in sorted(os.listdir(lease_dir)):
+        with open(os.path.join(lease_dir, name), "r", encoding="utf-8") as f:
+            lease = json.load(f)
+        leases[lease["job"]] = lease
+        assert os.path.exists(os.path.join(floor, lease["worker_id"], "inbox", lease["job"])), (
+            "[FAIL] Lease does not match job placement"
+        )
+    assert leases["fast_job.txt"]["ttl"] == 90 and leases["slow_job.txt"]["ttl"] == 60, (
+        "[FAIL] Per-job lease length ignored"
+    )
+    assert dispatcher._lease_seconds("tiny_job.txt") == 60, "[FAIL] Lease below the floor"
+
+    renewing = leases["fast_job.txt"]
+    write_heartbeat(
+        hb_dir,
+        renewing["worker_id"],
+        "BUSY",
+        "fast_job.txt",
+        leases={"fast_job.txt": renewing["lease_id"]},
+    )
+    for lease in leases.values():
+        lease["expires_at"] = int(time.time()) - 1
+        with open(os.path.join(lease_dir, f"{lease['job']}.json"), "w", encoding="utf-8") as f:
+            json.dump(lease, f)
+    dispatcher.get_heartbeat_registry(force=True)
+    assert dispatcher.reclaim_expired_leases("img_queue") == 1, "[FAIL] Expired lease kept"
+    assert os.listdir(queue) == ["slow_job.txt"], f"[FAIL] Reclaimed {os.listdir(queue)}"
+    assert os.listdir(lease_dir) == ["fast_job.txt.json"], "[FAIL] Reclaimed lease not dropped"
+
+    os.remove(os.path.join(floor, renewing["worker_id"], "inbox", "fast_job.txt"))
+    dispatcher.reclaim_expired_leases("img_queue")
+    assert not os.listdir(lease_dir), "[FAIL] Finished job kept its lease"
+
+    write_settings(
+        root,
+        {"weights": {"default": 1}, "job_leases": True, "lease_grace_seconds": 0},
+    )
+    write_heartbeat(hb_dir, "w1", "IDLE")
+    # A lease write failure is logged and retried, not fatal to the dispatcher loop
+    os.rmdir(lease_dir)
+    open(lease_dir, "w").close()
+    make_txt_job(os.path.join(floor, "w1", "inbox"), "blocked_job.txt", 1)
+    dispatcher.get_heartbeat_registry(force=True)
+    dispatcher.reclaim_expired_leases("img_queue")
+    os.remove(lease_dir)
+    os.makedirs(lease_dir)
+    write_heartbeat(hb_dir, "w3", "BUSY", "stale_job.txt", timestamp=int(time.time()) - 600)
+    for worker_id, name in (("w1", "legacy_job.txt"), ("w3", "stale_job.txt")):
+        os.makedirs(os.path.join(floor, worker_id, "inbox"), exist_ok=True)
+        make_txt_job(os.path.join(floor, worker_id, "inbox"), name, 1)
+    dispatcher.get_heartbeat_registry(force=True)
+    assert dispatcher.reclaim_expired_leases("img_queue") == 1, "[FAIL] Unleased job kept"
+    with open(os.path.join(lease_dir, "legacy_job.txt.json"), "r", encoding="utf-8") as f:
+        assert json.load(f)["worker_id"] == "w1", "[FAIL] Unleased job not leased"
+    assert os.path.exists(os.path.join(lease_dir, "blocked_job.txt.json")), (
+        "[FAIL] Failed lease write not retried"
+    )
+    assert "stale_job.txt" in os.listdir(queue), "[FAIL] Dead worker's unleased job stuck"
+    print(
+        "[PASS] Leases: renewed lease kept, expired lease reclaimed, finished lease released, "
+        "unleased inbox jobs settled"
+    )
+
+
+def validate_pull_mode(root):
+    root = os.path.join(root, "pull")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    reference = os.path.join(root, "reference", "img_queue")
+    claims = os.path.join(root, "_system", "claims")
+    for path in (queue, reference):
+        os.makedirs(path, exist_ok=True)
+    write_settings(
+        root,
+        {
+            "weights": {"alpha": 3, "beta": 1, "default": 1},
+            "pull_mode": True,
+            "lead_sharding": "workers",
+        },
+    )
+    for i in range(6):
+        for bucket in ("alpha", "beta"):
+            make_txt_job(queue, f"{bucket}_{i}.txt", 1)
+            make_txt_job(reference, f"{bucket}_{i}.txt", 1)
+    expected = drain(make_dispatcher(root), reference, 8)
+
+    workers = {
+        w: make_dispatcher(root, persist_scheduler_state=True, worker_id=w)
+        for w in ("w1", "w2")
+    }
+    scans = []
+    for d in workers.values():
+        index = d.get_queue_index(queue)
+        index.reconcile = lambda full=index.reconcile: scans.append(1) or full()
+    claimed = []
+    for i in range(8):
+        worker_id = "w1" if i % 2 == 0 else "w2"
+        path = workers[worker_id].claim_next_job(queue, worker_id)
+        claimed.append(os.path.basename(path))
+    assert claimed == expected, f"[FAIL] Shared DRR order {claimed} != {expected}"
+    assert len(scans) <= len(workers), f"[FAIL] {len(scans)} full rescans for 8 claims"
+
+    racer = workers["w1"]
+    pick = racer.get_next_job
+    stolen = []
+
+    def racing_pick(*args, **kwargs):
+        path = pick(*args, **kwargs)
+        if path and not stolen:
+            stolen.append(os.path.basename(path))
+            os.rename(path, os.path.join(root, "02_active_floor", "w2", "inbox", stolen[0]))
+        return path
+
+    racer.get_next_job = racing_pick
+    won = racer.claim_next_job(queue, "w1")
+    assert won and os.path.basename(won) != stolen[0], "[FAIL] Lost race not retried"
+    assert racer.claim_winner(os.path.basename(won)) == "w1", "[FAIL] Claim not recorded"
+
+    job_name = os.path.basename(won)
+    conflict = f"{job_name}.sync-conflict-20260101-000000-ABCDEF.json"
+    with open(os.path.join(claims, conflict), "w", encoding="utf-8") as f:
+        json.dump({"worker_id": "w2", "claimed_at": 1.0}, f)
+    assert racer.claim_winner(job_name) == "w2", "[FAIL] Earliest claim must win"
+
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    os.makedirs(hb_dir, exist_ok=True)
+    with open(os.path.join(root, "_system", "worker_health.json"), "w", encoding="utf-8") as f:
+        json.dump({"workers": {"w1": {"state": "quarantined", "score": 0.1}}}, f)
+    write_heartbeat(hb_dir, "w2", "IDLE", resources={"disk_free_mb": 10})
+    workers["w2"].get_heartbeat_registry(force=True)
+    assert workers["w1"].claim_next_job(queue, "w1") is None, "[FAIL] Quarantined worker claimed"
+    assert workers["w2"].claim_next_job(queue, "w2") is None, "[FAIL] Low-disk worker claimed"
+    os.remove(os.path.join(root, "_system", "worker_health.json"))
+    write_heartbeat(hb_dir, "w2", "IDLE")
+    workers["w2"].get_heartbeat_registry(force=True)
+
+    # Both claim from the same snapshot; neither may lose the other's charge.
+    for name in os.listdir(queue):
+        os.remove(os.path.join(queue, name))
+    for i in range(2):
+        make_txt_job(queue, f"alpha_late_{i}.txt", 1)
+    state_key = os.path.abspath(queue)
+    base = make_dispatcher(root, persist_scheduler_state=True, worker_id="reader")
+    base._restore_scheduler_state(state_key)
+    for worker_id in ("w1", "w2"):
+        workers[worker_id].reload_shared_state(queue)
+        workers[worker_id]._restore_scheduler_state(state_key)
+    workers["w2"].reload_shared_state = lambda _queue: None
+    assert workers["w1"].claim_next_job(queue, "w1"), "[FAIL] Concurrent claim w1"
+    assert workers["w2"].claim_next_job(queue, "w2"), "[FAIL] Concurrent claim w2"
+    merged = make_dispatcher(root, persist_scheduler_state=True, worker_id="reader")
+    merged._restore_scheduler_state(state_key)
+    before = base.deficits.get(state_key, {})
+    for bucket in ("alpha", "beta", "default"):
+        charged = sum(
+            workers[w].deficits[state_key].get(bucket, 0) - before.get(bucket, 0)
+            for w in ("w1", "w2")
+        )
+        assert merged.deficits[state_key].get(bucket, 0) == before.get(bucket, 0) + charged, (
+            f"[FAIL] Concurrent charges lost for {bucket}"
+        )
+    state_files = sorted(os.listdir(os.path.join(root, "_system", "scheduler_state")))
+    assert state_files == [
+        "img_queue@w1.json",
+        "img_queue@w2.json",
+        "runtime@w1.json",
+        "runtime@w2.json",
+    ], f"[FAIL] Shared state files {state_files}"
+    print(
+        f"[PASS] Pull mode: shared DRR order {claimed[:4]}..., lost races retried and resolved, "
+        "concurrent charges merged"
+    )
+
+
+def validate_sharded_leads(root):
+    root = os.path.join(root, "shards")
+    queue = os.path.join(root, "01_job_factory", "img_queue")
+    hb_dir = os.path.join(root, "_system", "heartbeats")
+    for path in (queue, hb_dir):
+        os.makedirs(path, exist_ok=True)
+    write_settings(
+        root,
+        {
+            "weights": {"alpha": 3, "beta": 1, "default": 1},
+            "lead_sharding": "workers",
+            "shard_drift_window": 30,
+        },
+    )
+    workers = [f"w{i:02d}" for i in range(24)]
+    for worker_id in workers:
+        write_heartbeat(hb_dir, worker_id, "IDLE")
+    for lead in ("L1", "L2"):
+        write_heartbeat(hb_dir, lead, "BUSY", role="img_lead")
+    for i in range(40):
+        make_txt_job(queue, f"alpha_{i:02d}.txt", 1)
+        make_txt_job(queue, f"beta_{i:02d}.txt", 1)
+    leads = {
+        lead: make_dispatcher(root, worker_id=lead, initial_role="img_lead")
+        for lead in ("L1", "L2")
+    }
+    owners = {
+        w: [lead for lead, d in leads.items() if d.owns_worker(w, "img_queue")] for w in workers
+    }
+    assert all(len(o) == 1 for o in owners.values()), "[FAIL] Workers not partitioned"
+    shares = {lead: sum(1 for o in owners.values() if o == [lead]) for lead in leads}
+    assert min(shares.values()) >= 6, f"[FAIL] Unbalanced shards {shares}"
+
+    # Both buckets are seen backlogged one window before the measured dispatch
+    for worker_id in workers:
+        write_heartbeat(hb_dir, worker_id, "BUSY")
+    dispatcher_module.time = SimClock(time.time() - 30)
+    try:
+        assert sum(d.dispatch_smart() for d in leads.values()) == 0, "[FAIL] Busy fleet dispatched"
+    finally:
+        dispatcher_module.time = time
+    assert leads["L1"].shard_drift("img_queue") is None, "[FAIL] Drift reported without service"
+    for worker_id in workers:
+        write_heartbeat(hb_dir, worker_id, "IDLE")
+    assigned = sum(d.dispatch_smart() for d in leads.values())
+    assert assigned == len(workers), f"[FAIL] Sharded dispatch assigned {assigned}"
+    drift = leads["L1"].shard_drift("img_queue")
+    assert drift is not None and drift <= 0.1, f"[FAIL] Weight ratio drift {drift}"
+
+    write_heartbeat(hb_dir, "L3", "BUSY", role="img_lead")
+    for d in leads.values():
+        d.get_heartbeat_registry(force=True)
+    moved = [w for w in workers if not leads[owners[w][0]].owns_worker(w, "img_queue")]
+    assert moved and len(moved) < len(workers) // 2, f"[FAIL] Join moved {len(moved)} workers"
+    write_heartbeat(hb_dir, "L2", "OFFLINE", role="img_lead")
+    write_heartbeat(hb_dir, "L3", "OFFLINE", role="img_lead")
+    leads["L1"].get_heartbeat_registry(force=True)
+    assert all(leads["L1"].owns_worker(w, "img_queue") for w in workers), (
+        "[FAIL] Remaining lead did not take over"
+    )
+    print(
+        f"[PASS] Sharded leads: shares {shares}, ratio drift {drift:.3f}, "
+        f"{len(moved)} moved on join"
+    )
+
+
+def main():
+    root = tempfile.mkdtemp(prefix="rf_sched_")
+    try:
+        validate_cost_mode(root)
+        validate_vruntime_mode(root)
+        validate_aging(root)
+        validate_deadlines(root)
+        validate_priority_classes(root)
+        validate_manifest_reprioritize(root)
+        validate_hierarchy(root)
+        validate_concurrency_caps(root)
+        validate_vip_reserve(root)
+        validate_preemption_victims(root)
+        validate_prefetch(root)
+        validate_placement(root)
+        validate_worker_health(root)
+        validate_resource_admission(root)
+        validate_failure_detector(root)
+        validate_stranded_recovery(root)
+        validate_leases(root)
+        validate_pull_mode(root)
+        validate_sharded_leads(root)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+
+root = tempfile.mkdtemp(prefix="rf_yield_")
+os.environ["HOME"] = root
+
+# Import main from a scratch copy so load_config writes local_config.json there
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+code_dir = os.path.join(root, "code")
+os.makedirs(code_dir)
+for name in ("main.py", "config.json"):
+    shutil.copy(os.path.join(repo, name), code_dir)
+spec = importlib.util.spec_from_file_location("main", os.path.join(code_dir, "main.py"))
+main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(main)
+
+
+def write_output(landing, name, size, age):
+    path = os.path.join(landing, name)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def salvage(runner, landing, target, job_name, is_image, output_ext, num_outputs):
+    snapshot = runner._snapshot_outputs(landing)
+    return runner._salvage_yielded(
+        landing, snapshot, time.time(), target, job_name, is_image, output_ext, num_outputs
+    )
+
+
+def main_validation():
+    landing = os.path.join(root, "landing")
+    target = os.path.join(root, "review")
+    os.makedirs(landing, exist_ok=True)
+    runner = main.ActionaRunner({"output_settle_seconds": 5}, main.get_sys_path)
+
+    # Validation A: a clip still being written is discarded, the prompt stays open
+    write_output(landing, "clip_a.mp4", 2048, 60)
+    write_output(landing, "clip_b.mp4", 512, 0)
+    result = salvage(runner, landing, target, "img_vid", False, ".mp4", 2)
+    assert result == "yielded", f"[FAIL] Truncated clip counted as complete: {result}"
+    left = os.listdir(landing)
+    assert left == ["clip_a.mp4"], f"[FAIL] Expected only the finished clip to remain {left}"
+    assert not os.path.exists(target), "[FAIL] Incomplete set moved to review"
+    print("[PASS] Validation A: truncated clip discarded, prompt not completed")
+
+    # Validation B: an incomplete image set is not recorded as done
+    os.remove(os.path.join(landing, "clip_a.mp4"))
+    for i in range(3):
+        write_output(landing, f"img_{i}.png", 1024, 60)
+    result = salvage(runner, landing, target, "job_p1", True, ".png", 4)
+    assert result == "yielded", f"[FAIL] Partial image set counted as complete: {result}"
+    print("[PASS] Validation B: 3/4 images left the prompt open")
+
+    # Validation C: a full set of settled outputs is salvaged and completes the prompt
+    for i in range(4):
+        write_output(landing, f"img_{i}.png", 1024, 60)
+    result = salvage(runner, landing, target, "job_p2", True, ".png", 4)
+    assert result == "yielded_complete", f"[FAIL] Finished set not salvaged: {result}"
+    moved = sorted(os.listdir(target))
+    assert moved == [f"job_p2_take{i:03d}.png" for i in range(1, 5)], f"[FAIL] Moved {moved}"
+    print("[PASS] Validation C: finished set salvaged and completed")
+
+    # Validation D: a yield aimed at another job is dropped, a matching one is honoured
+    cmd_dir = main.get_sys_path(os.path.join("_system", "commands"))
+    os.makedirs(cmd_dir, exist_ok=True)
+    cmd_path = os.path.join(cmd_dir, "w1.cmd")
+    config = {"worker_id": "w1"}
+    for job, expected in (("old_job.txt", False), ("clip_set/img_01.png", True)):
+        with open(cmd_path, "w", encoding="utf-8") as f:
+            json.dump({"action": "yield", "job": job}, f)
+        result = main.check_yield_command(config, "clip_set")
+        assert result is expected, f"[FAIL] Yield for {job} returned {result}"
+        assert not os.path.exists(cmd_path), f"[FAIL] Yield for {job} left the command"
+    print("[PASS] Validation D: stale yield ignored, matching yield honoured")
+
+
+if __name__ == "__main__":
+    try:
+        main_validation()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)